@@ -0,0 +1,88 @@
+"""Check CLI startup time per command against a budget.
+
+Each command runs in a fresh interpreter under ``-X importtime``; the median
+wall time above a bare ``python -c pass`` is compared with its budget, and
+the slowest imports are listed so regressions are easy to trace.
+
+Usage: PYTHONPATH=src python scripts/bench_cli_startup.py [--runs 7] [--top 5]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+# Milliseconds of startup on top of the bare interpreter, per command.
+BUDGETS_MS = {
+    ("--help",): 60,
+    ("status",): 60,
+    ("stop", "--help"): 60,
+    ("init", "--help"): 60,
+    ("doctor", "--help"): 60,
+    ("fleet", "status", "--help"): 60,
+}
+# Modules the quick commands must not pull in.
+HEAVY = ("requests", "rich", "yaml")
+
+RUNNER = "import sys; from sshclaude.cli import cli; cli(sys.argv[1:])"
+
+
+def run(args: list[str]) -> tuple[float, str]:
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+    )
+    return time.perf_counter() - start, proc.stderr
+
+
+def imports(stderr: str) -> list[tuple[int, str]]:
+    """``(self microseconds, module)`` for every import in ``stderr``."""
+    found = []
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            self_us, _, name = line.removeprefix("import time:").split("|")
+            if self_us.strip().isdigit():
+                found.append((int(self_us), name.strip()))
+    return found
+
+
+def median_ms(args: list[str], runs: int) -> tuple[float, str]:
+    samples, stderr = [], ""
+    for _ in range(runs):
+        elapsed, stderr = run(args)
+        samples.append(elapsed)
+    return statistics.median(samples) * 1000, stderr
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    baseline, _ = median_ms(["-c", "pass"], args.runs)
+    print(f"bare interpreter: {baseline:6.1f} ms")
+    failed = False
+    for command, budget in BUDGETS_MS.items():
+        total, stderr = median_ms(["-c", RUNNER, *command], args.runs)
+        loaded = imports(stderr)
+        heavy = sorted({name.split(".")[0] for _, name in loaded} & set(HEAVY))
+        over = total - baseline
+        ok = over <= budget and not heavy
+        failed |= not ok
+        label = "sshclaude " + " ".join(command)
+        print(
+            f"{label:28s} +{over:6.1f} ms (budget {budget} ms) {'ok' if ok else 'FAIL'}"
+        )
+        if heavy:
+            print(f"    imports {', '.join(heavy)}")
+        for self_us, name in sorted(loaded, reverse=True)[: args.top]:
+            print(f"    {self_us / 1000:6.1f} ms  {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
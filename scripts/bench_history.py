@@ -0,0 +1,77 @@
+"""Compare the default and fast JSON paths of GET /history on 10k events.
+
+Usage: python scripts/bench_history.py [--events 10000] [--rounds 20]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix="sshclaude-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_dir}/bench.db"
+os.environ.setdefault("CLOUDFLARE_ACCOUNT_ID", "bench")
+os.environ.setdefault("CLOUDFLARE_ZONE_ID", "bench")
+os.environ.pop("API_TOKEN", None)
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from sshclaude import api, responses  # noqa: E402
+from sshclaude.db import LoginEvent, get_session  # noqa: E402
+
+SUBDOMAIN = "bench.sshclaude.dev"
+
+
+def seed(events: int) -> None:
+    start = datetime(2024, 1, 1)
+    rows = [
+        {
+            "subdomain": SUBDOMAIN,
+            "user": f"user{i % 50}@example.com",
+            "ip": f"10.0.{i % 256}.{i % 200}",
+            "timestamp": start + timedelta(seconds=i),
+        }
+        for i in range(events)
+    ]
+    with get_session() as db:
+        db.execute(insert(LoginEvent), rows)
+        db.commit()
+
+
+def measure(client: TestClient, fast: bool, rounds: int) -> tuple[float, bytes]:
+    responses.FAST_JSON = fast
+    body = client.get(f"/history/{SUBDOMAIN}").content  # warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        client.get(f"/history/{SUBDOMAIN}")
+    return (time.perf_counter() - start) / rounds, body
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=10_000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    seed(args.events)
+    client = TestClient(api.app)
+    default_s, default_body = measure(client, False, args.rounds)
+    fast_s, fast_body = measure(client, True, args.rounds)
+
+    import json
+
+    assert json.loads(default_body) == json.loads(
+        fast_body
+    ), "fast path changed the payload"
+    encoder = (
+        "orjson" if responses.orjson is not None else "json (orjson not installed)"
+    )
+    print(f"events={args.events} rounds={args.rounds} encoder={encoder}")
+    print(f"default path: {default_s * 1000:8.2f} ms/request")
+    print(f"fast path:    {fast_s * 1000:8.2f} ms/request ({default_s / fast_s:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
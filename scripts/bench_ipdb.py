@@ -0,0 +1,70 @@
+"""Measure IP enrichment lookups per second against a compiled range index.
+
+Usage: python scripts/bench_ipdb.py [--ranges 500000] [--lookups 200000]
+"""
+
+import argparse
+import ipaddress
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from sshclaude import geoip
+
+
+def build(ranges: int, path: Path) -> None:
+    """Compile ``ranges`` adjacent /24-ish IPv4 blocks with random labels."""
+    step = (2**32 - 2**24) // ranges
+    rows = []
+    for i in range(ranges):
+        start = 2**24 + i * step
+        rows.append(
+            (
+                str(ipaddress.IPv4Address(start)),
+                str(ipaddress.IPv4Address(start + step - 1)),
+                random.choice(["US", "DE", "JP", "BR", "IN", "AU"]),
+                f"AS{random.randrange(1, 400_000)}",
+            )
+        )
+    geoip.compile_ranges(rows, path)
+
+
+def measure(db: geoip.IPDatabase, ips: list[str]) -> float:
+    start = time.perf_counter()
+    for ip in ips:
+        db.lookup(ip)
+    return len(ips) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ranges", type=int, default=500_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument(
+        "--distinct", type=int, default=5_000, help="Distinct IPs in the cached run."
+    )
+    args = parser.parse_args()
+
+    path = Path(tempfile.mkdtemp(prefix="sshclaude-ipdb-")) / "ipdb.bin"
+    start = time.perf_counter()
+    build(args.ranges, path)
+    elapsed, size = time.perf_counter() - start, path.stat().st_size >> 20
+    print(f"compiled {args.ranges} ranges in {elapsed:.1f}s ({size} MiB)")
+
+    def random_ip() -> str:
+        return str(ipaddress.IPv4Address(random.randrange(2**24, 2**32)))
+
+    uncached = [random_ip() for _ in range(args.lookups)]
+    hot = [random_ip() for _ in range(args.distinct)]
+    cached = [random.choice(hot) for _ in range(args.lookups)]
+
+    db = geoip.IPDatabase(str(path), cache_size=0)
+    print(f"uncached (binary search): {measure(db, uncached):12,.0f} lookups/s")
+    db = geoip.IPDatabase(str(path))
+    rate = measure(db, cached)
+    print(f"cached ({args.distinct} distinct IPs):  {rate:12,.0f} lookups/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Compare connect-to-prompt latency of the nvm and precompiled launchers.
+
+Each guard runs on a fresh pseudo-terminal the way ttyd starts it. The
+benchmark times how long the token prompt takes to appear, then types the
+token and times how long claude takes to print its first output. Claude is
+run with ``--version`` by default so the numbers cover the launcher rather
+than claude's UI.
+
+Usage: python scripts/bench_launcher.py [--runs 10] [--claude-args=--version]
+"""
+
+import argparse
+import os
+import select
+import shlex
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sshclaude import launcher, pool
+
+# token_guard.sh as generated before the runtime was resolved at init.
+LEGACY_GUARD = """#!/bin/bash
+export NVM_DIR="$HOME/.nvm"
+[ -s "$NVM_DIR/nvm.sh" ] && \\. "$NVM_DIR/nvm.sh"
+nvm use node > /dev/null
+EXPECTED=$(cat "{token_file}")
+read -p "Token: " INPUT
+if [ "$INPUT" != "$EXPECTED" ]; then
+  echo "Unauthorized"
+  exit 1
+fi
+exec claude "$@"
+"""
+
+
+def _read_until(
+    fd: int, marker: bytes, data: bytes = b"", timeout: float = 30.0
+) -> bytes:
+    """Read until ``marker`` appears; return what follows it."""
+    deadline = time.monotonic() + timeout
+    while marker not in data:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"no {marker!r} after {data[-200:]!r}")
+        if select.select([fd], [], [], 0.01)[0]:
+            try:
+                data += os.read(fd, 4096)
+            except OSError:  # EIO: the guard exited
+                raise RuntimeError(f"guard exited: {data[-200:]!r}") from None
+    return data.split(marker, 1)[1]
+
+
+def measure(guard: Path, claude_args: list[str]) -> tuple[float, float]:
+    """Seconds to the token prompt and from the token to claude's output."""
+    start = time.perf_counter()
+    session = pool.spawn(["/bin/bash", str(guard), *claude_args])
+    try:
+        _read_until(session.fd, b"Token: ")
+        prompt = time.perf_counter()
+        os.write(session.fd, b"secret\r")
+        rest = _read_until(session.fd, b"secret\r\n", timeout=60)  # the echo
+        _read_until(session.fd, b"\n", rest, timeout=60)
+        return prompt - start, time.perf_counter() - prompt
+    finally:
+        os.close(session.fd)
+        os.waitpid(session.pid, 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--claude-args", default="--version")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        token_file = tmp_dir / "session_token"
+        token_file.write_text("secret")
+        legacy = tmp_dir / "legacy_guard.sh"
+        legacy.write_text(LEGACY_GUARD.format(token_file=token_file))
+        resolved = tmp_dir / "token_guard.sh"
+        runtime = launcher.write_guard(
+            token_file, guard=resolved, runtime_file=tmp_dir / "runtime.json"
+        )
+        if not runtime["claude"]:
+            sys.exit("claude not found; install it first")
+        print(f"claude: {runtime['claude']}\nnode:   {runtime['node']}")
+
+        claude_args = shlex.split(args.claude_args)
+        for name, guard in (("nvm (legacy)", legacy), ("resolved", resolved)):
+            measure(guard, claude_args)  # warm the page cache
+            samples = [measure(guard, claude_args) for _ in range(args.runs)]
+            prompt = statistics.median(s[0] for s in samples) * 1000
+            claude = statistics.median(s[1] for s in samples) * 1000
+            print(
+                f"{name:14s} prompt {prompt:7.1f} ms  token->claude {claude:7.1f} ms"
+                f"  total {prompt + claude:7.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,57 @@
 from __future__ import annotations
 
 from dotenv import load_dotenv
+
 load_dotenv()
 
+import asyncio
+import base64
+import json
 import os
 import secrets
-import uuid
-import requests
+import threading
 import traceback
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
 
-from fastapi import Depends, FastAPI, Header, HTTPException, Query
+import requests
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, StreamingResponse
 from pydantic import BaseModel
-from fastapi.responses import RedirectResponse
-import base64
-import json
 
-from . import cloudflare
-from .db import LoginEvent, LoginSession, Provision, get_session, init_db
+from . import (
+    cloudflare,
+    geoip,
+    github,
+    profiling,
+    ratelimit,
+    responses,
+    rotation,
+    server,
+)
+from .breaker import CircuitOpenError
+from .db import (
+    LoginEvent,
+    LoginSession,
+    Provision,
+    bump_version,
+    get_session,
+    get_version,
+    init_db,
+    upsert_provision,
+)
+from .sessions import notifier as login_notifier
+from .sessions import store as session_store
 
 API_TOKEN = os.getenv("API_TOKEN")
+READ_LIMIT = Depends(ratelimit.limit("read"))
+LOGIN_LIMIT = Depends(ratelimit.limit("login"))
+PROVISION_LIMIT = Depends(ratelimit.limit("provision"))
+PROVISION_ADMISSION = Depends(ratelimit.admit_provision)
+LOGIN_EVENTS_TIMEOUT = float(os.getenv("LOGIN_EVENTS_TIMEOUT", "120"))
+LOGIN_EVENTS_KEEPALIVE = 15.0
 
 def verify_token(authorization: str = Header("")) -> None:
     if API_TOKEN and authorization != f"Bearer {API_TOKEN}":
@@ -29,6 +62,7 @@ class ProvisionRequest(BaseModel):
     github_id: str
     email: str
     subdomain: str
+    team: Optional[str] = None  # GitHub "org/team" sharing one Access policy
 
 class ProvisionResponse(BaseModel):
     tunnel_id: str
@@ -53,11 +87,90 @@ class TokenRequest(BaseModel):
 class DeleteRequest(BaseModel):
     tunnel_token: str
 
-app = FastAPI(title="sshclaude Provisioning API")
+
+class RotateBatchRequest(BaseModel):
+    subdomains: Optional[list[str]] = None
+    github_id: Optional[str] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with server.lifespan(app):
+        threading.Thread(
+            target=rotation.resume_pending, name="rotation-resume", daemon=True
+        ).start()
+        yield
+
+
+app = FastAPI(
+    title="sshclaude Provisioning API",
+    lifespan=lifespan,
+    default_response_class=responses.default_response_class(),
+)
+profiling.install(app)
 init_db()
 
 
-@app.post("/login", response_model=LoginSessionResponse)
+def _unavailable(e: CircuitOpenError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"Cloudflare unavailable: {e}",
+        headers={"Retry-After": str(max(1, int(e.retry_after)))},
+    )
+
+
+@app.get("/health")
+def health() -> dict:
+    breakers = cloudflare.health()
+    degraded = any(b["state"] != "closed" for b in breakers.values())
+    return {"status": "degraded" if degraded else "ok", "cloudflare": breakers}
+
+
+def _load_session(uid: str) -> dict | None:
+    """Return a login session from the session store, falling back to SQL.
+
+    Only sessions verified through GitHub are persisted, so the SQL lookup
+    covers verified logins that have since expired from the store.
+    """
+    session = session_store.get(uid)
+    if session is not None:
+        return session
+    with get_session(read_only=True, key=uid) as db:
+        row = db.query(LoginSession).filter_by(id=uid).first()
+        if not row:
+            return None
+        return {
+            "token": row.token,
+            "verified": bool(row.verified),
+            "email": row.email,
+            "github_id": row.github_id,
+            "github_login": row.github_login,
+        }
+
+
+def _subscribe_and_load(uid: str) -> dict | None:
+    # Subscribe first so a verification published after the read wakes us.
+    session_store.listen()
+    return _load_session(uid)
+
+
+async def _wait_verified(uid: str, timeout: float) -> dict | None:
+    """Load a session, waiting up to ``timeout`` seconds for it to be verified."""
+    waiter = login_notifier.register(uid)
+    try:
+        session = await run_in_threadpool(_subscribe_and_load, uid)
+        if not session or session["verified"] or timeout <= 0:
+            return session
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return session
+    finally:
+        login_notifier.discard(uid, waiter)
+    return await run_in_threadpool(_load_session, uid)
+
+
+@app.post("/login", response_model=LoginSessionResponse, dependencies=[LOGIN_LIMIT])
 def create_login() -> LoginSessionResponse:
     uid = uuid.uuid4().hex
     token = secrets.token_urlsafe(8)
@@ -66,9 +179,7 @@ def create_login() -> LoginSessionResponse:
     if not client_id:
         raise HTTPException(status_code=500, detail="Missing GITHUB_CLIENT_ID in environment")
 
-    with get_session() as db:
-        db.add(LoginSession(id=uid, token=token))
-        db.commit()
+    session_store.put(uid, {"token": token, "verified": False})
 
     return LoginSessionResponse(
         url=f"/login/{uid}",
@@ -77,52 +188,85 @@ def create_login() -> LoginSessionResponse:
     )
 
 
-@app.post("/login/{uid}")
+@app.post("/login/{uid}", dependencies=[READ_LIMIT])
 def verify_login(uid: str, req: TokenRequest) -> dict[str, str]:
-    with get_session() as db:
-        session = db.query(LoginSession).filter_by(id=uid).first()
-        if not session or session.token != req.token:
-            raise HTTPException(status_code=400, detail="invalid token")
-        session.verified = True
-        db.commit()
+    session = session_store.get(uid)
+    if not session or session["token"] != req.token:
+        raise HTTPException(status_code=400, detail="invalid token")
+    session_store.update(uid, verified=True)
+    session_store.publish(uid)
     return {"status": "verified"}
 
 
-@app.get("/login/{uid}")
+@app.get("/login/{uid}", dependencies=[READ_LIMIT])
 def verify_login_redirect(uid: str, token: str = Query(...)) -> dict[str, str]:
-    with get_session() as db:
-        session = db.query(LoginSession).filter_by(id=uid).first()
-        if not session or session.token != token:
-            raise HTTPException(status_code=400, detail="invalid token")
-        session.verified = True
-        db.commit()
+    session = session_store.get(uid)
+    if not session or session["token"] != token:
+        raise HTTPException(status_code=400, detail="invalid token")
+    session_store.update(uid, verified=True)
+    session_store.publish(uid)
     return {"status": "verified"}
 
 
-@app.get("/login/{uid}/status")
-def login_status(uid: str) -> dict[str, bool]:
-    with get_session() as db:
-        session = db.query(LoginSession).filter_by(id=uid).first()
-        if not session:
-            raise HTTPException(status_code=404, detail="unknown uid")
-        return {"verified": session.verified}
+@app.get("/login/{uid}/status", dependencies=[READ_LIMIT])
+async def login_status(
+    uid: str, wait: float = Query(0, ge=0, le=60)
+) -> dict[str, bool]:
+    """Report verification state; with ``wait`` > 0, long-poll until verified."""
+    session = await _wait_verified(uid, wait)
+    if not session:
+        raise HTTPException(status_code=404, detail="unknown uid")
+    return {"verified": session["verified"]}
+
+
+@app.get("/login/{uid}/events", dependencies=[READ_LIMIT])
+async def login_events(uid: str) -> StreamingResponse:
+    """Server-Sent Events stream that ends once the session is verified."""
+    session = await run_in_threadpool(_load_session, uid)
+    if not session:
+        raise HTTPException(status_code=404, detail="unknown uid")
+
+    async def stream():
+        status = json.dumps({"verified": session["verified"]})
+        yield f"event: status\ndata: {status}\n\n"
+        if session["verified"]:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + LOGIN_EVENTS_TIMEOUT
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            current = await _wait_verified(uid, min(LOGIN_EVENTS_KEEPALIVE, remaining))
+            if not current:
+                yield "event: expired\ndata: {}\n\n"
+                return
+            if current["verified"]:
+                yield 'event: status\ndata: {"verified": true}\n\n'
+                return
+            yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
-@app.get("/login/{uid}/whoami")
+@app.get("/login/{uid}/whoami", dependencies=[READ_LIMIT])
 def whoami(uid: str, authorization: str = Header("")) -> dict:
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="missing bearer token")
     token = authorization.removeprefix("Bearer ").strip()
-    with get_session() as db:
-        session = db.query(LoginSession).filter_by(id=uid).first()
-        if not session or session.token != token or not session.verified:
-            raise HTTPException(status_code=401, detail="unauthorized")
-        if not session.email:
-            raise HTTPException(status_code=400, detail="email not set")
-        return {"email": session.email}
+    session = _load_session(uid)
+    if not session or session["token"] != token or not session["verified"]:
+        raise HTTPException(status_code=401, detail="unauthorized")
+    if not session.get("email"):
+        raise HTTPException(status_code=400, detail="email not set")
+    return {"email": session["email"]}
 
 
-@app.get("/oauth/callback")
+@app.get("/oauth/callback", dependencies=[LOGIN_LIMIT])
 def github_callback(code: str, state: str = Query(...)):
     """Handles GitHub OAuth redirect and updates the login session with verified identity."""
     client_id = os.getenv("GITHUB_CLIENT_ID")
@@ -141,65 +285,58 @@ def github_callback(code: str, state: str = Query(...)):
 
     # Exchange code for access token
     try:
-        token_resp = requests.post(
-            "https://github.com/login/oauth/access_token",
-            headers={"Accept": "application/json"},
-            data={
-                "client_id": client_id,
-                "client_secret": client_secret,
-                "code": code
-            },
-            timeout=10
-        )
-        token_resp.raise_for_status()
-        access_token = token_resp.json().get("access_token")
-        if not access_token:
-            raise HTTPException(status_code=400, detail="No access token returned from GitHub")
+        access_token = github.exchange_code(client_id, client_secret, code)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Token exchange failed: {e}")
 
     # Fetch GitHub user info
-    user_resp = requests.get(
-        "https://api.github.com/user",
-        headers={"Authorization": f"Bearer {access_token}"},
-        timeout=10
-    )
-    emails_resp = requests.get(
-        "https://api.github.com/user/emails",
-        headers={"Authorization": f"Bearer {access_token}"},
-        timeout=10
-    )
-
-    if not user_resp.ok or not emails_resp.ok:
-        raise HTTPException(status_code=502, detail="Failed to fetch GitHub user profile")
-
-    github_login = user_resp.json().get("login")
-    github_id = user_resp.json().get("id")
-    email_data = emails_resp.json()
+    try:
+        user = github.fetch_identity(access_token)
+    except (github.GitHubError, requests.RequestException) as e:
+        raise HTTPException(
+            status_code=502, detail=f"Failed to fetch GitHub user profile: {e}"
+        )
 
-    # Extract primary, verified email
-    primary_email = next((e["email"] for e in email_data if e.get("primary") and e.get("verified")), None)
+    github_login = user.login
+    primary_email = user.email
     if not primary_email:
         raise HTTPException(status_code=400, detail="No verified email found")
 
     # Store session
-    with get_session() as db:
-        session = db.query(LoginSession).filter_by(id=uid).first()
-        if not session or session.token != token:
-            raise HTTPException(status_code=400, detail="Invalid session or token")
-        session.verified = True
-        session.email = primary_email
-        session.github_id = str(github_id)
-        session.github_login = github_login
+    session = session_store.get(uid)
+    if not session or session["token"] != token:
+        raise HTTPException(status_code=400, detail="Invalid session or token")
+    identity = {
+        "verified": True,
+        "email": primary_email,
+        "github_id": user.id,
+        "github_login": github_login,
+    }
+    session_store.update(uid, **identity)
+
+    # Persist the verified identity so whoami survives store expiry
+    with get_session(key=uid) as db:
+        db.merge(LoginSession(id=uid, token=token, **identity))
         db.commit()
+    session_store.publish(uid)
 
     print(f"[DEBUG] Verified: {github_login} <{primary_email}>")
     return RedirectResponse("https://sshclaude.dev/success")
 
 
-
-@app.post("/provision", response_model=ProvisionResponse, dependencies=[Depends(verify_token)])
+@app.post(
+    "/provision",
+    response_model=ProvisionResponse,
+    dependencies=[PROVISION_LIMIT, Depends(verify_token), PROVISION_ADMISSION],
+)
 def provision(req: ProvisionRequest) -> ProvisionResponse:
+    with server.provisions_inflight:
+        return _provision(req)
+
+
+def _provision(req: ProvisionRequest) -> ProvisionResponse:
+    if req.team and not cloudflare.GITHUB_IDP_ID:
+        raise HTTPException(status_code=400, detail="Team policies are not configured")
     try:
         print("[DEBUG] Starting provision for", req.subdomain)
         print("[DEBUG] Request body:", req.dict())
@@ -224,10 +361,13 @@ def provision(req: ProvisionRequest) -> ProvisionResponse:
         dns_id = dns["result"]["id"]
         print("[DEBUG] DNS record ID:", dns_id)
 
-        access = cloudflare.create_access_app(req.email, req.subdomain)
+        access = cloudflare.create_access_app(req.email, req.subdomain, team=req.team)
         access_id = access["result"]["id"]
         print("[DEBUG] Access App ID:", access_id)
 
+    except CircuitOpenError as e:
+        print("[ERROR] Cloudflare circuit open:", e)
+        raise _unavailable(e)
     except requests.RequestException as re:
         print("[ERROR] Cloudflare API error:", re)
         raise HTTPException(status_code=502, detail=f"Cloudflare API error: {str(re)}")
@@ -243,37 +383,60 @@ def provision(req: ProvisionRequest) -> ProvisionResponse:
         "access_app_id": access_id,
     }
 
-    with get_session() as db:
-        existing = db.query(Provision).filter_by(subdomain=req.subdomain).first()
-        if existing:
-            for k, v in data.items():
-                setattr(existing, k, v)
-        else:
-            provision = Provision(github_id=req.github_id, subdomain=req.subdomain, **data)
-            db.add(provision)
+    with get_session(key=req.subdomain) as db:
+        upsert_provision(db, github_id=req.github_id, subdomain=req.subdomain, **data)
+        bump_version(db, req.subdomain)
         db.commit()
 
     print("[DEBUG] Provision record saved:", data)
     return ProvisionResponse(**data)
 
 
-@app.get("/provision/{subdomain}", response_model=ProvisionResponse, dependencies=[Depends(verify_token)])
-def get_provision(subdomain: str) -> ProvisionResponse:
-    with get_session() as db:
-        provision = db.query(Provision).filter_by(subdomain=subdomain).first()
-        if not provision:
-            raise HTTPException(status_code=404, detail="unknown subdomain")
-        return ProvisionResponse(
-            tunnel_id=provision.tunnel_id,
-            tunnel_token=provision.tunnel_token,
-            dns_record_id=provision.dns_record_id,
-            access_app_id=provision.access_app_id,
+def _cache_validators(db, subdomain: str, kind: str) -> dict[str, str]:
+    version = get_version(db, subdomain)
+    if version is None:
+        return {}
+    return responses.validators(kind, version.version, version.updated_at)
+
+
+@app.get(
+    "/provision/{subdomain}",
+    response_model=ProvisionResponse,
+    dependencies=[READ_LIMIT, Depends(verify_token)],
+)
+def get_provision(
+    subdomain: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+) -> ProvisionResponse:
+    with get_session(read_only=True, key=subdomain) as db:
+        headers = _cache_validators(db, subdomain, "provision")
+        if responses.not_modified(headers, if_none_match, if_modified_since):
+            return Response(status_code=304, headers=headers)
+        row = (
+            db.query(
+                Provision.tunnel_id,
+                Provision.tunnel_token,
+                Provision.dns_record_id,
+                Provision.access_app_id,
+            )
+            .filter(Provision.subdomain == subdomain)
+            .first()
         )
+    if not row:
+        raise HTTPException(status_code=404, detail="unknown subdomain")
+    if responses.FAST_JSON:
+        return responses.json_bytes_response(row._asdict(), headers=headers)
+    response.headers.update(headers)
+    return ProvisionResponse(**row._asdict())
 
 
-@app.delete("/provision/{subdomain}", dependencies=[Depends(verify_token)])
+@app.delete(
+    "/provision/{subdomain}", dependencies=[PROVISION_LIMIT, Depends(verify_token)]
+)
 def delete_provision(subdomain: str, req: DeleteRequest) -> dict[str, str]:
-    with get_session() as db:
+    with get_session(key=subdomain) as db:
         provision = db.query(Provision).filter_by(subdomain=subdomain).first()
         if not provision:
             raise HTTPException(status_code=404, detail="unknown subdomain")
@@ -283,56 +446,134 @@ def delete_provision(subdomain: str, req: DeleteRequest) -> dict[str, str]:
             cloudflare.delete_access_app(provision.access_app_id)
             cloudflare.delete_dns_record(provision.dns_record_id)
             cloudflare.delete_tunnel(provision.tunnel_id)
+        except CircuitOpenError as e:
+            raise _unavailable(e) from e
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e)) from e
         db.delete(provision)
+        bump_version(db, subdomain)
         db.commit()
     return {"status": "deleted"}
 
 
-@app.get("/history/{subdomain}", dependencies=[Depends(verify_token)])
-def history(subdomain: str):
-    with get_session() as db:
-        events = (
-            db.query(LoginEvent)
-            .filter_by(subdomain=subdomain)
+@app.get("/history/{subdomain}", dependencies=[READ_LIMIT, Depends(verify_token)])
+def history(
+    subdomain: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+):
+    with get_session(read_only=True, key=subdomain) as db:
+        headers = _cache_validators(db, subdomain, "history")
+        if responses.not_modified(headers, if_none_match, if_modified_since):
+            return Response(status_code=304, headers=headers)
+        rows = (
+            db.query(
+                LoginEvent.user,
+                LoginEvent.ip,
+                LoginEvent.timestamp,
+                LoginEvent.country,
+                LoginEvent.asn,
+            )
+            .filter(LoginEvent.subdomain == subdomain)
             .order_by(LoginEvent.timestamp.desc())
             .all()
         )
-        return [
-            {
-                "user": e.user,
-                "ip": e.ip,
-                "timestamp": e.timestamp.isoformat(),
-            }
-            for e in events
-        ]
-
-
-@app.post("/record-login/{subdomain}", dependencies=[Depends(verify_token)])
+    if responses.FAST_JSON:
+        return responses.json_bytes_response(
+            [
+                {
+                    "user": user,
+                    "ip": ip,
+                    "timestamp": ts,
+                    "country": country,
+                    "asn": asn,
+                }
+                for user, ip, ts, country, asn in rows
+            ],
+            headers=headers,
+        )
+    response.headers.update(headers)
+    return [
+        {
+            "user": user,
+            "ip": ip,
+            "timestamp": ts.isoformat(),
+            "country": country,
+            "asn": asn,
+        }
+        for user, ip, ts, country, asn in rows
+    ]
+
+
+@app.post("/record-login/{subdomain}", dependencies=[READ_LIMIT, Depends(verify_token)])
 def record_login(subdomain: str, event: LoginEventRequest) -> dict[str, str]:
-    with get_session() as db:
-        db.add(LoginEvent(subdomain=subdomain, user=event.user, ip=event.ip))
+    with get_session(key=subdomain) as db:
+        db.add(
+            LoginEvent(
+                subdomain=subdomain,
+                user=event.user,
+                ip=event.ip,
+                **geoip.enrich(event.ip),
+            )
+        )
+        bump_version(db, subdomain)
         db.commit()
     return {"status": "recorded"}
 
 
-@app.post("/rotate-key/{subdomain}", dependencies=[Depends(verify_token)])
+@app.post(
+    "/rotate-key/batch",
+    status_code=202,
+    dependencies=[PROVISION_LIMIT, Depends(verify_token)],
+)
+def rotate_key_batch(req: RotateBatchRequest) -> dict:
+    """Start rotating many tunnels; poll ``GET /rotate-key/batch/{job_id}``."""
+    if req.subdomains is None and req.github_id is None:
+        raise HTTPException(status_code=400, detail="subdomains or github_id required")
+    subdomains = (
+        req.subdomains
+        if req.subdomains is not None
+        else rotation.subdomains_for(req.github_id)
+    )
+    if not subdomains:
+        raise HTTPException(status_code=404, detail="no matching subdomains")
+    job_id = rotation.create_job(subdomains)
+    rotation.start_job(job_id)
+    return {"job_id": job_id, "total": len(set(subdomains))}
+
+
+@app.get("/rotate-key/batch/{job_id}", dependencies=[READ_LIMIT, Depends(verify_token)])
+def rotate_key_batch_status(job_id: str) -> dict:
+    status = rotation.job_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="unknown job")
+    return status
+
+
+@app.post(
+    "/rotate-key/{subdomain}",
+    dependencies=[PROVISION_LIMIT, Depends(verify_token), PROVISION_ADMISSION],
+)
 def rotate_key(subdomain: str) -> dict[str, str]:
     with get_session() as db:
         provision = db.query(Provision).filter_by(subdomain=subdomain).first()
         if not provision:
             raise HTTPException(status_code=404, detail="unknown subdomain")
         try:
-            cloudflare.rotate_host_key(provision.tunnel_id)
+            with server.provisions_inflight:
+                cloudflare.rotate_host_key(provision.tunnel_id)
+        except CircuitOpenError as e:
+            raise _unavailable(e) from e
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e)) from e
-    return {"status": "rotated"}
+        # The CLI stores this as the token cloudflared runs with.
+        tunnel_token = provision.tunnel_token
+    return {"status": "rotated", "tunnel_token": tunnel_token}
 
 
 def main() -> None:
-    import uvicorn
-    uvicorn.run("sshclaude.api:app", host="0.0.0.0", port=8000)
+    server.serve()
 
 
 def lambda_handler(event, context):
@@ -343,4 +584,3 @@ def lambda_handler(event, context):
 
 if __name__ == "__main__":
     main()
-
@@ -1,66 +1,89 @@
 import os
+import shutil
 import subprocess
+import threading
 import time
-import webbrowser
 from pathlib import Path
-import secrets
-import shutil
-import requests
+
 import click
-from rich.console import Console
-from rich.progress import Progress
+
+# requests, rich and yaml are imported inside the commands that use them so
+# that quick commands such as ``stop`` and ``status`` start fast; see
+# scripts/bench_cli_startup.py.
 
 CONFIG_FILE = Path.home() / ".sshclaude" / "config.yaml"
+# ttyd wrapper written by versions before the supervisor; only cleaned up now.
 LAUNCHER_FILE = Path.home() / ".sshclaude" / "launch_claude.sh"
 PLIST_FILE = Path.home() / "Library/LaunchAgents" / "com.sshclaude.tunnel.plist"
+SYSTEMD_UNIT = "sshclaude.service"
+SYSTEMD_UNIT_FILE = Path.home() / ".config/systemd/user" / SYSTEMD_UNIT
 API_URL = os.getenv("SSHCLAUDE_API", "https://api.sshclaude.dev")
-console = Console()
+# Pinned so ``sshclaude doctor`` finds cloudflared's Prometheus endpoint.
+CLOUDFLARED_METRICS = "127.0.0.1:20241"
+
+
+class _LazyConsole:
+    """Stands in for ``rich.console.Console`` and imports rich on first use."""
+
+    _console = None
+
+    def get(self):
+        """The real console, so rich widgets print through the same one."""
+        if _LazyConsole._console is None:
+            from rich.console import Console
+
+            _LazyConsole._console = Console()
+        return _LazyConsole._console
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+console = _LazyConsole()
 
 
 def ensure_config_dir():
     CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
 
 
-def install_ttyd():
-    if shutil.which("ttyd"):
-        console.print("[green]ttyd already installed.")
-        return
-    console.print("[bold]Installing ttyd via Homebrew...")
-    subprocess.run(["env", "HOMEBREW_NO_AUTO_UPDATE=1", "brew", "install", "ttyd"], check=False)
-
+def install_tools() -> None:
+    """Install whichever of cloudflared and ttyd is missing, in one brew run.
 
-def install_cloudflared():
-    if shutil.which("cloudflared"):
-        console.print("[green]cloudflared already installed.")
+    The output is captured so it does not break up ``init``'s progress display.
+    """
+    missing = [tool for tool in ("cloudflared", "ttyd") if not shutil.which(tool)]
+    if not missing:
         return
-    console.print("[bold]Installing cloudflared via Homebrew...")
-    subprocess.run(["env", "HOMEBREW_NO_AUTO_UPDATE=1", "brew", "install", "cloudflared"], check=False)
+    result = subprocess.run(
+        ["env", "HOMEBREW_NO_AUTO_UPDATE=1", "brew", "install", *missing],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        tail = (result.stderr or result.stdout).strip().splitlines()[-3:]
+        raise RuntimeError(f"brew install {' '.join(missing)} failed: {' '.join(tail)}")
+
 
+def write_launcher(token: str, pool_size: int = 0) -> None:
+    from . import launcher
 
-def write_launcher(token: str) -> None:
     ensure_config_dir()
     token_file = CONFIG_FILE.parent / "session_token"
     token_file.write_text(token)
 
+    # Resolves node/claude once so the guard does not load nvm per connection.
     guard_script = CONFIG_FILE.parent / "token_guard.sh"
-    guard_script.write_text(f"""#!/bin/bash
-export NVM_DIR="$HOME/.nvm"
-[ -s "$NVM_DIR/nvm.sh" ] && \\. "$NVM_DIR/nvm.sh"
-nvm use node > /dev/null
-EXPECTED=$(cat "{token_file}")
-read -p "Token: " INPUT
-if [ "$INPUT" != "$EXPECTED" ]; then
-  echo "Unauthorized"
-  exit 1
-fi
-exec claude
-""")
-    guard_script.chmod(0o755)
-
-    LAUNCHER_FILE.write_text(f"""#!/bin/bash
-exec ttyd --once {guard_script}
-""")
-    LAUNCHER_FILE.chmod(0o755)
+    runtime = launcher.write_guard(
+        token_file, pool_size, guard_script, CONFIG_FILE.parent / "runtime.json"
+    )
+    if not runtime["claude"]:
+        console.print(
+            "[yellow]claude not found; the launcher will load nvm on each connection."
+        )
+    # The supervisor runs ttyd with the guard directly.
+    LAUNCHER_FILE.unlink(missing_ok=True)
+
 
 def write_tunnel_files(subdomain: str, token: str) -> None:
     import json
@@ -92,9 +115,29 @@ def _launchctl(action: str, plist: Path) -> None:
     )
 
 
-def write_plist(token: str) -> None:
+def _systemctl(*args: str) -> None:
+    subprocess.run(
+        ["systemctl", "--user", *args],
+        check=False,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def _supervisor_command() -> list[str]:
+    import sys
+
+    return [sys.executable, "-m", "sshclaude.cli", "supervise"]
+
+
+def write_plist() -> None:
+    """LaunchAgent that keeps ``sshclaude supervise`` running."""
+    from xml.sax.saxutils import escape
+
     PLIST_FILE.parent.mkdir(parents=True, exist_ok=True)
-    cloudflared_path = shutil.which("cloudflared") or "/usr/local/bin/cloudflared"
+    arguments = "\n".join(
+        f"        <string>{escape(a)}</string>" for a in _supervisor_command()
+    )
     plist = f"""<?xml version='1.0' encoding='UTF-8'?>
 <!DOCTYPE plist PUBLIC '-//Apple//DTD PLIST 1.0//EN' 'http://www.apple.com/DTDs/PropertyList-1.0.dtd'>
 <plist version='1.0'>
@@ -103,62 +146,308 @@ def write_plist(token: str) -> None:
     <string>com.sshclaude.tunnel</string>
     <key>ProgramArguments</key>
     <array>
-        <string>{cloudflared_path}</string>
-        <string>tunnel</string>
-        <string>run</string>
-        <string>--token</string>
-        <string>{token}</string>
+{arguments}
     </array>
+    <key>EnvironmentVariables</key>
+    <dict>
+        <key>PATH</key>
+        <string>{escape(os.environ.get("PATH", ""))}</string>
+    </dict>
     <key>RunAtLoad</key>
     <true/>
+    <key>KeepAlive</key>
+    <dict>
+        <key>SuccessfulExit</key>
+        <false/>
+    </dict>
 </dict>
 </plist>
 """
     PLIST_FILE.write_text(plist)
-    _launchctl("bootout", PLIST_FILE)
-    _launchctl("bootstrap", PLIST_FILE)
 
 
-def write_config(data: dict):
-    import yaml
-    ensure_config_dir()
-    with CONFIG_FILE.open("w") as f:
-        yaml.safe_dump(data, f)
+def write_systemd_unit() -> None:
+    """systemd user unit that keeps ``sshclaude supervise`` running."""
+    import shlex
 
+    SYSTEMD_UNIT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    SYSTEMD_UNIT_FILE.write_text(
+        f"""[Unit]
+Description=sshclaude ttyd and cloudflared supervisor
 
-def read_config() -> dict:
+[Service]
+ExecStart={shlex.join(_supervisor_command())}
+Environment=PATH={os.environ.get("PATH", "")}
+Restart=on-failure
+
+[Install]
+WantedBy=default.target
+"""
+    )
+
+
+def install_service() -> None:
+    """(Re)start the supervisor under launchd, systemd, or detached."""
+    from . import supervisor
+
+    if shutil.which("launchctl"):
+        write_plist()
+        _launchctl("bootout", PLIST_FILE)
+        _launchctl("bootstrap", PLIST_FILE)
+    elif shutil.which("systemctl"):
+        write_systemd_unit()
+        _systemctl("daemon-reload")
+        _systemctl("enable", SYSTEMD_UNIT)
+        _systemctl("restart", SYSTEMD_UNIT)
+    else:
+        # Restart a detached supervisor so it picks up a changed child list.
+        if supervisor.request("stop") is not None:
+            deadline = time.monotonic() + supervisor.STOP_TIMEOUT * 2
+            while supervisor.running_pid() is not None and time.monotonic() < deadline:
+                time.sleep(0.1)
+        subprocess.Popen(
+            _supervisor_command(),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+
+def stop_service() -> bool:
+    """Stop the supervisor and its children; False if it was not running."""
+    from . import supervisor
+
+    stopped = supervisor.request("stop") is not None
+    if PLIST_FILE.exists():
+        _launchctl("bootout", PLIST_FILE)
+    elif SYSTEMD_UNIT_FILE.exists() and shutil.which("systemctl"):
+        _systemctl("stop", SYSTEMD_UNIT)
+    return stopped
+
+
+def supervised_children() -> list:
+    """ttyd and cloudflared as run by ``sshclaude supervise``."""
+    import sys
+
+    from . import pool
+    from .supervisor import Child
+
+    guard = CONFIG_FILE.parent / "token_guard.sh"
+    profile = local_profile()
+    pool_size = int(read_config(profile).get("pool_size") or 0)
+    ttyd = [shutil.which("ttyd") or "ttyd", "--port", "7681"]
+    if pool_size:
+        ttyd += ["--max-clients", str(pool.MAX_SESSIONS)]
+    children = [
+        Child("ttyd", lambda: [*ttyd, str(guard)]),
+        # The token goes through the environment so it stays out of ps output.
+        Child(
+            "cloudflared",
+            lambda: [
+                shutil.which("cloudflared") or "cloudflared",
+                "tunnel",
+                "--metrics",
+                CLOUDFLARED_METRICS,
+                "run",
+            ],
+            env=lambda: {"TUNNEL_TOKEN": read_config(profile)["tunnel_token"]},
+        ),
+    ]
+    if pool_size:
+        children.append(
+            Child(
+                "pool",
+                lambda: [
+                    sys.executable,
+                    "-m",
+                    "sshclaude.pool",
+                    "serve",
+                    "--size",
+                    str(pool_size),
+                ],
+            )
+        )
+    return children
+
+
+DEFAULT_PROFILE = "default"
+_profile: str | None = None  # set by ``sshclaude --profile``
+
+
+def _load_config_file() -> dict:
     import yaml
+    data = {}
     if CONFIG_FILE.exists():
         with CONFIG_FILE.open() as f:
-            return yaml.safe_load(f) or {}
-    return {}
+            data = yaml.safe_load(f) or {}
+    if data and "profiles" not in data:
+        # Configs written before profiles existed hold one flat profile.
+        data = {"local_profile": DEFAULT_PROFILE, "profiles": {DEFAULT_PROFILE: data}}
+    data.setdefault("profiles", {})
+    return data
+
+
+def _save_config_file(data: dict) -> None:
+    import yaml
+
+    ensure_config_dir()
+    tmp = CONFIG_FILE.with_suffix(".tmp")
+    with tmp.open("w") as f:
+        yaml.safe_dump(data, f)
+    tmp.replace(CONFIG_FILE)
+
+
+def local_profile() -> str:
+    """Profile whose tunnel this machine's ttyd and cloudflared serve."""
+    return _load_config_file().get("local_profile") or DEFAULT_PROFILE
+
+
+def active_profile() -> str:
+    return _profile or local_profile()
+
+
+def read_profiles() -> dict[str, dict]:
+    return _load_config_file()["profiles"]
+
+
+def write_config(data: dict, profile: str | None = None):
+    config = _load_config_file()
+    config["profiles"][profile or active_profile()] = data
+    _save_config_file(config)
+
+
+def read_config(profile: str | None = None) -> dict:
+    return read_profiles().get(profile or active_profile(), {})
+
+
+def set_local_profile(name: str) -> None:
+    config = _load_config_file()
+    config["local_profile"] = name
+    _save_config_file(config)
+
+
+def remove_profile(name: str) -> None:
+    """Forget ``name``; the config file goes once no profile is left."""
+    config = _load_config_file()
+    config["profiles"].pop(name, None)
+    if config.get("local_profile") == name:
+        config.pop("local_profile")
+    if config["profiles"]:
+        _save_config_file(config)
+    else:
+        CONFIG_FILE.unlink(missing_ok=True)
 
 
 def is_tunnel_running() -> bool:
-    plist_label = "com.sshclaude.tunnel"
-    result = subprocess.run(["launchctl", "list"], capture_output=True, text=True)
-    return plist_label in result.stdout
+    from .supervisor import child_running
+
+    return child_running("cloudflared")
 
 
 def is_ttyd_running() -> bool:
-    result = subprocess.run(["pgrep", "-f", "ttyd.*token_guard.sh"], capture_output=True, text=True)
-    return result.returncode == 0
+    from .supervisor import child_running
+
+    return child_running("ttyd")
 
 
+def wait_for_verification(uid: str, timeout: float = 120) -> bool:
+    """Block until the API reports the login ``uid`` verified.
+
+    Listens on the server-sent event stream and falls back to long-polling
+    the status endpoint if the stream is unavailable.
+    """
+    import json
+
+    import requests
+
+    deadline = time.monotonic() + timeout
+    try:
+        with requests.get(
+            f"{API_URL}/login/{uid}/events", stream=True, timeout=(5, 30)
+        ) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines(decode_unicode=True):
+                if (
+                    line
+                    and line.startswith("data:")
+                    and json.loads(line[5:]).get("verified")
+                ):
+                    return True
+                if time.monotonic() > deadline:
+                    return False
+    except Exception:
+        pass
+
+    while time.monotonic() < deadline:
+        wait = max(1, min(30, int(deadline - time.monotonic())))
+        try:
+            resp = requests.get(
+                f"{API_URL}/login/{uid}/status",
+                params={"wait": wait},
+                timeout=wait + 10,
+            )
+        except Exception:
+            time.sleep(2)
+            continue
+        if resp.status_code == 404:
+            return False  # unknown or expired login
+        if resp.status_code == 200:
+            if resp.json().get("verified"):
+                return True
+            continue
+        retry_after = resp.headers.get("Retry-After", "")
+        time.sleep(float(retry_after) if retry_after.isdigit() else 2)
+    return False
+
 
 @click.group()
-def cli():
+@click.option(
+    "--profile",
+    envvar="SSHCLAUDE_PROFILE",
+    help="Config profile to use (default: the one this machine serves).",
+)
+def cli(profile: str | None):
     """sshclaude command line interface."""
-
+    global _profile
+    _profile = profile
 
 
 @cli.command()
-@click.option("--github", required=True, help="Your GitHub login (used for display only)")
+@click.option(
+    "--github", required=True, help="Your GitHub login (used for display only)"
+)
 @click.option("--domain", help="Subdomain to use (default: <user>.sshclaude.com)")
 @click.option("--session", default="15m", help="Session TTL for Access")
-@click.option("--token", help="Optional session token to unlock terminal (only stored locally)")
-def init(github: str, domain: str | None, session: str, token: str | None):
+@click.option(
+    "--token", help="Optional session token to unlock terminal (only stored locally)"
+)
+@click.option(
+    "--team", help="GitHub org/team allowed through Access instead of only your email"
+)
+@click.option(
+    "--pool-size",
+    type=click.IntRange(min=0),
+    help="Warm Claude sessions kept ready for new connections (0 disables)",
+)
+def init(
+    github: str,
+    domain: str | None,
+    session: str,
+    token: str | None,
+    team: str | None,
+    pool_size: int | None,
+):
     """Initialize a Claude tunnel after verifying GitHub identity."""
+    import base64
+    import json
+    import secrets
+    import webbrowser
+
+    import requests
+    from rich.progress import Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
+
+    from .taskgraph import Task, TaskGraphError, run_graph
 
     console.print("[blue]sshclaude init started")
 
@@ -171,230 +460,491 @@ def init(github: str, domain: str | None, session: str, token: str | None):
             console.print("[red]Configuration incomplete. Remove ~/.sshclaude and re-run init.")
             return
         session_token = token.strip() if token else (CONFIG_FILE.parent / "session_token").read_text().strip()
+        if pool_size is not None:
+            config["pool_size"] = pool_size
+            write_config(config)
         write_tunnel_files(subdomain, tunnel_token)
-        write_launcher(session_token)
-        write_plist(tunnel_token)
-        # Check if ttyd is already running
-        if is_ttyd_running():
-            console.print("[yellow]ttyd already running — reusing existing terminal.")
-        else:
-            ttyd_proc = subprocess.Popen(["ttyd", "--port", "7681", str(CONFIG_FILE.parent / "token_guard.sh")])
-            console.print(f"[dim]Started ttyd (PID {ttyd_proc.pid})[/]")
-
-        # Restart tunnel if already active
-        if is_tunnel_running():
-            console.print("[yellow]Tunnel already running — restarting to apply config...")
-            _launchctl("bootout", PLIST_FILE)
-
-        _launchctl("bootstrap", PLIST_FILE)
+        write_launcher(session_token, config.get("pool_size", 0))
+        set_local_profile(active_profile())
+        if is_tunnel_running() or is_ttyd_running():
+            console.print(
+                "[yellow]Supervisor already running — restarting to apply config..."
+            )
+        install_service()
 
         console.print(f"[green]sshclaude started at https://{subdomain}")
         return
 
-    install_cloudflared()
-    install_ttyd()
+    profile = active_profile()
+    subdomain = domain or f"{os.getlogin()}.sshclaude.com"
+    session_token = token.strip() if token else secrets.token_urlsafe(32)
+    started = time.monotonic()
 
-    console.print("[bold]Verifying GitHub identity via browser login...")
-    try:
+    def start_login(_):
         resp = requests.post(f"{API_URL}/login", timeout=10)
         resp.raise_for_status()
         login = resp.json()
-        client_id = login["client_id"]
-    except Exception as e:
-        console.print(f"[red]Failed to initiate login: {e}")
-        return
-
-    uid = login["url"].split("/")[-1]
-    api_token = login["token"]
-
-    import base64
-    import json
-
-    state_obj = {"uid": uid, "token": api_token}
-    state = base64.urlsafe_b64encode(json.dumps(state_obj).encode()).decode()
-
-    login_url = (
-        f"https://github.com/login/oauth/authorize"
-        f"?client_id={client_id}"
-        f"&redirect_uri=https://api.sshclaude.dev/oauth/callback"
-        f"&state={state}"
-        f"&allow_signup=false"
-        f"&scope=user:email"
-    )
-
-    webbrowser.open(login_url)
-    console.print(f"[cyan]Waiting for verification... (or open {login_url} manually)")
+        uid = login["url"].split("/")[-1]
+        api_token = login["token"]
+        state = base64.urlsafe_b64encode(
+            json.dumps({"uid": uid, "token": api_token}).encode()
+        ).decode()
+        login_url = (
+            f"https://github.com/login/oauth/authorize"
+            f"?client_id={login['client_id']}"
+            f"&redirect_uri=https://api.sshclaude.dev/oauth/callback"
+            f"&state={state}"
+            f"&allow_signup=false"
+            f"&scope=user:email"
+        )
+        webbrowser.open(login_url)
+        console.print(
+            f"[cyan]Waiting for GitHub verification... (or open {login_url} manually)"
+        )
+        return uid, api_token
 
-    for _ in range(60):
-        time.sleep(2)
-        try:
-            check = requests.get(f"{API_URL}/login/{uid}/status", timeout=5).json()
-            if check.get("verified"):
-                console.print("[green]GitHub identity verified.")
-                break
-        except Exception:
-            pass
-    else:
-        console.print("[red]Verification timed out.")
-        return
+    def verify(deps):
+        uid, _ = deps["login"]
+        if not wait_for_verification(uid):
+            raise RuntimeError("verification timed out")
+        console.print("[green]GitHub identity verified.")
 
-    try:
-        userinfo = requests.get(
+    def whoami(deps):
+        uid, api_token = deps["login"]
+        resp = requests.get(
             f"{API_URL}/login/{uid}/whoami",
             headers={"Authorization": f"Bearer {api_token}"},
             timeout=10,
         )
-        userinfo.raise_for_status()
-        verified_email = userinfo.json().get("email")
-        if not verified_email:
-            console.print("[red]Server did not return a verified email.")
-            return
-        console.print(f"[green]Verified email: {verified_email}")
-    except Exception as e:
-        console.print(f"[red]Failed to fetch verified email: {e}")
-        return
-
-    subdomain = domain or f"{os.getlogin()}.sshclaude.com"
-    console.print("[bold]Provisioning tunnel and access policy...")
-
-    try:
+        resp.raise_for_status()
+        email = resp.json().get("email")
+        if not email:
+            raise RuntimeError("server did not return a verified email")
+        console.print(f"[green]Verified email: {email}")
+        return email
+
+    def provision(deps):
+        _, api_token = deps["login"]
         resp = requests.post(
             f"{API_URL}/provision",
             json={
                 "github_id": github,
-                "email": verified_email,
-                "subdomain": subdomain
+                "email": deps["whoami"],
+                "subdomain": subdomain,
+                "team": team,
             },
             headers={"Authorization": f"Bearer {api_token}"},
             timeout=30,
         )
         resp.raise_for_status()
-        data = resp.json()
-    except Exception as e:
-        console.print(f"[red]Provisioning failed: {e}")
-        return
+        return resp.json()
 
-    tunnel_token = data.get("tunnel_token")
-    config = {
-        "github_id": github,
-        "domain": subdomain,
-        "session": session,
-        "tunnel_id": data.get("tunnel_id"),
-        "tunnel_token": tunnel_token,
-        "dns_record_id": data.get("dns_record_id"),
-        "access_app_id": data.get("access_app_id"),
-    }
+    def save(deps):
+        data = deps["provision"]
+        tunnel_token = data.get("tunnel_token")
+        write_config(
+            {
+                "github_id": github,
+                "domain": subdomain,
+                "session": session,
+                "tunnel_id": data.get("tunnel_id"),
+                "tunnel_token": tunnel_token,
+                "dns_record_id": data.get("dns_record_id"),
+                "access_app_id": data.get("access_app_id"),
+                "pool_size": pool_size or 0,
+            },
+            profile,
+        )
+        write_tunnel_files(subdomain, tunnel_token)
+        set_local_profile(profile)
+
+    # The tool installs and launcher generation overlap with the browser
+    # login; provisioning starts as soon as the identity is known.
+    graph = [
+        Task(
+            "tools",
+            lambda _: install_tools(),
+            description="Install cloudflared and ttyd",
+        ),
+        Task(
+            "launcher",
+            lambda _: write_launcher(session_token, pool_size or 0),
+            description="Write launcher",
+        ),
+        Task("login", start_login, description="Start GitHub login"),
+        Task("verify", verify, ("login",), "Wait for GitHub verification"),
+        Task("whoami", whoami, ("login", "verify"), "Fetch verified email"),
+        Task(
+            "provision",
+            provision,
+            ("login", "whoami"),
+            "Provision tunnel and access policy",
+        ),
+        Task("config", save, ("provision",), "Save config and tunnel files"),
+        Task(
+            "service",
+            lambda _: install_service(),
+            ("tools", "launcher", "config"),
+            "Start supervisor",
+        ),
+    ]
+    icons = {"done": "[green]✓", "failed": "[red]✗", "skipped": "[dim]-"}
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("{task.description}"),
+        TimeElapsedColumn(),
+        console=console.get(),
+    ) as progress:
+        rows = {
+            task.name: progress.add_task(task.description, total=1, start=False)
+            for task in graph
+        }
+
+        def show(task, state, error):
+            progress.start_task(rows[task.name])
+            if state in icons:
+                suffix = f" ({error})" if error else ""
+                progress.update(
+                    rows[task.name],
+                    completed=1,
+                    description=f"{icons[state]} {task.description}{suffix}",
+                )
+                progress.stop_task(rows[task.name])
 
-    write_config(config)
+        try:
+            run_graph(graph, max_workers=len(graph), on_change=show)
+        except TaskGraphError as e:
+            progress.stop()
+            for name, error in e.errors.items():
+                console.print(f"[red]{name} failed: {error}")
+            return
 
-    session_token = token.strip() if token else secrets.token_urlsafe(32)
     if not token:
         console.print(f"[bold yellow]Generated session token:[/] {session_token}")
         console.print("[dim]This token is required to unlock Claude in your browser.[/]")
+    elapsed = time.monotonic() - started
+    console.print(
+        f"[green]Initialization complete in {elapsed:.0f}s! Visit: https://{subdomain}"
+    )
 
-    write_tunnel_files(subdomain, tunnel_token)
-    write_launcher(session_token)
-    write_plist(tunnel_token)
 
-    console.print(f"[green]Initialization complete! Visit: https://{subdomain}")
+@cli.command()
+def status():
+    """Report whether the tunnel and ttyd are running (exit 1 if not)."""
+    tunnel, ttyd = is_tunnel_running(), is_ttyd_running()
+    for name, running in (("cloudflared tunnel", tunnel), ("ttyd", ttyd)):
+        click.secho(
+            f"{name}: {'running' if running else 'stopped'}",
+            fg="green" if running else "yellow",
+        )
+    raise SystemExit(0 if tunnel and ttyd else 1)
 
 
+# stop and status print with click rather than rich to keep startup short.
 @cli.command()
 def stop():
     """Stop the sshclaude tunnel session (cloudflared + ttyd)."""
-    console.print("[bold]Stopping sshclaude tunnel session...")
+    click.secho("Stopping sshclaude tunnel session...", bold=True)
+    if stop_service():
+        click.secho("Stopped the supervisor, cloudflared and ttyd.", fg="green")
+    else:
+        click.secho("No running sshclaude supervisor found.", fg="yellow")
 
-    if PLIST_FILE.exists():
-        _launchctl("bootout", PLIST_FILE)
-        console.print("[green]Stopped cloudflared tunnel.")
+
+@cli.command()
+@click.option(
+    "--bench",
+    is_flag=True,
+    help="Also measure ttyd echo latency/throughput and API timings.",
+)
+@click.option(
+    "--samples",
+    default=20,
+    show_default=True,
+    help="Keystroke round trips to time with --bench.",
+)
+@click.option(
+    "--login",
+    is_flag=True,
+    help="With --bench, also time POST /login (creates a real login session).",
+)
+@click.option(
+    "--json",
+    "json_path",
+    type=click.Path(dir_okay=False, allow_dash=True),
+    help="Append the report as one JSON line to this file ('-' for stdout).",
+)
+def doctor(bench: bool, samples: int, login: bool, json_path: str | None):
+    """Check ttyd, cloudflared and the API, with a per-hop latency breakdown."""
+    import json
+
+    from . import doctor as probes
+
+    metrics = [CLOUDFLARED_METRICS, *probes.METRICS_ADDRESSES]
+    report = probes.run(
+        API_URL,
+        bench=bench,
+        samples=samples,
+        metrics_addresses=dict.fromkeys(metrics),
+        login=login,
+    )
+    if json_path == "-":
+        click.echo(json.dumps(report))
     else:
-        console.print("[yellow]No active cloudflared session found.")
+        for hop, detail, ok in probes.format_report(report):
+            status = click.style("ok  " if ok else "FAIL", fg="green" if ok else "red")
+            click.echo(f"{status} {hop:28s} {detail}")
+        if json_path:
+            with open(json_path, "a") as f:
+                f.write(json.dumps(report) + "\n")
+    raise SystemExit(0 if report["ok"] else 1)
 
-    # Kill any stray ttyd processes (only ones that launched claude)
-    try:
-        result = subprocess.run(
-            ["pgrep", "-fl", "ttyd"],
-            capture_output=True,
-            text=True,
-            check=False
+
+@cli.command()
+def supervise():
+    """Run ttyd and cloudflared in the foreground, restarting them on exit."""
+    from .supervisor import Supervisor
+
+    if not read_config().get("tunnel_token"):
+        raise click.ClickException(
+            "sshclaude is not initialized; run `sshclaude init` first."
         )
-        for line in result.stdout.strip().split("\n"):
-            if "ttyd" in line and "claude" in line:
-                pid = int(line.split()[0])
-                os.kill(pid, 9)
-                console.print(f"[green]Killed ttyd process (PID {pid})")
-    except Exception as e:
-        console.print(f"[red]Failed to kill ttyd: {e}")
+    try:
+        Supervisor(supervised_children()).serve()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
 
-    console.print("[bold green]Tunnel session fully stopped.")
+
+def _delete_resources(http, config: dict) -> None:
+    resp = http.delete(
+        f"{API_URL}/provision/{config.get('domain')}",
+        json={"tunnel_token": config.get("tunnel_token")},
+        timeout=30,
+    )
+    if resp.status_code != 200:
+        raise RuntimeError(f"delete failed: {resp.text}")
+
+
+def _forget_profile(name: str) -> None:
+    """Drop ``name`` from the config, tearing down local services if they serve it."""
+    if name == local_profile():
+        stop_service()
+        if SYSTEMD_UNIT_FILE.exists() and shutil.which("systemctl"):
+            _systemctl("disable", SYSTEMD_UNIT)
+        PLIST_FILE.unlink(missing_ok=True)
+        SYSTEMD_UNIT_FILE.unlink(missing_ok=True)
+        LAUNCHER_FILE.unlink(missing_ok=True)
+    remove_profile(name)
+
+
+def _rotate_token(http, config: dict) -> str:
+    resp = http.post(f"{API_URL}/rotate-key/{config.get('domain')}", timeout=30)
+    resp.raise_for_status()
+    new_token = resp.json().get("tunnel_token")
+    if not new_token:
+        raise RuntimeError("no token returned from server")
+    return new_token
+
+
+def _store_token(name: str, new_token: str) -> None:
+    """Save a rotated token; restart cloudflared if this machine serves ``name``."""
+    config = read_config(name)
+    config["tunnel_token"] = new_token
+    write_config(config, name)
+    if name != local_profile():
+        return
+    write_tunnel_files(config.get("domain"), new_token)
+    from . import supervisor
+
+    if supervisor.request("restart cloudflared") is None:
+        install_service()
 
 
 @cli.command()
 def uninstall():
-    config = read_config()
+    import requests
+    from rich.progress import Progress
+
+    name = active_profile()
+    config = read_config(name)
     if not config:
         console.print("[red]sshclaude not initialized.")
         return
     console.print("[bold]Removing Cloudflare resources...")
-    subdomain = config.get("domain")
     with Progress() as progress:
         t = progress.add_task("cleanup", total=3)
         progress.update(t, advance=1)
         try:
-            resp = requests.delete(
-                f"{API_URL}/provision/{subdomain}",
-                json={"tunnel_token": config.get("tunnel_token")},
-                timeout=30,
-            )
-            if resp.status_code != 200:
-                console.print(f"[red]Delete failed: {resp.text}")
-                return
+            _delete_resources(requests, config)
         except Exception as e:
             console.print(f"[red]Failed to delete resources: {e}")
             return
         progress.update(t, advance=2)
 
-    _launchctl("bootout", PLIST_FILE)
-    PLIST_FILE.unlink(missing_ok=True)
-    LAUNCHER_FILE.unlink(missing_ok=True)
-    CONFIG_FILE.unlink(missing_ok=True)
+    _forget_profile(name)
     console.print("[green]Uninstall complete.")
 
 @cli.command(name="refresh-token")
 def refresh_token():
     """Refresh Cloudflare tunnel token and update local config."""
-    config = read_config()
+    import requests
+
+    name = active_profile()
+    config = read_config(name)
     if not config:
         console.print("[red]sshclaude is not initialized.")
         return
 
-    subdomain = config.get("domain")
-    console.print(f"[bold]Refreshing tunnel token for {subdomain}...")
-
+    console.print(f"[bold]Refreshing tunnel token for {config.get('domain')}...")
     try:
-        resp = requests.post(f"{API_URL}/rotate-key/{subdomain}", timeout=30)
-        resp.raise_for_status()
-        data = resp.json()
-        new_token = data.get("tunnel_token")
-        if not new_token:
-            console.print("[red]No token returned from server.")
-            return
+        new_token = _rotate_token(requests, config)
     except Exception as e:
         console.print(f"[red]Failed to refresh token: {e}")
         return
 
-    # Update config and files
-    config["tunnel_token"] = new_token
-    write_config(config)
-    write_tunnel_files(subdomain, new_token)
+    _store_token(name, new_token)
+    console.print("[green]Tunnel token refreshed successfully.")
 
-    # Reload tunnel
-    _launchctl("bootout", PLIST_FILE)
-    write_plist(new_token)
-    _launchctl("bootstrap", PLIST_FILE)
 
-    console.print("[green]Tunnel token refreshed successfully.")
+@cli.group()
+def fleet():
+    """Run an operation for many profiles concurrently."""
+
+
+_http_local = threading.local()
+
+
+def _http():
+    """A requests session per worker thread, so connections are reused."""
+    import requests
+
+    if not hasattr(_http_local, "session"):
+        _http_local.session = requests.Session()
+    return _http_local.session
+
+
+def _run_fleet(names: tuple[str, ...], jobs: int, label: str, work, apply=None) -> None:
+    """Run ``work(name, config, http)`` per profile on a bounded pool and report.
+
+    ``apply(name, result)`` runs in the main thread as each profile finishes,
+    so config writes never race; it returns the detail shown in the report.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    from rich.progress import Progress
+    from rich.table import Table
+
+    profiles = read_profiles()
+    unknown = sorted(set(names) - set(profiles))
+    if unknown:
+        raise click.ClickException(f"Unknown profile(s): {', '.join(unknown)}")
+    selected = list(names or profiles)
+    if not selected:
+        raise click.ClickException(
+            "No profiles configured; run `sshclaude init` first."
+        )
+
+    results: dict[str, tuple[bool, str]] = {}
+
+    def run(name: str):
+        return work(name, profiles[name], _http())
+
+    with Progress() as progress, ThreadPoolExecutor(
+        max_workers=max(1, min(jobs, len(selected)))
+    ) as pool:
+        task = progress.add_task(label, total=len(selected))
+        futures = {pool.submit(run, name): name for name in selected}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+                results[name] = (True, apply(name, result) if apply else str(result))
+            except Exception as e:
+                results[name] = (False, str(e))
+            progress.update(task, advance=1, description=f"{label} ({name})")
+
+    table = Table("profile", "domain", "result", "detail")
+    for name in selected:
+        ok, detail = results[name]
+        table.add_row(
+            name,
+            str(profiles[name].get("domain")),
+            "[green]ok" if ok else "[red]failed",
+            detail,
+        )
+    console.print(table)
+    failed = sum(1 for ok, _ in results.values() if not ok)
+    console.print(f"{len(selected) - failed} succeeded, {failed} failed")
+    raise SystemExit(1 if failed else 0)
+
+
+_fleet_names = click.argument("names", nargs=-1)
+_fleet_jobs = click.option(
+    "--jobs", "-j", default=8, show_default=True, help="Profiles handled at once."
+)
+
+
+@fleet.command(name="status")
+@_fleet_names
+@_fleet_jobs
+def fleet_status(names: tuple[str, ...], jobs: int):
+    """Check that each profile's tunnel is provisioned and its token current."""
+
+    def work(name: str, config: dict, http) -> str:
+        resp = http.get(f"{API_URL}/provision/{config.get('domain')}", timeout=30)
+        if resp.status_code == 404:
+            raise RuntimeError("not provisioned")
+        resp.raise_for_status()
+        if resp.json().get("tunnel_token") != config.get("tunnel_token"):
+            raise RuntimeError("local tunnel token is stale; run refresh-token")
+        return "provisioned"
+
+    _run_fleet(names, jobs, "status", work)
+
+
+@fleet.command(name="refresh-token")
+@_fleet_names
+@_fleet_jobs
+def fleet_refresh_token(names: tuple[str, ...], jobs: int):
+    """Rotate the tunnel token of each profile."""
+
+    def apply(name: str, new_token: str) -> str:
+        _store_token(name, new_token)
+        return "token rotated"
+
+    _run_fleet(
+        names,
+        jobs,
+        "refresh-token",
+        lambda name, config, http: _rotate_token(http, config),
+        apply,
+    )
+
+
+@fleet.command(name="uninstall")
+@_fleet_names
+@_fleet_jobs
+@click.option("--yes", is_flag=True, help="Do not ask for confirmation.")
+def fleet_uninstall(names: tuple[str, ...], jobs: int, yes: bool):
+    """Delete the Cloudflare resources of each profile and forget it."""
+    if not yes:
+        click.confirm(
+            f"Delete tunnels for {', '.join(names) if names else 'all profiles'}?",
+            abort=True,
+        )
+
+    def apply(name: str, _: None) -> str:
+        _forget_profile(name)
+        return "deleted"
+
+    _run_fleet(
+        names,
+        jobs,
+        "uninstall",
+        lambda name, config, http: _delete_resources(http, config),
+        apply,
+    )
+
 
 if __name__ == "__main__":
     cli()
-
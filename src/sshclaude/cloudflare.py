@@ -5,9 +5,13 @@ from __future__ import annotations
 
 import os
 import secrets
-from typing import Any
+import threading
+from typing import Any, Optional
+
 import requests
 
+from .breaker import CircuitBreaker
+
 
 class MissingEnvError(RuntimeError):
     """Raised when a required environment variable is missing."""
@@ -28,6 +32,36 @@ ACCOUNT_BASE = f"https://api.cloudflare.com/client/v4/accounts/{ACCOUNT_ID}"
 ZONE_BASE = f"https://api.cloudflare.com/client/v4/zones/{ZONE_ID}"
 
 
+TIMEOUT = float(os.getenv("CLOUDFLARE_TIMEOUT", "30"))
+
+# One breaker per endpoint family so a DNS outage does not block tunnel calls.
+breakers = {
+    family: CircuitBreaker(
+        f"cloudflare.{family}",
+        failure_threshold=int(os.getenv("CLOUDFLARE_BREAKER_FAILURES", "5")),
+        reset_timeout=float(os.getenv("CLOUDFLARE_BREAKER_RESET", "30")),
+    )
+    for family in ("tunnels", "dns", "access")
+}
+
+# Last successful listing per URL, served when the live lookup fails.
+_last_known_good: dict[str, list[dict[str, Any]]] = {}
+
+# Attach one account-level Access policy per email instead of creating a
+# policy for every app.
+_reusable = os.getenv("CLOUDFLARE_REUSABLE_POLICIES", "1").lower()
+REUSABLE_POLICIES = _reusable not in ("0", "false", "no")
+_policy_ids: dict[str, str] = {}
+# The account's policies are listed once per process to warm _policy_ids;
+# later misses create the policy and only look it up on a conflict.
+_policies_listed = False
+_policy_locks: dict[str, threading.Lock] = {}
+_policy_lock = threading.Lock()
+# GitHub identity provider configured in Access; required for team policies.
+GITHUB_IDP_ID = os.getenv("CLOUDFLARE_GITHUB_IDP_ID", "")
+LIST_PAGE_SIZE = 100
+
+
 def _headers() -> dict[str, str]:
     return {
         "Authorization": f"Bearer {os.environ['CLOUDFLARE_TOKEN']}",
@@ -35,17 +69,67 @@ def _headers() -> dict[str, str]:
     }
 
 
+def _request(family: str, method: str, url: str, **kwargs: Any) -> requests.Response:
+    """Call the Cloudflare API through the ``family`` circuit breaker.
+
+    Exceptions (connection errors, timeouts, ...), 429 and 5xx responses
+    count as failures; other responses are returned to the caller as before.
+    """
+    breaker = breakers[family]
+    headers = _headers()
+    breaker.before_call()
+    try:
+        resp = requests.request(method, url, headers=headers, timeout=TIMEOUT, **kwargs)
+    except Exception:
+        # Any error must settle the call, or a half-open probe never ends.
+        breaker.record_failure()
+        raise
+    if resp.status_code == 429 or resp.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return resp
+
+
+def _list(family: str, url: str) -> list[dict[str, Any]]:
+    """List every page of resources, falling back to the last known good result."""
+    result: list[dict[str, Any]] = []
+    page = 1
+    try:
+        while True:
+            params = {"page": page, "per_page": LIST_PAGE_SIZE}
+            resp = _request(family, "GET", url, params=params)
+            resp.raise_for_status()
+            body = resp.json()
+            items = body.get("result") or []
+            result.extend(items)
+            total_pages = (body.get("result_info") or {}).get("total_pages")
+            if not items or (
+                page >= total_pages if total_pages else len(items) < LIST_PAGE_SIZE
+            ):
+                break
+            page += 1
+    except requests.RequestException as e:
+        if url not in _last_known_good:
+            raise
+        print(f"[WARN] Serving last known good {family} listing:", e)
+        return _last_known_good[url]
+    _last_known_good[url] = result
+    return result
+
+
+def health() -> dict[str, Any]:
+    return {family: breaker.snapshot() for family, breaker in breakers.items()}
+
+
 def create_tunnel(name: str) -> dict[str, Any]:
     print("[DEBUG] Reuse-aware create_tunnel logic is active")
 
     list_url = f"{ACCOUNT_BASE}/tunnels"
-    headers = _headers()
 
     # Check existing tunnels
     try:
-        resp = requests.get(list_url, headers=headers, timeout=30)
-        resp.raise_for_status()
-        tunnels = resp.json().get("result", [])
+        tunnels = _list("tunnels", list_url)
         for t in tunnels:
             if t["name"] == name:
                 print("[DEBUG] Reusing existing tunnel:", t["id"])
@@ -57,7 +141,7 @@ def create_tunnel(name: str) -> dict[str, Any]:
     # Create tunnel
     payload = {"name": name}
     print("[DEBUG] Creating tunnel:", payload)
-    resp = requests.post(list_url, json=payload, headers=headers, timeout=30)
+    resp = _request("tunnels", "POST", list_url, json=payload)
     if not resp.ok:
         print("[CLOUDFLARE ERROR]", resp.status_code, resp.text)
     resp.raise_for_status()
@@ -73,14 +157,12 @@ def create_tunnel(name: str) -> dict[str, Any]:
 
 
 def create_dns_record(subdomain: str, tunnel_id: str) -> dict[str, Any]:
-    headers = _headers()
-
     zone_name = ".".join(subdomain.split(".")[-2:])
     name = subdomain.replace(f".{zone_name}", "")  # e.g. "ubuntu"
 
     # Exact match query
     list_url = f"{ZONE_BASE}/dns_records?name={name}&match=all"
-    resp = requests.get(list_url, headers=headers, timeout=30)
+    resp = _request("dns", "GET", list_url)
     resp.raise_for_status()
     records = resp.json().get("result", [])
     print(f"[DEBUG] Existing DNS record query returned: {records}")
@@ -90,7 +172,7 @@ def create_dns_record(subdomain: str, tunnel_id: str) -> dict[str, Any]:
         record = records[0]
         print(f"[DEBUG] Deleting existing DNS record: {record['id']}")
         del_url = f"{ZONE_BASE}/dns_records/{record['id']}"
-        del_resp = requests.delete(del_url, headers=headers, timeout=30)
+        del_resp = _request("dns", "DELETE", del_url)
         del_resp.raise_for_status()
 
     # Now safely create CNAME
@@ -104,7 +186,7 @@ def create_dns_record(subdomain: str, tunnel_id: str) -> dict[str, Any]:
     print("[DEBUG] Creating DNS record with payload:", payload)
 
     create_url = f"{ZONE_BASE}/dns_records"
-    resp = requests.post(create_url, json=payload, headers=headers, timeout=30)
+    resp = _request("dns", "POST", create_url, json=payload)
     print("[DEBUG] Create DNS response:", resp.status_code, resp.text)
     resp.raise_for_status()
     return resp.json()
@@ -112,7 +194,7 @@ def create_dns_record(subdomain: str, tunnel_id: str) -> dict[str, Any]:
 
 def delete_dns_record(record_id: str) -> None:
     url = f"{ZONE_BASE}/dns_records/{record_id}"
-    resp = requests.delete(url, headers=_headers(), timeout=30)
+    resp = _request("dns", "DELETE", url)
     resp.raise_for_status()
 
 def _build_email_rule(address: str) -> dict:
@@ -125,15 +207,117 @@ def _build_email_rule(address: str) -> dict:
         }
     }
 
-def create_access_app(email: str, subdomain: str) -> dict[str, Any]:
-    headers = _headers()
+
+def _build_team_rule(team: str) -> dict:
+    """
+    Return a Cloudflare Access rule that allows a GitHub ``org`` or ``org/team``.
+    """
+    org, _, slug = team.strip().lower().partition("/")
+    rule = {"name": org, "identity_provider_id": GITHUB_IDP_ID}
+    if slug:
+        rule["team"] = slug
+    return {"github-organization": rule}
+
+
+def email_policy_name(email: str) -> str:
+    return f"sshclaude-email-{email.strip().lower()}"
+
+
+def team_policy_name(team: str) -> str:
+    return f"sshclaude-team-{team.strip().lower()}"
+
+
+def _remember_policies(policy_url: str) -> None:
+    for policy in _list("access", policy_url):
+        if policy.get("name", "").startswith("sshclaude-"):
+            _policy_ids[policy["name"]] = policy["id"]
+
+
+def _warm_policy_ids(policy_url: str) -> None:
+    global _policies_listed
+    with _policy_lock:
+        if _policies_listed:
+            return
+        try:
+            _remember_policies(policy_url)
+        except requests.RequestException as e:
+            print("[WARN] Failed to list Access policies:", e)
+            return
+        _policies_listed = True
+
+
+def _is_conflict(resp: requests.Response) -> bool:
+    if resp.status_code == 409:
+        return True
+    try:
+        errors = resp.json().get("errors") or []
+    except ValueError:
+        return False
+    messages = " ".join(str(e.get("message", "")) for e in errors).lower()
+    return "already exists" in messages or "duplicate" in messages
+
+
+def get_or_create_policy(name: str, include: list[dict]) -> str:
+    """Return the id of the reusable allow policy ``name``, creating it if needed.
+
+    Ids are cached per process. The first miss lists the account's policies
+    once; after that a miss creates the policy straight away and lists them
+    again only if Cloudflare reports that it already exists.
+    """
+    if name in _policy_ids:
+        return _policy_ids[name]
+    policy_url = f"{ACCOUNT_BASE}/access/policies"
+    _warm_policy_ids(policy_url)
+    with _policy_lock:
+        lock = _policy_locks.setdefault(name, threading.Lock())
+    with lock:
+        if name in _policy_ids:
+            return _policy_ids[name]
+
+        policy_payload = {
+            "name": name,
+            "decision": "allow",
+            "include": include,
+            "exclude": [],
+            "require": [],
+        }
+        print("[DEBUG] Creating reusable Access Policy:", policy_payload)
+        resp = _request("access", "POST", policy_url, json=policy_payload)
+        print("[DEBUG] Access Policy response:", resp.status_code, resp.text)
+        if resp.ok:
+            _policy_ids[name] = resp.json()["result"]["id"]
+        elif _is_conflict(resp):
+            # Created by another process since the warm-up listing.
+            _remember_policies(policy_url)
+        if name not in _policy_ids:
+            raise RuntimeError(f"Failed to create Access policy: {resp.text}")
+        return _policy_ids[name]
+
+
+def _create_app(app_url: str, app_payload: dict[str, Any]) -> requests.Response:
+    print("[DEBUG] Creating Access App:", app_payload)
+    resp = _request("access", "POST", app_url, json=app_payload)
+    print("[DEBUG] Access App creation response:", resp.status_code, resp.text)
+    return resp
+
+
+def create_access_app(
+    email: str,
+    subdomain: str,
+    policy_id: Optional[str] = None,
+    team: Optional[str] = None,
+) -> dict[str, Any]:
+    """Create (or reuse) the Access app for ``subdomain``.
+
+    The app references ``policy_id``, the shared policy for the GitHub
+    ``team`` (``org/team``) or, with reusable policies enabled, the shared
+    policy for ``email``; otherwise a per-app policy is created.
+    """
     app_url = f"{ACCOUNT_BASE}/access/apps"
 
     # 1. Reuse existing Access App if it already exists
     try:
-        list_resp = requests.get(app_url, headers=headers, timeout=30)
-        list_resp.raise_for_status()
-        apps = list_resp.json().get("result", [])
+        apps = _list("access", app_url)
         for app in apps:
             if app.get("domain") == subdomain:
                 print("[DEBUG] Reusing existing Access App:", app["id"])
@@ -150,10 +334,31 @@ def create_access_app(email: str, subdomain: str) -> dict[str, Any]:
         "app_launcher_visible": False
     }
 
-    print("[DEBUG] Creating Access App:", app_payload)
-
-    create_resp = requests.post(app_url, json=app_payload, headers=headers, timeout=30)
-    print("[DEBUG] Access App creation response:", create_resp.status_code, create_resp.text)
+    name, include = None, []
+    if team and not policy_id:
+        if not GITHUB_IDP_ID:
+            raise RuntimeError("CLOUDFLARE_GITHUB_IDP_ID is required for team policies")
+        name, include = team_policy_name(team), [_build_team_rule(team)]
+    elif REUSABLE_POLICIES and not policy_id:
+        name, include = email_policy_name(email), [_build_email_rule(email)]
+
+    if policy_id or name:
+        app_payload["policies"] = [
+            {"id": policy_id or get_or_create_policy(name, include), "precedence": 1}
+        ]
+        create_resp = _create_app(app_url, app_payload)
+        if not create_resp.ok and name and create_resp.status_code < 500:
+            # The cached policy may have been deleted out of band.
+            _policy_ids.pop(name, None)
+            app_payload["policies"] = [
+                {"id": get_or_create_policy(name, include), "precedence": 1}
+            ]
+            create_resp = _create_app(app_url, app_payload)
+        if not create_resp.ok:
+            raise RuntimeError(f"Failed to create Access App: {create_resp.text}")
+        return create_resp.json()
+
+    create_resp = _create_app(app_url, app_payload)
 
     if not create_resp.ok:
         raise RuntimeError(f"Failed to create Access App: {create_resp.text}")
@@ -177,7 +382,7 @@ def create_access_app(email: str, subdomain: str) -> dict[str, Any]:
 
     print("[DEBUG] Attaching Access Policy:", policy_payload)
 
-    policy_resp = requests.post(policy_url, json=policy_payload, headers=headers, timeout=30)
+    policy_resp = _request("access", "POST", policy_url, json=policy_payload)
     print("[DEBUG] Access Policy response:", policy_resp.status_code, policy_resp.text)
 
     if not policy_resp.ok:
@@ -188,13 +393,18 @@ def create_access_app(email: str, subdomain: str) -> dict[str, Any]:
 
 def delete_access_app(app_id: str) -> None:
     url = f"{ACCOUNT_BASE}/access/apps/{app_id}"
-    resp = requests.delete(url, headers=_headers(), timeout=30)
+    resp = _request("access", "DELETE", url)
     resp.raise_for_status()
 
 
 def rotate_host_key(tunnel_id: str) -> None:
     """Trigger host key rotation via Cloudflare API."""
     url = f"{ACCOUNT_BASE}/tunnels/{tunnel_id}/hostkey/rotate"
-    resp = requests.post(url, headers=_headers(), timeout=30)
+    resp = _request("tunnels", "POST", url)
     resp.raise_for_status()
 
+
+def delete_tunnel(tunnel_id: str) -> None:
+    url = f"{ACCOUNT_BASE}/tunnels/{tunnel_id}"
+    resp = _request("tunnels", "DELETE", url)
+    resp.raise_for_status()
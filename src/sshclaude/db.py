@@ -1,22 +1,126 @@
 from __future__ import annotations
 
+import math
 import os
+import random
+import threading
+import time
 from contextlib import contextmanager
 from datetime import datetime
-from typing import Generator
+from typing import Any, Callable, Generator, Iterable, Optional
 
-from sqlalchemy import (Boolean, Column, DateTime, Integer, String,
-                        create_engine)
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Integer,
+    String,
+    create_engine,
+    inspect,
+    text,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+
+from .sessions import SESSION_STORE_URL, create_store
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sshclaude.db")
-engine = create_engine(
-    DATABASE_URL,
-    connect_args=(
-        {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+# Comma-separated read replicas. A replica is used only while its measured
+# replication lag is under DATABASE_REPLICA_MAX_LAG seconds, and a key is
+# read from it only once the replica has replayed the key's last write.
+DATABASE_REPLICA_URLS = [
+    url.strip()
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+DATABASE_REPLICA_MAX_LAG = float(os.getenv("DATABASE_REPLICA_MAX_LAG", "5"))
+# How long a replica's lag measurement is reused.
+DATABASE_REPLICA_LAG_CHECK = float(os.getenv("DATABASE_REPLICA_LAG_CHECK", "1"))
+
+
+def _create_engine(url: str):
+    return create_engine(
+        url,
+        connect_args=({"check_same_thread": False} if url.startswith("sqlite") else {}),
+    )
+
+
+engine = _create_engine(DATABASE_URL)
+replica_engines = [_create_engine(url) for url in DATABASE_REPLICA_URLS]
+
+
+class RoutingSession(Session):
+    """Session that sends read-only work to the replica chosen for it."""
+
+    def get_bind(self, mapper=None, **kw):
+        if "replica" in self.info and not self._flushing:
+            return self.info["replica"]
+        return super().get_bind(mapper, **kw)
+
+
+SessionLocal = sessionmaker(bind=engine, class_=RoutingSession)
+
+# Seconds a replica is behind the primary, by dialect. Zero when it has
+# replayed everything it received, since the last replayed transaction
+# can be old on an idle primary.
+_LAG_QUERIES = {
+    "postgresql": text(
+        "SELECT CASE"
+        " WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+        " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
     ),
-)
-SessionLocal = sessionmaker(bind=engine)
+}
+_lag_lock = threading.Lock()
+_replica_lags: dict[Any, tuple[float, Optional[tuple[float, float]]]] = {}
+
+# When each key was last written, shared by every worker through the
+# session store backend so a read served by another worker still sees it.
+_write_markers = create_store(SESSION_STORE_URL, prefix="sshclaude:written:")
+_WRITE_MARKER_TTL = max(1, math.ceil(DATABASE_REPLICA_MAX_LAG))
+
+
+def replica_lag(replica) -> Optional[tuple[float, float]]:
+    """``(time measured, seconds behind)`` for ``replica``; None if unreachable."""
+    now = time.monotonic()
+    with _lag_lock:
+        cached = _replica_lags.get(replica)
+    if cached and now - cached[0] < DATABASE_REPLICA_LAG_CHECK:
+        return cached[1]
+    measured: Optional[tuple[float, float]] = (time.time(), 0.0)
+    query = _LAG_QUERIES.get(replica.dialect.name)
+    if query is not None:
+        try:
+            with replica.connect() as conn:
+                measured = (time.time(), float(conn.execute(query).scalar() or 0))
+        except SQLAlchemyError as e:
+            print("[WARN] Could not measure replica lag:", e)
+            measured = None
+    with _lag_lock:
+        _replica_lags[replica] = (now, measured)
+    return measured
+
+
+def _mark_written(key: str) -> None:
+    _write_markers.put(key, {"at": time.time()}, ttl=_WRITE_MARKER_TTL)
+
+
+def _pick_replica(key: Optional[str]):
+    """A replica fresh enough to serve ``key``, or None for the primary."""
+    marker = _write_markers.get(key) if key is not None else None
+    written_at = marker["at"] if marker else None
+    fresh = []
+    for replica in replica_engines:
+        measured = replica_lag(replica)
+        if measured is None or measured[1] > DATABASE_REPLICA_MAX_LAG:
+            continue
+        replayed_until = measured[0] - measured[1]
+        if written_at is not None and replayed_until <= written_at:
+            continue  # may not have replayed the key's last write yet
+        fresh.append(replica)
+    return random.choice(fresh) if fresh else None
+
 
 Base = declarative_base()
 
@@ -41,6 +145,9 @@ class LoginEvent(Base):
     user = Column(String, nullable=False)
     ip = Column(String, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    # Filled from the local IP range database (see geoip.py), if configured.
+    country = Column(String, nullable=True)
+    asn = Column(String, nullable=True)
 
 
 class LoginSession(Base):
@@ -55,14 +162,150 @@ class LoginSession(Base):
     github_login = Column(String, nullable=True)
 
 
+class ResourceVersion(Base):
+    """Per-subdomain change counter used as a cheap HTTP cache validator."""
+
+    __tablename__ = "resource_versions"
+
+    subdomain = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class RotationJob(Base):
+    __tablename__ = "rotation_jobs"
+
+    id = Column(String, primary_key=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class RotationTask(Base):
+    __tablename__ = "rotation_tasks"
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String, index=True, nullable=False)
+    subdomain = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    error = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+_DIALECT_INSERTS: dict[str, Callable] = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def _upsert_insert(db: Session, model: Any) -> Optional[Callable]:
+    """Return the dialect's INSERT construct supporting ON CONFLICT, if any."""
+    return _DIALECT_INSERTS.get(db.get_bind(mapper=model.__mapper__).dialect.name)
+
+
+def bulk_upsert_provisions(db: Session, rows: list[dict[str, Any]]) -> None:
+    """Insert provisions or update them by ``subdomain`` in a single statement.
+
+    The owning ``github_id`` of an existing row is kept. Rows are not
+    committed; callers commit together with any related writes.
+    """
+    rows = list({row["subdomain"]: row for row in rows}.values())
+    if not rows:
+        return
+    insert = _upsert_insert(db, Provision)
+    if insert is None:
+        for row in rows:
+            existing = db.query(Provision).filter_by(subdomain=row["subdomain"]).first()
+            if existing:
+                for k, v in row.items():
+                    if k not in ("subdomain", "github_id"):
+                        setattr(existing, k, v)
+            else:
+                db.add(Provision(**row))
+        return
+    stmt = insert(Provision).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Provision.subdomain],
+        set_={
+            k: stmt.excluded[k] for k in rows[0] if k not in ("subdomain", "github_id")
+        },
+    )
+    db.execute(stmt)
+
+
+def upsert_provision(db: Session, **values: Any) -> None:
+    bulk_upsert_provisions(db, [values])
+
+
+def bump_versions(db: Session, subdomains: Iterable[str]) -> None:
+    """Increment the versions of ``subdomains`` as part of the caller's transaction."""
+    now = datetime.utcnow()
+    subdomains = list(dict.fromkeys(subdomains))
+    if not subdomains:
+        return
+    insert = _upsert_insert(db, ResourceVersion)
+    if insert is None:
+        for subdomain in subdomains:
+            result = db.execute(
+                update(ResourceVersion)
+                .where(ResourceVersion.subdomain == subdomain)
+                .values(version=ResourceVersion.version + 1, updated_at=now)
+            )
+            if result.rowcount == 0:
+                db.add(ResourceVersion(subdomain=subdomain, version=1, updated_at=now))
+        return
+    stmt = insert(ResourceVersion).values(
+        [{"subdomain": s, "version": 1, "updated_at": now} for s in subdomains]
+    )
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ResourceVersion.subdomain],
+            set_={
+                "version": ResourceVersion.version + 1,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+    )
+
+
+def bump_version(db: Session, subdomain: str) -> None:
+    bump_versions(db, [subdomain])
+
+
+def get_version(db: Session, subdomain: str) -> Optional[ResourceVersion]:
+    return db.get(ResourceVersion, subdomain)
+
+
+def _add_missing_columns(table) -> None:
+    """Add nullable columns introduced after ``table`` was first created."""
+    existing = {c["name"] for c in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                type_ = column.type.compile(dialect=engine.dialect)
+                conn.execute(
+                    text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {type_}")
+                )
+
+
 def init_db() -> None:
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns(LoginEvent.__table__)
 
 
 @contextmanager
-def get_session() -> Generator:
-    session = SessionLocal()
+def get_session(read_only: bool = False, key: Optional[str] = None) -> Generator:
+    """Yield a database session.
+
+    ``read_only`` sessions may be served by a replica. Pass the ``key`` a
+    route reads or writes (e.g. the subdomain) so that a read following a
+    write to the same key, in any worker, waits for a replica that has
+    replayed it or goes to the primary.
+    """
+    replica = _pick_replica(key) if read_only and replica_engines else None
+    session = SessionLocal(info={} if replica is None else {"replica": replica})
     try:
         yield session
     finally:
         session.close()
+        if not read_only and key is not None and replica_engines:
+            _mark_written(key)
@@ -0,0 +1,523 @@
+"""Health checks and latency probes for ``sshclaude doctor``.
+
+A browser keystroke travels browser -> Cloudflare edge -> cloudflared ->
+ttyd -> Claude and back. The local end can be probed here:
+
+* ttyd: TCP connect to the port, then a WebSocket on ``/ws`` (subprotocol
+  ``tty``). It waits for the token prompt, times single-key echo round trips
+  and measures echo throughput. Nothing is ever submitted, so no Claude
+  session is started.
+* cloudflared: its Prometheus ``/metrics`` endpoint, for edge connections,
+  request and error counts, heartbeat retries and proxy connect latency.
+* the provisioning API: DNS, connect, TLS and time to first byte for
+  ``/health`` and the login status poll ``init`` uses, read for a session
+  that does not exist. ``POST /login`` creates a real login session, so it
+  is timed only on request.
+
+Only the standard library is used so that ``doctor`` starts quickly and the
+timings carry no HTTP library overhead.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import http.client
+import json
+import math
+import os
+import re
+import socket
+import ssl
+import statistics
+import struct
+import time
+from typing import Any, BinaryIO, Iterable, Optional
+from urllib.parse import urlsplit
+
+TTYD_PORT = 7681
+# cloudflared binds the first free port of this range unless --metrics is set.
+METRICS_ADDRESSES = [f"127.0.0.1:{port}" for port in range(20241, 20246)]
+
+_WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 1, 2, 8, 9, 10
+# ttyd message types, sent as the first byte of each frame.
+TTYD_INPUT = TTYD_OUTPUT = b"0"
+KILL_LINE = b"\x15"  # Ctrl-U clears the unsubmitted token line
+# Login session polled when no real one is created; the API answers 404.
+PROBE_UID = "doctor-probe"
+# What a probe can raise for an unreachable or misbehaving HTTP hop.
+HTTP_ERRORS = (OSError, ValueError, http.client.HTTPException)
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+def _summary(samples: list[float]) -> dict[str, float]:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+    return {
+        "p50": _ms(statistics.median(ordered)),
+        "p95": _ms(p95),
+        "min": _ms(ordered[0]),
+        "max": _ms(ordered[-1]),
+    }
+
+
+def _mask(payload: bytes, key: bytes) -> bytes:
+    if not payload:
+        return payload
+    stream = (key * (len(payload) // 4 + 1))[: len(payload)]
+    masked = int.from_bytes(payload, "big") ^ int.from_bytes(stream, "big")
+    return masked.to_bytes(len(payload), "big")
+
+
+def encode_frame(opcode: int, payload: bytes, masked: bool = True) -> bytes:
+    """One final WebSocket frame; clients must mask, servers must not."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack(">BB", 0x80 | opcode, length | (masked << 7))
+    elif length < 1 << 16:
+        header = struct.pack(">BBH", 0x80 | opcode, 126 | (masked << 7), length)
+    else:
+        header = struct.pack(">BBQ", 0x80 | opcode, 127 | (masked << 7), length)
+    if not masked:
+        return header + payload
+    key = os.urandom(4)
+    return header + key + _mask(payload, key)
+
+
+def read_frame(stream: BinaryIO) -> tuple[int, bool, bytes]:
+    """``(opcode, fin, payload)`` of the next frame on ``stream``."""
+
+    def exactly(n: int) -> bytes:
+        data = stream.read(n)
+        if data is None or len(data) < n:
+            raise ConnectionError("connection closed mid-frame")
+        return data
+
+    first, second = exactly(2)
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack(">H", exactly(2))
+    elif length == 127:
+        (length,) = struct.unpack(">Q", exactly(8))
+    key = exactly(4) if second & 0x80 else None
+    payload = exactly(length)
+    return first & 0x0F, bool(first & 0x80), _mask(payload, key) if key else payload
+
+
+class WebSocket:
+    """Blocking WebSocket client, just enough to drive ttyd."""
+
+    def __init__(
+        self, host: str, port: int, path: str, protocol: str, timeout: float
+    ) -> None:
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._stream = self.sock.makefile("rb")
+        try:
+            self._handshake(host, port, path, protocol)
+        except OSError:
+            self._stream.close()
+            self.sock.close()
+            raise
+
+    def _handshake(self, host: str, port: int, path: str, protocol: str) -> None:
+        key = base64.b64encode(os.urandom(16))
+        self.sock.sendall(
+            f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+            "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key.decode()}\r\nSec-WebSocket-Version: 13\r\n"
+            f"Sec-WebSocket-Protocol: {protocol}\r\n\r\n".encode()
+        )
+        status = self._stream.readline()
+        headers = {}
+        for line in iter(self._stream.readline, b"\r\n"):
+            if not line:
+                raise ConnectionError("connection closed during handshake")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if b" 101 " not in status:
+            raise ConnectionError(f"handshake refused: {status.decode().strip()}")
+        expected = base64.b64encode(hashlib.sha1(key + _WS_GUID).digest()).decode()
+        if headers.get("sec-websocket-accept") != expected:
+            raise ConnectionError("bad Sec-WebSocket-Accept")
+
+    def send(self, payload: bytes, opcode: int = OP_BINARY) -> None:
+        self.sock.sendall(encode_frame(opcode, payload))
+
+    def recv(self) -> bytes:
+        """Payload of the next data message, answering pings on the way."""
+        message = b""
+        while True:
+            opcode, fin, payload = read_frame(self._stream)
+            if opcode == OP_PING:
+                self.send(payload, OP_PONG)
+                continue
+            if opcode == OP_CLOSE:
+                raise ConnectionError("closed by server")
+            if opcode == OP_PONG:
+                continue
+            message += payload
+            if fin:
+                return message
+
+    def close(self) -> None:
+        try:
+            self.send(struct.pack(">H", 1000), OP_CLOSE)
+        except OSError:
+            pass
+        self._stream.close()
+        self.sock.close()
+
+
+def check_port(host: str, port: int, timeout: float = 2.0) -> dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        socket.create_connection((host, port), timeout).close()
+    except OSError as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "connect_ms": _ms(time.perf_counter() - start)}
+
+
+class _Terminal:
+    """Output side of a ttyd session, read until an expected byte count."""
+
+    def __init__(self, ws: WebSocket) -> None:
+        self.ws = ws
+        self.buffer = b""
+
+    def read_until(self, predicate) -> None:
+        while not predicate(self.buffer):
+            message = self.ws.recv()
+            if message[:1] == TTYD_OUTPUT:
+                self.buffer += message[1:]
+
+    def wait_for(self, data: bytes) -> None:
+        self.read_until(lambda buf: data in buf)
+        self.buffer = self.buffer.split(data, 1)[1]
+
+    def wait_for_count(self, byte: bytes, count: int) -> None:
+        self.read_until(lambda buf: buf.count(byte) >= count)
+        self.buffer = b""
+
+
+def probe_ttyd(
+    host: str = "127.0.0.1",
+    port: int = TTYD_PORT,
+    samples: int = 20,
+    throughput_bytes: int = 64 * 1024,
+    timeout: float = 5.0,
+) -> dict[str, Any]:
+    """Round trip and echo throughput of keystrokes through ttyd's WebSocket."""
+    start = time.perf_counter()
+    try:
+        ws = WebSocket(host, port, "/ws", "tty", timeout)
+    except OSError as e:
+        return {"ok": False, "error": str(e)}
+    result: dict[str, Any] = {"ok": True}
+    result["handshake_ms"] = _ms(time.perf_counter() - start)
+    term = _Terminal(ws)
+    try:
+        ws.send(json.dumps({"AuthToken": "", "columns": 80, "rows": 24}).encode())
+        term.read_until(bool)  # the guard's token prompt
+        result["first_output_ms"] = _ms(time.perf_counter() - start)
+
+        rtts = []
+        for _ in range(samples):
+            sent = time.perf_counter()
+            ws.send(TTYD_INPUT + b"x")
+            term.wait_for(b"x")
+            rtts.append(time.perf_counter() - sent)
+        ws.send(TTYD_INPUT + KILL_LINE)
+        result["rtt_ms"] = _summary(rtts)
+
+        # The terminal line holds at most 4 KiB, so echo in cleared chunks.
+        chunk = 1024
+        chunks = max(1, throughput_bytes // chunk)
+        sent = time.perf_counter()
+        for _ in range(chunks):
+            ws.send(TTYD_INPUT + b"y" * chunk)
+            term.wait_for_count(b"y", chunk)
+            ws.send(TTYD_INPUT + KILL_LINE)
+        elapsed = time.perf_counter() - sent
+        result["echo_kib_s"] = round(chunks * chunk / 1024 / elapsed, 1)
+    except (OSError, ValueError) as e:
+        result.update(ok=False, error=str(e))
+    finally:
+        ws.close()
+    return result
+
+
+_SAMPLE = re.compile(r"^([a-zA-Z_:][\w:]*)(\{(.*)\})?\s+(\S+)")
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_prometheus(text: str) -> dict[str, list[tuple[dict[str, str], float]]]:
+    """Samples of a Prometheus text exposition, by metric name."""
+    metrics: dict[str, list[tuple[dict[str, str], float]]] = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if not match or line.startswith("#"):
+            continue
+        name, _, labels, value = match.groups()
+        try:
+            number = float(value)
+        except ValueError:
+            continue
+        metrics.setdefault(name, []).append(
+            (dict(_LABEL.findall(labels or "")), number)
+        )
+    return metrics
+
+
+def histogram_quantile(q: float, buckets: Iterable[tuple[float, float]]) -> float:
+    """Estimate quantile ``q`` from cumulative ``(upper bound, count)`` buckets."""
+    ordered = sorted(buckets)
+    if not ordered or ordered[-1][1] == 0:
+        return math.nan
+    rank = q * ordered[-1][1]
+    lower, below = 0.0, 0.0
+    for upper, count in ordered:
+        if count >= rank:
+            if math.isinf(upper):
+                return lower
+            if count == below:
+                return upper
+            return lower + (upper - lower) * (rank - below) / (count - below)
+        lower, below = upper, count
+    return lower
+
+
+def summarize_metrics(
+    metrics: dict[str, list[tuple[dict[str, str], float]]],
+) -> dict[str, Any]:
+    def total(name: str) -> Optional[float]:
+        samples = metrics.get(name)
+        return sum(value for _, value in samples) if samples else None
+
+    summary: dict[str, Any] = {
+        "ha_connections": total("cloudflared_tunnel_ha_connections"),
+        "total_requests": total("cloudflared_tunnel_total_requests"),
+        "request_errors": total("cloudflared_tunnel_request_errors"),
+        "heartbeat_retries": total("cloudflared_tunnel_timer_retries"),
+    }
+    latency = "cloudflared_proxy_connect_latency"
+    buckets: dict[float, float] = {}
+    for labels, value in metrics.get(f"{latency}_bucket", []):
+        bound = float(labels.get("le", "+Inf"))
+        buckets[bound] = buckets.get(bound, 0.0) + value
+    count = total(f"{latency}_count")
+    if buckets and count:
+        summary["connect_latency_ms"] = {
+            "mean": round(total(f"{latency}_sum") / count, 2),
+            "p50": round(histogram_quantile(0.5, buckets.items()), 2),
+            "p95": round(histogram_quantile(0.95, buckets.items()), 2),
+        }
+    return summary
+
+
+def probe_cloudflared(
+    addresses: Iterable[str] = METRICS_ADDRESSES, timeout: float = 2.0
+) -> dict[str, Any]:
+    """Scrape the first reachable cloudflared metrics endpoint."""
+    tried, error = [], "no metrics address"
+    for address in addresses:
+        host, _, port = address.rpartition(":")
+        try:
+            timing = timed_request(f"http://{host}:{port}", "GET", "/metrics", timeout)
+        except HTTP_ERRORS as e:
+            tried.append(address)
+            error = str(e)
+            continue
+        if timing["status"] != 200:
+            tried.append(address)
+            error = f"HTTP {timing['status']}"
+            continue
+        text = timing.pop("body").decode("utf-8", "replace")
+        summary = summarize_metrics(parse_prometheus(text))
+        ok = bool(summary["ha_connections"])
+        return {
+            "ok": ok,
+            "address": address,
+            "scrape_ms": timing["total_ms"],
+            **summary,
+        }
+    if tried:
+        error = f"no metrics at {', '.join(tried)} ({error})"
+    return {"ok": False, "error": error}
+
+
+def timed_request(
+    base_url: str,
+    method: str,
+    path: str,
+    timeout: float = 10.0,
+    body: Optional[bytes] = None,
+) -> dict[str, Any]:
+    """Send one request on a fresh connection, timing each phase."""
+    url = urlsplit(base_url)
+    secure = url.scheme == "https"
+    port = url.port or (443 if secure else 80)
+    start = time.perf_counter()
+    addr = socket.getaddrinfo(url.hostname, port, type=socket.SOCK_STREAM)[0][4]
+    resolved = time.perf_counter()
+    sock = socket.create_connection(addr[:2], timeout)
+    connected = time.perf_counter()
+    if secure:
+        context = ssl.create_default_context()
+        sock = context.wrap_socket(sock, server_hostname=url.hostname)
+    handshaken = time.perf_counter()
+    conn = http.client.HTTPConnection(url.hostname, port, timeout=timeout)
+    conn.sock = sock
+    try:
+        headers = {"Host": url.netloc}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        conn.request(method, url.path.rstrip("/") + path, body=body, headers=headers)
+        resp = conn.getresponse()
+        first_byte = time.perf_counter()
+        data = resp.read()
+    finally:
+        conn.close()
+    done = time.perf_counter()
+    return {
+        "status": resp.status,
+        "dns_ms": _ms(resolved - start),
+        "connect_ms": _ms(connected - resolved),
+        "tls_ms": _ms(handshaken - connected),
+        "ttfb_ms": _ms(first_byte - handshaken),
+        "total_ms": _ms(done - start),
+        "body": data,
+    }
+
+
+def _phases(timings: list[dict[str, Any]], expected: int = 200) -> dict[str, Any]:
+    phases = ("dns_ms", "connect_ms", "tls_ms", "ttfb_ms", "total_ms")
+    result = {
+        phase: round(statistics.median(t[phase] for t in timings), 2)
+        for phase in phases
+    }
+    result["status"] = timings[-1]["status"]
+    result["ok"] = all(t["status"] == expected for t in timings)
+    return result
+
+
+def probe_api(
+    api_url: str, samples: int = 5, timeout: float = 10.0, login: bool = False
+) -> dict[str, Any]:
+    """Time the API calls ``init`` depends on, median of ``samples`` each.
+
+    With ``login``, one real login session is created and polled; otherwise
+    the status poll is timed for :data:`PROBE_UID`, which does not exist.
+    """
+    results: dict[str, Any] = {}
+    try:
+        health = [timed_request(api_url, "GET", "/health", timeout)]
+        health += [
+            timed_request(api_url, "GET", "/health", timeout)
+            for _ in range(samples - 1)
+        ]
+        results["health"] = _phases(health)
+        uid, expected = PROBE_UID, 404
+        if login:
+            # One login session only; the API rate-limits them.
+            created = timed_request(api_url, "POST", "/login", timeout, body=b"")
+            results["login"] = _phases([created])
+            if created["status"] == 200:
+                uid = json.loads(created["body"])["url"].rsplit("/", 1)[-1]
+                expected = 200
+        path = f"/login/{uid}/status?wait=0"
+        results["login_status"] = _phases(
+            [timed_request(api_url, "GET", path, timeout) for _ in range(samples)],
+            expected,
+        )
+    except (*HTTP_ERRORS, KeyError) as e:
+        results["error"] = str(e) or type(e).__name__
+    results["ok"] = "error" not in results and all(
+        r["ok"] for r in results.values() if isinstance(r, dict)
+    )
+    return results
+
+
+def run(
+    api_url: str,
+    bench: bool = False,
+    samples: int = 20,
+    ttyd_port: int = TTYD_PORT,
+    metrics_addresses: Iterable[str] = METRICS_ADDRESSES,
+    login: bool = False,
+) -> dict[str, Any]:
+    """Full report; without ``bench`` only reachability is checked."""
+    report: dict[str, Any] = {"time": int(time.time()), "bench": bench}
+    report["ttyd_port"] = {"port": ttyd_port, **check_port("127.0.0.1", ttyd_port)}
+    if bench and report["ttyd_port"]["ok"]:
+        report["ttyd"] = probe_ttyd(port=ttyd_port, samples=samples)
+    report["cloudflared"] = probe_cloudflared(metrics_addresses)
+    if bench:
+        report["api"] = probe_api(api_url, samples=max(1, samples // 4), login=login)
+    else:
+        try:
+            timing = timed_request(api_url, "GET", "/health")
+            report["api"] = {"health": _phases([timing]), "ok": timing["status"] == 200}
+        except HTTP_ERRORS as e:
+            report["api"] = {"ok": False, "error": str(e) or type(e).__name__}
+    report["ok"] = all(
+        part.get("ok", True) for part in report.values() if isinstance(part, dict)
+    )
+    return report
+
+
+def format_report(report: dict[str, Any]) -> list[tuple[str, str, bool]]:
+    """``(hop, detail, ok)`` rows, ordered from the browser's side inwards."""
+    rows = []
+    api = report.get("api", {})
+    for name in ("health", "login", "login_status"):
+        if name in api:
+            t = api[name]
+            rows.append(
+                (
+                    f"api {name}",
+                    f"dns {t['dns_ms']} / connect {t['connect_ms']} / tls "
+                    f"{t['tls_ms']} / ttfb {t['ttfb_ms']} = {t['total_ms']} ms "
+                    f"(HTTP {t['status']})",
+                    t["ok"],
+                )
+            )
+    if "error" in api:
+        rows.append(("api", api["error"], False))
+
+    cf = report["cloudflared"]
+    if cf["ok"] or "address" in cf:
+        detail = (
+            f"{cf['ha_connections'] or 0:.0f} edge connections, "
+            f"{cf['total_requests'] or 0:.0f} requests, "
+            f"{cf['request_errors'] or 0:.0f} errors, "
+            f"{cf['heartbeat_retries'] or 0:.0f} heartbeat retries"
+        )
+        latency = cf.get("connect_latency_ms")
+        if latency:
+            detail += f"; connect p50 {latency['p50']} p95 {latency['p95']} ms"
+        rows.append((f"cloudflared {cf['address']}", detail, cf["ok"]))
+    else:
+        rows.append(("cloudflared metrics", cf["error"], False))
+
+    port = report["ttyd_port"]
+    detail = f"connect {port['connect_ms']} ms" if port["ok"] else port["error"]
+    rows.append((f"ttyd :{port['port']}", detail, port["ok"]))
+    ttyd = report.get("ttyd")
+    if ttyd and ttyd["ok"]:
+        rtt = ttyd["rtt_ms"]
+        rows.append(
+            (
+                "ttyd websocket",
+                f"handshake {ttyd['handshake_ms']} ms, key echo p50 {rtt['p50']} "
+                f"p95 {rtt['p95']} ms, echo {ttyd['echo_kib_s']} KiB/s",
+                True,
+            )
+        )
+    elif ttyd:
+        rows.append(("ttyd websocket", ttyd["error"], False))
+    return rows
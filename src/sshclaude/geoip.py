@@ -0,0 +1,186 @@
+"""Country/ASN enrichment of login IPs from a local range database.
+
+A CSV of ``start,end,country,asn`` ranges is compiled once into a binary
+index: a header, fixed-size records sorted by range start and a JSON table
+of labels. Addresses are stored as 16 big-endian bytes (IPv4 mapped into
+``::ffff:0:0/96``), so the file is memory-mapped and binary searched by
+comparing raw bytes, with an LRU cache in front for repeated addresses.
+
+File layout::
+
+    MAGIC  version:u32  records:u32  labels_offset:u64
+    records * (start:16s  end:16s  label:u32)
+    labels (JSON list of [country, asn])
+"""
+
+from __future__ import annotations
+
+import bisect
+import csv
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Optional
+
+import click
+
+IPDB_PATH = os.getenv("SSHCLAUDE_IPDB", "")
+IPDB_CACHE_SIZE = int(os.getenv("SSHCLAUDE_IPDB_CACHE", "65536"))
+
+MAGIC = b"SSHCIPDB"
+VERSION = 1
+_HEADER = struct.Struct(f">{len(MAGIC)}sIIQ")
+_RECORD = struct.Struct(">16s16sI")
+
+
+def _key(ip: str) -> bytes:
+    """16-byte big-endian form of ``ip``; raises ValueError if invalid."""
+    addr = ipaddress.ip_address(ip.strip())
+    if addr.version == 4:
+        return b"\x00" * 10 + b"\xff\xff" + addr.packed
+    return addr.packed
+
+
+class _Starts:
+    """Sequence view of the record start keys, for :mod:`bisect`."""
+
+    def __init__(self, buf: mmap.mmap, offset: int, count: int) -> None:
+        self._buf = buf
+        self._offset = offset
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> bytes:
+        start = self._offset + i * _RECORD.size
+        end = start + 16
+        return self._buf[start:end]
+
+
+class IPDatabase:
+    """Read-only view of a compiled range index."""
+
+    def __init__(self, path: str, cache_size: int = IPDB_CACHE_SIZE) -> None:
+        with open(path, "rb") as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, labels_offset = _HEADER.unpack_from(self._buf)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a compiled sshclaude IP database")
+        self._count = count
+        self._starts = _Starts(self._buf, _HEADER.size, count)
+        self._labels = [tuple(label) for label in json.loads(self._buf[labels_offset:])]
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _lookup(self, ip: str) -> Optional[tuple[str, str]]:
+        """Return ``(country, asn)`` for ``ip``, or None if no range covers it."""
+        try:
+            key = _key(ip)
+        except ValueError:
+            return None
+        i = bisect.bisect_right(self._starts, key) - 1
+        if i < 0:
+            return None
+        _, end, label = _RECORD.unpack_from(self._buf, _HEADER.size + i * _RECORD.size)
+        return self._labels[label] if key <= end else None
+
+    def close(self) -> None:
+        self._buf.close()
+
+
+def compile_ranges(rows: Iterable[Iterable[str]], dst: Path) -> int:
+    """Write the index for ``(start, end, country, asn)`` rows to ``dst``.
+
+    Ranges must not overlap; a lookup only checks the range starting
+    closest below the address.
+    """
+    labels: dict[tuple[str, str], int] = {}
+    records = []
+    for row in rows:
+        start, end, country, asn = (field.strip() for field in list(row)[:4])
+        label = labels.setdefault((country, asn), len(labels))
+        records.append((_key(start), _key(end), label))
+    records.sort()
+
+    tmp = dst.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        labels_offset = _HEADER.size + len(records) * _RECORD.size
+        f.write(_HEADER.pack(MAGIC, VERSION, len(records), labels_offset))
+        for record in records:
+            f.write(_RECORD.pack(*record))
+        f.write(json.dumps(list(labels)).encode())
+    tmp.replace(dst)
+    return len(records)
+
+
+def _read_csv(src: Path) -> Iterable[list[str]]:
+    with open(src, newline="") as f:
+        for row in csv.reader(f):
+            if row and not row[0].startswith("#") and row[0].strip() != "start":
+                yield row
+
+
+_db: Optional[IPDatabase] = None
+_db_loaded = False
+_db_lock = threading.Lock()
+
+
+def database() -> Optional[IPDatabase]:
+    """The database at ``SSHCLAUDE_IPDB``, opened on first use."""
+    global _db, _db_loaded
+    if not _db_loaded:
+        with _db_lock:
+            if not _db_loaded and IPDB_PATH:
+                try:
+                    _db = IPDatabase(IPDB_PATH)
+                except (OSError, ValueError) as e:
+                    print("[WARN] IP enrichment disabled:", e)
+            _db_loaded = True
+    return _db
+
+
+def enrich(ip: str) -> dict[str, Optional[str]]:
+    """``country`` and ``asn`` columns for a login from ``ip``."""
+    db = database()
+    found = db.lookup(ip) if db is not None else None
+    country, asn = found or (None, None)
+    return {"country": country, "asn": asn}
+
+
+@click.group()
+def main() -> None:
+    """Manage the local IP range database used to enrich login history."""
+
+
+@main.command("compile")
+@click.argument("src", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.argument("dst", type=click.Path(dir_okay=False, path_type=Path))
+def compile_command(src: Path, dst: Path) -> None:
+    """Compile a start,end,country,asn CSV into an index file."""
+    count = compile_ranges(_read_csv(src), dst)
+    print(f"[INFO] Wrote {count} ranges to {dst}")
+
+
+@main.command()
+@click.argument("ips", nargs=-1, required=True)
+@click.option(
+    "--db",
+    "path",
+    default=IPDB_PATH or None,
+    required=True,
+    help="Compiled index file.",
+)
+def lookup(ips: tuple[str, ...], path: str) -> None:
+    """Print the country and ASN of each IP."""
+    db = IPDatabase(path)
+    for ip in ips:
+        country, asn = db.lookup(ip) or ("-", "-")
+        print(f"{ip}\t{country}\t{asn}")
@@ -0,0 +1,128 @@
+"""GitHub OAuth client used by the login callback."""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+GITHUB_API = "https://api.github.com"
+TOKEN_URL = "https://github.com/login/oauth/access_token"
+
+# A user's email list is served from cache for PROFILE_CACHE_TTL seconds,
+# then revalidated with If-None-Match until PROFILE_CACHE_MAX_AGE. It is
+# keyed by GitHub id because every OAuth login yields a new access token.
+PROFILE_CACHE_TTL = int(os.getenv("GITHUB_PROFILE_CACHE_TTL", "60"))
+PROFILE_CACHE_MAX_AGE = int(os.getenv("GITHUB_PROFILE_CACHE_MAX_AGE", "3600"))
+
+
+class GitHubError(RuntimeError):
+    """Raised when GitHub returns an unusable response."""
+
+
+@dataclass
+class GitHubIdentity:
+    id: str
+    login: str
+    email: Optional[str]
+
+
+@dataclass
+class _CachedEmails:
+    emails: list[dict[str, Any]]
+    etag: Optional[str]
+    fetched_at: float
+
+
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+_cache_lock = threading.Lock()
+_emails: dict[str, _CachedEmails] = {}
+
+
+def _primary_email(emails: list[dict[str, Any]]) -> Optional[str]:
+    return next(
+        (e["email"] for e in emails if e.get("primary") and e.get("verified")), None
+    )
+
+
+def _get(path: str, access_token: str, etag: Optional[str]) -> requests.Response:
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Accept": "application/vnd.github+json",
+    }
+    if etag:
+        headers["If-None-Match"] = etag
+    return _http.get(f"{GITHUB_API}{path}", headers=headers, timeout=10)
+
+
+def _cached(github_id: str) -> Optional[_CachedEmails]:
+    with _cache_lock:
+        cached = _emails.get(github_id)
+    if cached and time.monotonic() - cached.fetched_at < PROFILE_CACHE_MAX_AGE:
+        return cached
+    return None
+
+
+def _store(github_id: str, cached: _CachedEmails) -> None:
+    with _cache_lock:
+        for key in [
+            k
+            for k, c in _emails.items()
+            if cached.fetched_at - c.fetched_at >= PROFILE_CACHE_MAX_AGE
+        ]:
+            del _emails[key]
+        _emails[github_id] = cached
+
+
+def exchange_code(client_id: str, client_secret: str, code: str) -> str:
+    """Exchange an OAuth ``code`` for an access token."""
+    resp = _http.post(
+        TOKEN_URL,
+        headers={"Accept": "application/json"},
+        data={"client_id": client_id, "client_secret": client_secret, "code": code},
+        timeout=10,
+    )
+    resp.raise_for_status()
+    access_token = resp.json().get("access_token")
+    if not access_token:
+        raise GitHubError("No access token returned from GitHub")
+    return access_token
+
+
+def fetch_identity(access_token: str) -> GitHubIdentity:
+    """Return the user's id, login and primary verified email.
+
+    ``/user`` is always fetched since only it says whose token this is. The
+    email list is then taken from the cache for that id, revalidated with
+    its ETag so an unchanged list costs a 304 (which GitHub does not count
+    against the rate limit), or fetched in full.
+    """
+    user_resp = _get("/user", access_token, None)
+    if not user_resp.ok:
+        raise GitHubError(f"GitHub /user returned {user_resp.status_code}")
+    user = user_resp.json()
+    github_id = str(user.get("id"))
+
+    cached = _cached(github_id)
+    if cached and time.monotonic() - cached.fetched_at < PROFILE_CACHE_TTL:
+        emails = cached.emails
+    else:
+        emails_resp = _get("/user/emails", access_token, cached and cached.etag)
+        if cached and emails_resp.status_code == 304:
+            emails, etag = cached.emails, cached.etag
+        elif emails_resp.ok:
+            emails, etag = emails_resp.json(), emails_resp.headers.get("ETag")
+        else:
+            raise GitHubError(f"GitHub /user/emails returned {emails_resp.status_code}")
+        _store(github_id, _CachedEmails(emails, etag, time.monotonic()))
+
+    return GitHubIdentity(
+        id=github_id, login=user.get("login"), email=_primary_email(emails)
+    )
@@ -0,0 +1,360 @@
+"""Stream login events from Cloudflare Access and cloudflared logs.
+
+Each input (a file or ``-`` for stdin) is tailed by a reader thread that
+parses lines into ``LoginEvent`` rows and hands them over in chunks through
+a bounded queue, so slow database writes push back on the readers. The
+writer inserts batches in one transaction each and then checkpoints the
+file offsets they covered, so restarting does not replay committed lines.
+Both JSON lines (Access Logpush, ``cloudflared --logformat json``) and
+``key=value`` log lines are understood. Events are enriched with country
+and ASN from the local IP database (see ``geoip``) when one is configured.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator, Optional
+
+import click
+from sqlalchemy import insert
+
+from . import geoip
+from .db import LoginEvent, bump_versions, get_session, init_db
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - optional dependency
+    _loads = json.loads
+
+CHECKPOINT_FILE = Path.home() / ".sshclaude" / "ingest-checkpoint.json"
+
+FIELD_ALIASES = {
+    "subdomain": ("AppDomain", "host", "Host", "ClientRequestHost", "hostname"),
+    "user": (
+        "Email",
+        "UserEmail",
+        "email",
+        "user",
+        "Cf-Access-Authenticated-User-Email",
+    ),
+    "ip": ("IPAddress", "ClientIP", "ip", "clientIP", "remoteAddr"),
+    "timestamp": ("CreatedAt", "Datetime", "time", "timestamp", "ts"),
+}
+
+_LOGFMT = re.compile(r'([A-Za-z_][\w.-]*)=("(?:[^"\\]|\\.)*"|\S+)')
+
+
+def _first(record: dict[str, Any], field: str) -> Any:
+    for key in FIELD_ALIASES[field]:
+        value = record.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _parse_time(value: Any) -> datetime:
+    """Parse ISO-8601 strings or Unix epochs (s/ms/us/ns) into naive UTC."""
+    try:
+        if isinstance(value, (int, float)) or (
+            isinstance(value, str) and value.isdigit()
+        ):
+            epoch = float(value)
+            while epoch > 1e11:  # scale ns/us/ms down to seconds
+                epoch /= 1000
+            return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None)
+        if isinstance(value, str):
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+            return parsed
+    except (ValueError, OverflowError, OSError):
+        pass
+    return datetime.utcnow()
+
+
+def parse_line(
+    line: bytes, default_subdomain: Optional[str] = None
+) -> Optional[dict[str, Any]]:
+    """Turn one log line into ``LoginEvent`` column values, or None to skip it."""
+    line = line.strip()
+    if not line:
+        return None
+    if line[:1] == b"{":
+        try:
+            record = _loads(line)
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+    else:
+        text = line.decode("utf-8", "replace")
+        record = {k: v.strip('"') for k, v in _LOGFMT.findall(text)}
+
+    if str(record.get("Allowed", "")).lower() == "false":
+        return None
+    action = record.get("Action")
+    if action and str(action).lower() != "login":
+        return None
+
+    user = _first(record, "user")
+    ip = _first(record, "ip")
+    subdomain = _first(record, "subdomain") or default_subdomain
+    if not (user and ip and subdomain):
+        return None
+    return {
+        "subdomain": str(subdomain).split("/")[0].lower(),
+        "user": str(user),
+        "ip": str(ip),
+        "timestamp": _parse_time(_first(record, "timestamp")),
+    }
+
+
+def tail(
+    path: str,
+    offset: int = 0,
+    inode: Optional[int] = None,
+    follow: bool = False,
+    poll: float = 0.5,
+) -> Iterator[Optional[tuple[bytes, int, int]]]:
+    """Yield ``(line, inode, offset after line)`` from ``path``.
+
+    Only complete lines are yielded, so a line still being written is never
+    checkpointed. Resumes at ``offset`` when the file still has ``inode``.
+    With ``follow`` it keeps reading as the file grows, yields ``None`` while
+    idle and reopens the path after rotation (new inode) or truncation.
+    """
+    f: Optional[BinaryIO] = None
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(path, "rb")
+                except FileNotFoundError:
+                    if not follow:
+                        return
+                    yield None
+                    time.sleep(poll)
+                    continue
+                st = os.fstat(f.fileno())
+                if st.st_ino == inode and st.st_size >= offset:
+                    f.seek(offset)
+                else:
+                    offset = 0
+                inode = st.st_ino
+
+            line = f.readline()
+            if line.endswith(b"\n"):
+                offset += len(line)
+                yield line, inode, offset
+                continue
+            # Leave a partially written line for the next read (or next run).
+            f.seek(offset)
+            if not follow:
+                return
+
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                st = None
+            if st is not None and st.st_ino == inode and st.st_size < offset:
+                f.seek(0)  # truncated in place
+                offset = 0
+                continue
+            if st is not None and st.st_ino != inode:
+                # Rotated: drain what was appended to the old file, then switch.
+                for line in iter(f.readline, b""):
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    yield line, inode, offset
+                f.close()
+                f, inode, offset = None, None, 0
+                continue
+            yield None
+            time.sleep(poll)
+    finally:
+        if f is not None:
+            f.close()
+
+
+def _stdin_lines() -> Iterator[tuple[bytes, int, int]]:
+    for line in sys.stdin.buffer:
+        yield line, 0, 0
+
+
+def _reader(
+    path: str,
+    position: dict[str, int],
+    follow: bool,
+    default_subdomain: Optional[str],
+    out: queue.Queue,
+    chunk_size: int,
+) -> None:
+    """Parse ``path`` and put ``(path, inode, offset, events)`` chunks on ``out``."""
+    if path == "-":
+        lines: Iterator[Optional[tuple[bytes, int, int]]] = _stdin_lines()
+    else:
+        lines = tail(path, position.get("offset", 0), position.get("inode"), follow)
+    events: list[dict[str, Any]] = []
+    inode = offset = sent = 0
+    try:
+        for item in lines:
+            if item is not None:
+                line, inode, offset = item
+                event = parse_line(line, default_subdomain)
+                if event is not None:
+                    event.update(geoip.enrich(event["ip"]))
+                    events.append(event)
+                if len(events) < chunk_size:
+                    continue
+            if events or offset != sent:
+                # Blocks while the writer is behind.
+                out.put((path, inode, offset, events))
+                events, sent = [], offset
+        if events or offset != sent:
+            out.put((path, inode, offset, events))
+    finally:
+        out.put(None)
+
+
+def load_checkpoint(path: Path) -> dict[str, dict[str, int]]:
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_checkpoint(path: Path, positions: dict[str, dict[str, int]]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(positions))
+    tmp.replace(path)
+
+
+def write_events(rows: list[dict[str, Any]]) -> None:
+    """Insert ``rows`` and bump the history versions of their subdomains."""
+    with get_session() as db:
+        db.execute(insert(LoginEvent), rows)
+        bump_versions(db, (row["subdomain"] for row in rows))
+        db.commit()
+
+
+def run(
+    paths: list[str],
+    follow: bool = False,
+    checkpoint: Optional[Path] = CHECKPOINT_FILE,
+    batch_size: int = 5000,
+    flush_interval: float = 1.0,
+    default_subdomain: Optional[str] = None,
+    queue_size: int = 64,
+) -> int:
+    """Ingest ``paths`` until they are exhausted; return the number of events."""
+    positions = load_checkpoint(checkpoint) if checkpoint else {}
+    chunks: queue.Queue = queue.Queue(maxsize=queue_size)
+    for path in paths:
+        key = path if path == "-" else os.path.abspath(path)
+        threading.Thread(
+            target=_reader,
+            args=(key, positions.get(key, {}), follow, default_subdomain, chunks, 512),
+            name=f"ingest-{os.path.basename(path)}",
+            daemon=True,
+        ).start()
+
+    running = len(paths)
+    pending: list[dict[str, Any]] = []
+    covered: dict[str, dict[str, int]] = {}
+    total = 0
+    deadline = time.monotonic() + flush_interval
+
+    def flush() -> None:
+        nonlocal pending, total
+        if pending:
+            write_events(pending)
+            total += len(pending)
+        if checkpoint and covered:
+            positions.update(covered)
+            save_checkpoint(checkpoint, positions)
+        pending = []
+        covered.clear()
+
+    while running:
+        try:
+            item = chunks.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            item = False
+        if item is None:
+            running -= 1
+        elif item:
+            path, inode, offset, events = item
+            pending.extend(events)
+            if path != "-":
+                covered[path] = {"inode": inode, "offset": offset}
+        if len(pending) >= batch_size or time.monotonic() >= deadline or not running:
+            flush()
+            deadline = time.monotonic() + flush_interval
+    return total
+
+
+@click.command()
+@click.argument("paths", nargs=-1, required=True)
+@click.option(
+    "--follow", "-f", is_flag=True, help="Keep tailing files, following rotation."
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(path_type=Path),
+    default=CHECKPOINT_FILE,
+    show_default=True,
+    help="File recording committed offsets per input.",
+)
+@click.option(
+    "--no-checkpoint", is_flag=True, help="Always read inputs from the start."
+)
+@click.option(
+    "--batch-size",
+    default=5000,
+    show_default=True,
+    help="Events per database transaction.",
+)
+@click.option(
+    "--flush-interval",
+    default=1.0,
+    show_default=True,
+    help="Max seconds before a partial batch is written.",
+)
+@click.option(
+    "--subdomain",
+    help="Subdomain for lines that do not name a host (e.g. cloudflared logs).",
+)
+def main(
+    paths: tuple[str, ...],
+    follow: bool,
+    checkpoint: Path,
+    no_checkpoint: bool,
+    batch_size: int,
+    flush_interval: float,
+    subdomain: Optional[str],
+) -> None:
+    """Ingest login events from Access/cloudflared log files or stdin (-)."""
+    init_db()
+    start = time.monotonic()
+    total = run(
+        list(paths),
+        follow=follow,
+        checkpoint=None if no_checkpoint else checkpoint,
+        batch_size=batch_size,
+        flush_interval=flush_interval,
+        default_subdomain=subdomain,
+    )
+    elapsed = time.monotonic() - start
+    print(f"[INFO] Ingested {total} login events in {elapsed:.1f}s")
@@ -0,0 +1,208 @@
+"""Generate ``token_guard.sh`` with node and claude resolved ahead of time.
+
+Loading ``nvm.sh`` and running ``nvm use`` costs hundreds of milliseconds
+per connection, so :func:`resolve` does it once and records the node and
+claude binaries and the ``PATH`` they need in ``runtime.json``. The guard
+then execs claude directly. Before doing so it checks that both binaries
+still exist and that ``$NVM_DIR/alias/default`` is not newer than
+``runtime.json``. If either check fails, it runs ``refresh`` to resolve and
+rewrite the guard again. When claude cannot be found at all, the guard
+loads nvm on every connection as before.
+
+Only the standard library is used, as in :mod:`sshclaude.pool`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+STATE_DIR = Path.home() / ".sshclaude"
+RUNTIME_FILE = STATE_DIR / "runtime.json"
+GUARD_FILE = STATE_DIR / "token_guard.sh"
+TOKEN_FILE = STATE_DIR / "session_token"
+
+_RESOLVE = """\
+export NVM_DIR="${NVM_DIR:-$HOME/.nvm}"
+[ -s "$NVM_DIR/nvm.sh" ] && . "$NVM_DIR/nvm.sh" && nvm use node > /dev/null 2>&1
+echo "node=$(command -v node)"
+echo "claude=$(command -v claude)"
+echo "path=$PATH"
+echo "nvm_dir=$NVM_DIR"
+"""
+
+_TOKEN_CHECK = """\
+EXPECTED=$(cat {token_file})
+read -p "Token: " INPUT
+if [ "$INPUT" != "$EXPECTED" ]; then
+  echo "Unauthorized"
+  exit 1
+fi
+"""
+
+# With a session pool the guard attaches to a warm Claude and only starts
+# one itself (exit status 75) when the pool is down or full.
+_ATTACH = """\
+{python} -m sshclaude.pool attach
+status=$?
+[ "$status" -eq 75 ] || exit "$status"
+"""
+
+_NVM_EXEC = """\
+export NVM_DIR="$HOME/.nvm"
+[ -s "$NVM_DIR/nvm.sh" ] && \\. "$NVM_DIR/nvm.sh"
+nvm use node > /dev/null
+exec claude "$@"
+"""
+
+_RESOLVED_EXEC = """\
+NODE={node}
+CLAUDE={claude}
+if [ ! -x "$NODE" ] || [ ! -x "$CLAUDE" ] || [ ! -f {runtime} ] \\
+    || [ {nvm_dir}/alias/default -nt {runtime} ]; then
+  RESOLVED=$({refresh}) || exit 1
+  eval "$RESOLVED"
+else
+  export PATH={path}
+fi
+exec "$CLAUDE" "$@"
+"""
+
+
+def resolve() -> dict[str, str]:
+    """Locate node and claude the way an interactive nvm shell would."""
+    runtime = {"node": "", "claude": "", "path": os.environ.get("PATH", "")}
+    runtime["nvm_dir"] = os.environ.get("NVM_DIR", str(Path.home() / ".nvm"))
+    try:
+        out = subprocess.run(
+            ["bash", "-c", _RESOLVE],
+            capture_output=True,
+            text=True,
+            timeout=30,
+            check=False,
+        ).stdout
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print("[WARN] Could not run bash to resolve node:", e, file=sys.stderr)
+        out = ""
+    for line in out.splitlines():
+        key, _, value = line.partition("=")
+        if key in runtime and value:
+            runtime[key] = value
+    for name in ("node", "claude"):
+        if not runtime[name]:
+            runtime[name] = shutil.which(name, path=runtime["path"]) or ""
+    # Put node first so claude's ``#!/usr/bin/env node`` finds the same one.
+    bins = [os.path.dirname(runtime[n]) for n in ("node", "claude") if runtime[n]]
+    entries = [*bins, *runtime["path"].split(os.pathsep)]
+    runtime["path"] = os.pathsep.join(dict.fromkeys(e for e in entries if e))
+    runtime["resolved_at"] = str(int(time.time()))
+    return runtime
+
+
+def load_runtime(path: Path = RUNTIME_FILE) -> Optional[dict[str, str]]:
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def claude_command(
+    path: Path = RUNTIME_FILE,
+) -> tuple[list[str], dict[str, str]]:
+    """``(argv, env)`` to start claude: resolved if possible, else via nvm."""
+    runtime = load_runtime(path)
+    if runtime and os.access(runtime.get("claude") or "", os.X_OK):
+        return [runtime["claude"]], {"PATH": runtime["path"]}
+    return ["/bin/bash", "-c", _NVM_EXEC, "claude"], {}
+
+
+def guard_script(
+    token_file: Path,
+    runtime: Optional[dict[str, str]],
+    pool_size: int = 0,
+    guard: Path = GUARD_FILE,
+    runtime_file: Path = RUNTIME_FILE,
+) -> str:
+    """Text of ``token_guard.sh``; falls back to nvm if claude is unresolved."""
+    python = shlex.quote(sys.executable)
+    script = "#!/bin/bash\n" + _TOKEN_CHECK.format(
+        token_file=shlex.quote(str(token_file))
+    )
+    if pool_size:
+        script += _ATTACH.format(python=python)
+    if not (runtime and runtime.get("claude") and runtime.get("node")):
+        return script + _NVM_EXEC
+    refresh = shlex.join(
+        [
+            sys.executable,
+            "-m",
+            "sshclaude.launcher",
+            "refresh",
+            "--guard",
+            str(guard),
+            "--token-file",
+            str(token_file),
+            "--pool-size",
+            str(pool_size),
+            "--runtime",
+            str(runtime_file),
+        ]
+    )
+    return script + _RESOLVED_EXEC.format(
+        node=shlex.quote(runtime["node"]),
+        claude=shlex.quote(runtime["claude"]),
+        path=shlex.quote(runtime["path"]),
+        nvm_dir=shlex.quote(runtime["nvm_dir"]),
+        runtime=shlex.quote(str(runtime_file)),
+        refresh=refresh,
+    )
+
+
+def write_guard(
+    token_file: Path = TOKEN_FILE,
+    pool_size: int = 0,
+    guard: Path = GUARD_FILE,
+    runtime_file: Path = RUNTIME_FILE,
+) -> dict[str, str]:
+    """Resolve the runtime, record it and (re)write the guard script."""
+    runtime = resolve()
+    runtime_file.parent.mkdir(parents=True, exist_ok=True)
+    runtime_file.write_text(json.dumps(runtime, indent=2))
+    tmp = guard.with_suffix(".tmp")
+    tmp.write_text(guard_script(token_file, runtime, pool_size, guard, runtime_file))
+    tmp.chmod(0o755)
+    tmp.replace(guard)
+    return runtime
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="sshclaude-launcher", description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    refresh = commands.add_parser(
+        "refresh", help="Re-resolve node/claude, rewrite the guard, print env."
+    )
+    refresh.add_argument("--guard", type=Path, default=GUARD_FILE)
+    refresh.add_argument("--token-file", type=Path, default=TOKEN_FILE)
+    refresh.add_argument("--pool-size", type=int, default=0)
+    refresh.add_argument("--runtime", type=Path, default=RUNTIME_FILE)
+    args = parser.parse_args(argv)
+
+    runtime = write_guard(args.token_file, args.pool_size, args.guard, args.runtime)
+    if not runtime["claude"]:
+        print("[ERROR] claude not found; install it with npm", file=sys.stderr)
+        sys.exit(1)
+    # Evaluated by the guard that asked for the refresh.
+    print(f"export PATH={shlex.quote(runtime['path'])}")
+    print(f"CLAUDE={shlex.quote(runtime['claude'])}")
+
+
+if __name__ == "__main__":
+    main()
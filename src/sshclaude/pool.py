@@ -0,0 +1,341 @@
+"""Pool of pre-started Claude sessions handed to ttyd connections.
+
+``sshclaude-pool serve`` (run by the supervisor when ``pool_size`` is set)
+keeps ``size`` Claude processes running on their own pseudo-terminals and
+records what each one prints while it waits. After ``token_guard.sh`` has
+checked the token it runs ``sshclaude-pool attach``: that client takes the
+oldest warm session over the unix socket, receiving its terminal fd, and
+relays between ttyd's terminal and the session. The pool starts a
+replacement straight away.
+
+Warm sessions older than ``SSHCLAUDE_POOL_WARM_TTL`` are replaced, attached
+sessions are closed after ``SSHCLAUDE_SESSION_IDLE_TIMEOUT`` seconds without
+input and at most ``SSHCLAUDE_POOL_MAX_SESSIONS`` are attached at once. When
+the pool is unreachable or full, ``attach`` exits with
+:data:`EX_TEMPFAIL` so the guard can start Claude the slow way instead.
+
+Only the standard library is used to keep ``attach`` startup short.
+"""
+
+from __future__ import annotations
+
+import argparse
+import collections
+import errno
+import fcntl
+import json
+import os
+import pty
+import selectors
+import signal
+import socket
+import sys
+import termios
+import threading
+import time
+import tty
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from . import launcher
+
+STATE_DIR = Path.home() / ".sshclaude"
+SOCKET_FILE = STATE_DIR / "pool.sock"
+
+WARM_TTL = float(os.getenv("SSHCLAUDE_POOL_WARM_TTL", "3600"))
+IDLE_TIMEOUT = float(os.getenv("SSHCLAUDE_SESSION_IDLE_TIMEOUT", "3600"))
+MAX_SESSIONS = int(os.getenv("SSHCLAUDE_POOL_MAX_SESSIONS", "4"))
+# Output kept per warm session and replayed on attach.
+OUTPUT_KEEP = 64 * 1024
+# Exit status of ``attach`` when no warm session could be taken.
+EX_TEMPFAIL = 75
+
+
+@dataclass
+class Session:
+    pid: int
+    fd: int
+    started_at: float
+    output: bytearray = field(default_factory=bytearray, repr=False)
+
+    def keep(self, data: bytes) -> None:
+        self.output += data
+        if len(self.output) > OUTPUT_KEEP:
+            del self.output[: len(self.output) - OUTPUT_KEEP]
+
+
+def spawn(argv: list[str], env: Optional[dict[str, str]] = None) -> Session:
+    """Start ``argv`` on a new pseudo-terminal as its session leader."""
+    pid, fd = pty.fork()
+    if pid == 0:  # pragma: no cover - replaced by exec
+        try:
+            os.chdir(Path.home())
+            os.execvpe(argv[0], argv, {**os.environ, **(env or {})})
+        finally:
+            os._exit(127)
+    os.set_blocking(fd, False)
+    return Session(pid, fd, time.monotonic())
+
+
+class Pool:
+    """Keeps ``size`` warm sessions of ``argv`` and hands them out on request."""
+
+    def __init__(
+        self,
+        argv: list[str],
+        size: int,
+        socket_path: Path = SOCKET_FILE,
+        warm_ttl: float = WARM_TTL,
+        max_sessions: int = MAX_SESSIONS,
+        env: Optional[dict[str, str]] = None,
+    ) -> None:
+        self.argv = argv
+        self.env = {"TERM": "xterm-256color", **(env or {})}
+        self.size = size
+        self.socket_path = socket_path
+        self.warm_ttl = warm_ttl
+        self.max_sessions = max_sessions
+        self.warm: collections.deque[Session] = collections.deque()
+        self.attached: set[int] = set()
+        self._children: set[int] = set()
+        self._selector = selectors.DefaultSelector()
+        self._stopping = False
+
+    def _start_one(self) -> None:
+        try:
+            session = spawn(self.argv, self.env)
+        except OSError as e:
+            print("[ERROR] Could not start a warm session:", e)
+            return
+        self.warm.append(session)
+        self._children.add(session.pid)
+        self._selector.register(session.fd, selectors.EVENT_READ, session)
+
+    def _drop(self, session: Session, kill: bool = True) -> None:
+        self._selector.unregister(session.fd)
+        os.close(session.fd)
+        self.warm.remove(session)
+        if kill:
+            try:
+                os.killpg(session.pid, signal.SIGHUP)
+            except ProcessLookupError:
+                pass
+
+    def refill(self) -> None:
+        """Replace expired warm sessions and top the pool up to ``size``."""
+        now = time.monotonic()
+        for session in [s for s in self.warm if now - s.started_at > self.warm_ttl]:
+            self._drop(session)
+        while (
+            len(self.warm) < self.size
+            and len(self.warm) + len(self.attached) < self.max_sessions
+        ):
+            before = len(self.warm)
+            self._start_one()
+            if len(self.warm) == before:
+                break
+
+    def reap(self) -> None:
+        """Collect exited sessions, attached or not."""
+        for pid in list(self._children):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                self._children.discard(pid)
+                self.attached.discard(pid)
+
+    def _drain(self, session: Session) -> None:
+        try:
+            data = os.read(session.fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if data:
+            session.keep(data)
+        else:  # exited before anyone attached
+            self._drop(session, kill=False)
+
+    def _hand_out(self, conn: socket.socket) -> None:
+        if not self.warm:
+            header = {"error": "busy" if self.attached else "no warm session"}
+            conn.sendall(json.dumps(header).encode() + b"\n")
+            return
+        session = self.warm[0]
+        header = {"pid": session.pid, "output": len(session.output)}
+        try:
+            socket.send_fds(conn, [json.dumps(header).encode() + b"\n"], [session.fd])
+        except OSError as e:
+            print("[WARN] Attach failed:", e)
+            return
+        # The client owns the session from here on, even if the replay fails.
+        output = bytes(session.output)
+        self._drop(session, kill=False)
+        self.attached.add(session.pid)
+        if output:
+            conn.sendall(output)
+
+    def _accept(self, server: socket.socket) -> None:
+        conn, _ = server.accept()
+        with conn:
+            conn.settimeout(1.0)
+            try:
+                command = conn.makefile("rb").readline().strip()
+                if command == b"attach":
+                    self._hand_out(conn)
+                elif command == b"status":
+                    status = {"warm": len(self.warm), "attached": len(self.attached)}
+                    conn.sendall(json.dumps(status).encode() + b"\n")
+            except OSError as e:
+                print("[WARN] Pool request failed:", e)
+
+    def stop(self) -> None:
+        self._stopping = True
+
+    def serve(self, interval: float = 0.5) -> None:
+        """Hand out sessions until :meth:`stop`, SIGTERM or SIGINT."""
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self.socket_path.unlink(missing_ok=True)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str(self.socket_path))
+        os.chmod(self.socket_path, 0o600)
+        server.listen(16)
+        server.setblocking(False)
+        self._selector.register(server, selectors.EVENT_READ, None)
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, lambda *_: self.stop())
+        try:
+            while not self._stopping:
+                self.reap()
+                self.refill()
+                for key, _ in self._selector.select(interval):
+                    if key.data is None:
+                        self._accept(server)
+                    elif key.data in self.warm:
+                        self._drain(key.data)
+        finally:
+            for session in list(self.warm):
+                self._drop(session)
+            self._selector.close()
+            server.close()
+            self.socket_path.unlink(missing_ok=True)
+
+
+def checkout(socket_path: Path = SOCKET_FILE) -> tuple[int, int, bytes]:
+    """Take a warm session: ``(pid, terminal fd, output so far)``.
+
+    Raises OSError when the pool is unreachable or has nothing to give.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5.0)
+        sock.connect(str(socket_path))
+        sock.sendall(b"attach\n")
+        data, fds, _, _ = socket.recv_fds(sock, 65536, 1)
+        while b"\n" not in data:
+            more = sock.recv(65536)
+            if not more:
+                raise ConnectionError("pool closed the connection")
+            data += more
+        line, _, output = data.partition(b"\n")
+        header = json.loads(line)
+        if "error" in header:
+            for fd in fds:
+                os.close(fd)
+            raise ConnectionRefusedError(errno.EAGAIN, header["error"])
+        while len(output) < header["output"]:
+            more = sock.recv(65536)
+            if not more:
+                break
+            output += more
+    return header["pid"], fds[0], output
+
+
+def _copy_size(src: int, dst: int) -> None:
+    try:
+        size = fcntl.ioctl(src, termios.TIOCGWINSZ, b"\0" * 8)
+        fcntl.ioctl(dst, termios.TIOCSWINSZ, size)
+    except OSError:
+        pass
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        try:
+            written = os.write(fd, view)
+        except BlockingIOError:
+            time.sleep(0.01)
+            continue
+        view = view[written:]
+
+
+def relay(pid: int, fd: int, output: bytes, idle_timeout: float = IDLE_TIMEOUT) -> None:
+    """Connect this terminal to session ``fd`` until either side goes away."""
+    stdin, stdout = sys.stdin.fileno(), sys.stdout.fileno()
+    saved = termios.tcgetattr(stdin) if os.isatty(stdin) else None
+    if saved is not None:
+        tty.setraw(stdin)
+    signal.signal(signal.SIGWINCH, lambda *_: _copy_size(stdin, fd))
+    try:
+        _write_all(stdout, output)
+        _copy_size(stdin, fd)
+        selector = selectors.DefaultSelector()
+        selector.register(stdin, selectors.EVENT_READ)
+        selector.register(fd, selectors.EVENT_READ)
+        last_input = time.monotonic()
+        while True:
+            ready = selector.select(min(60.0, idle_timeout))
+            if not ready and time.monotonic() - last_input > idle_timeout:
+                _write_all(stdout, b"\r\n[sshclaude] Session closed after idling.\r\n")
+                break
+            for key, _ in ready:
+                try:
+                    data = os.read(key.fd, 65536)
+                except BlockingIOError:
+                    continue
+                except OSError:  # EIO once the session has exited
+                    data = b""
+                if not data:
+                    return
+                if key.fd == stdin:
+                    last_input = time.monotonic()
+                    _write_all(fd, data)
+                else:
+                    _write_all(stdout, data)
+    finally:
+        if saved is not None:
+            termios.tcsetattr(stdin, termios.TCSAFLUSH, saved)
+        os.close(fd)
+        try:
+            os.killpg(pid, signal.SIGHUP)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="sshclaude-pool", description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Keep warm Claude sessions.")
+    serve.add_argument("--size", type=int, default=1)
+    serve.add_argument("--socket", type=Path, default=SOCKET_FILE)
+    attach = commands.add_parser("attach", help="Attach to a warm session.")
+    attach.add_argument("--socket", type=Path, default=SOCKET_FILE)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        argv, env = launcher.claude_command()
+        Pool(argv, args.size, args.socket, env=env).serve()
+        return
+    try:
+        pid, fd, output = checkout(args.socket)
+    except (OSError, ValueError):
+        sys.exit(EX_TEMPFAIL)
+    relay(pid, fd, output)
+
+
+if __name__ == "__main__":
+    main()
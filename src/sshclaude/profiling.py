@@ -0,0 +1,199 @@
+"""Opt-in per-request cProfile capture for the API.
+
+Set ``SSHCLAUDE_PROFILE_DIR`` to enable it. A request is profiled when it
+carries ``X-Sshclaude-Profile: <SSHCLAUDE_PROFILE_TOKEN>`` or is picked by
+``SSHCLAUDE_PROFILE_SAMPLE_RATE``. The profile covers the endpoint body,
+including the threadpool thread a sync endpoint runs in, and is written as
+``<time>-<route>-<trace id>.prof``; only the newest
+``SSHCLAUDE_PROFILE_KEEP`` files are kept. ``sshclaude-profile`` prints the
+hottest frames across stored profiles.
+
+When the directory is unset :func:`install` does nothing, so routes run
+exactly as without this module.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import cProfile
+import functools
+import hmac
+import inspect
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import typing
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import click
+from fastapi import FastAPI, Request, Response
+from fastapi.routing import APIRoute
+
+PROFILE_DIR = os.getenv("SSHCLAUDE_PROFILE_DIR", "")
+PROFILE_TOKEN = os.getenv("SSHCLAUDE_PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("SSHCLAUDE_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_KEEP = int(os.getenv("SSHCLAUDE_PROFILE_KEEP", "200"))
+PROFILE_HEADER = "X-Sshclaude-Profile"
+ENABLED = bool(PROFILE_DIR)
+
+# (route path, trace id) of the request being profiled in this context.
+_current: contextvars.ContextVar[Optional[tuple[str, str]]] = contextvars.ContextVar(
+    "sshclaude_profile", default=None
+)
+# cProfile cannot run two profilers at once on Python 3.12+, so concurrent
+# picks are skipped rather than queued.
+_active = threading.Lock()
+
+
+def _trace_id(request: Request) -> str:
+    traceparent = request.headers.get("traceparent", "")
+    if traceparent.count("-") >= 3:
+        return re.sub(r"[^0-9A-Za-z]", "", traceparent.split("-")[1])
+    request_id = re.sub(r"[^0-9A-Za-z]", "", request.headers.get("x-request-id", ""))
+    return request_id[:64] or uuid.uuid4().hex
+
+
+def _wanted(request: Request) -> bool:
+    token = request.headers.get(PROFILE_HEADER)
+    if token and PROFILE_TOKEN and hmac.compare_digest(token, PROFILE_TOKEN):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _slug(path: str) -> str:
+    return re.sub(r"[^\w]+", "_", path).strip("_") or "root"
+
+
+def _save(profile: cProfile.Profile, route: str, trace_id: str) -> None:
+    directory = Path(PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    profile.dump_stats(
+        str(directory / f"{time.time_ns()}-{_slug(route)}-{trace_id}.prof")
+    )
+    stored = sorted(directory.glob("*.prof"))
+    for old in stored[: max(0, len(stored) - PROFILE_KEEP)]:
+        old.unlink(missing_ok=True)
+
+
+def _start() -> Optional[cProfile.Profile]:
+    if _current.get() is None or not _active.acquire(blocking=False):
+        return None
+    profile = cProfile.Profile()
+    profile.enable()
+    return profile
+
+
+def _stop(profile: Optional[cProfile.Profile]) -> None:
+    if profile is None:
+        return
+    profile.disable()
+    _active.release()
+    route, trace_id = _current.get()
+    try:
+        _save(profile, route, trace_id)
+    except OSError as e:
+        print("[WARN] Could not store profile:", e)
+
+
+def _profiled(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap ``endpoint`` so it runs under cProfile when its request is picked."""
+    if inspect.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            profile = _start()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _stop(profile)
+
+    else:
+
+        @functools.wraps(endpoint)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            profile = _start()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _stop(profile)
+
+    # FastAPI resolves string annotations against the wrapper's globals, so
+    # hand it the endpoint's signature with the annotations already resolved.
+    hints = typing.get_type_hints(endpoint, include_extras=True)
+    signature = inspect.signature(endpoint)
+    wrapper.__signature__ = signature.replace(
+        parameters=[
+            p.replace(annotation=hints.get(p.name, p.annotation))
+            for p in signature.parameters.values()
+        ],
+        return_annotation=hints.get("return", signature.return_annotation),
+    )
+    return wrapper
+
+
+class ProfilingRoute(APIRoute):
+    """Route that profiles its endpoint for admin-flagged or sampled requests."""
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        super().__init__(path, _profiled(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        handler = super().get_route_handler()
+
+        async def profiled_handler(request: Request) -> Response:
+            if not _wanted(request):
+                return await handler(request)
+            trace_id = _trace_id(request)
+            token = _current.set((self.path, trace_id))
+            try:
+                response = await handler(request)
+            finally:
+                _current.reset(token)
+            response.headers["X-Profile-Id"] = trace_id
+            return response
+
+        return profiled_handler
+
+
+def install(app: FastAPI) -> None:
+    """Profile routes declared on ``app`` from now on, if profiling is enabled."""
+    if ENABLED:
+        app.router.route_class = ProfilingRoute
+
+
+@click.command()
+@click.argument(
+    "directory",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    default=PROFILE_DIR or None,
+    required=not PROFILE_DIR,
+)
+@click.option("--route", help="Only profiles whose route contains this text.")
+@click.option(
+    "--sort",
+    type=click.Choice(["cumulative", "tottime", "ncalls"]),
+    default="tottime",
+    show_default=True,
+)
+@click.option("--limit", default=25, show_default=True, help="Frames to print.")
+def main(directory: Path, route: Optional[str], sort: str, limit: int) -> None:
+    """Summarize the hottest frames across stored request profiles."""
+    files = sorted(directory.glob("*.prof"))
+    if route:
+        files = [f for f in files if _slug(route) in f.name]
+    if not files:
+        print("[INFO] No profiles found in", directory)
+        return
+    counts: dict[str, int] = {}
+    for f in files:
+        name = f.stem.split("-", 1)[1].rsplit("-", 1)[0]
+        counts[name] = counts.get(name, 0) + 1
+    for name, count in sorted(counts.items(), key=lambda item: -item[1]):
+        print(f"{count:6d}  {name}")
+    stats = pstats.Stats(*(str(f) for f in files))
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
@@ -0,0 +1,231 @@
+"""Per-client rate limiting and admission control for the API.
+
+Each request draws from two token buckets, one keyed by client IP and one by
+bearer token, in the cheap ``read`` budget, the ``login`` budget for
+requests that create login sessions or call GitHub, or the expensive
+``provision`` budget. Buckets live in process memory or, with
+``RATE_LIMIT_URL=redis://...``, in Redis so all workers share them.
+Provisioning requests additionally pass an admission controller that caps
+concurrency and tightens the cap while upstream latency is high.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator
+
+from fastapi import HTTPException, Request
+
+RATE_LIMIT_URL = os.getenv(
+    "RATE_LIMIT_URL", os.getenv("SESSION_STORE_URL", "memory://")
+)
+# Header carrying the client address set by the edge (e.g. CF-Connecting-IP).
+RATE_LIMIT_IP_HEADER = os.getenv("RATE_LIMIT_IP_HEADER", "")
+# Number of trusted proxies appending to X-Forwarded-For; the client is the
+# entry added by the outermost one, this many positions from the right.
+RATE_LIMIT_FORWARDED_HOPS = int(os.getenv("RATE_LIMIT_FORWARDED_HOPS", "0"))
+
+
+@dataclass(frozen=True)
+class Budget:
+    rate: float  # tokens refilled per second
+    burst: int  # bucket capacity
+
+
+def _budget(name: str, default: str) -> Budget:
+    """Parse ``RATE_LIMIT_<NAME>`` given as ``rate/burst``, e.g. ``20/60``.
+
+    A rate of 0 disables the limit.
+    """
+    rate, _, burst = os.getenv(f"RATE_LIMIT_{name.upper()}", default).partition("/")
+    return Budget(rate=float(rate), burst=int(burst or math.ceil(float(rate))))
+
+
+BUDGETS = {
+    "read": _budget("read", "20/60"),
+    # Creating a login session and the OAuth callback's GitHub calls.
+    "login": _budget("login", "0.5/10"),
+    "provision": _budget("provision", "0.2/5"),
+    # Paces Cloudflare calls made by bulk key rotation, across all workers.
+    "rotation": _budget("rotation", "5/10"),
+}
+
+PROVISION_CONCURRENCY = int(os.getenv("PROVISION_CONCURRENCY", "16"))
+PROVISION_LATENCY_TARGET = float(os.getenv("PROVISION_LATENCY_TARGET", "10"))
+
+
+class MemoryBuckets:
+    """Token buckets held in this process."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def take(self, key: str, budget: Budget, cost: float = 1) -> float:
+        """Take ``cost`` tokens; return 0 or the seconds until they are available."""
+        now = self._clock()
+        with self._lock:
+            if len(self._buckets) > 100_000:
+                self._buckets.clear()
+            tokens, updated = self._buckets.get(key, (budget.burst, now))
+            tokens = min(budget.burst, tokens + (now - updated) * budget.rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (cost - tokens) / budget.rate
+
+
+# KEYS[1]=bucket, ARGV=rate, burst, cost. Returns the wait in milliseconds.
+_TAKE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate / 1000)
+local wait = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  wait = math.ceil((cost - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+
+class RedisBuckets:
+    """Token buckets shared by all workers through Redis."""
+
+    def __init__(self, client: Any, prefix: str = "sshclaude:ratelimit:") -> None:
+        self.prefix = prefix
+        self._take = client.register_script(_TAKE_SCRIPT)
+
+    def take(self, key: str, budget: Budget, cost: float = 1) -> float:
+        return (
+            int(
+                self._take(
+                    keys=[self.prefix + key], args=[budget.rate, budget.burst, cost]
+                )
+            )
+            / 1000
+        )
+
+
+def create_buckets(url: str = RATE_LIMIT_URL):
+    if url.startswith("memory://"):
+        return MemoryBuckets()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_URL requires the 'redis' extra") from e
+        return RedisBuckets(redis.Redis.from_url(url))
+    raise ValueError(f"Unsupported RATE_LIMIT_URL: {url}")
+
+
+buckets = create_buckets()
+
+
+def _too_many(retry_after: float, detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def client_ip(request: Request) -> str:
+    """The client address, taken only from headers a trusted proxy sets."""
+    ip = request.client.host if request.client else "unknown"
+    if RATE_LIMIT_IP_HEADER:
+        return request.headers.get(RATE_LIMIT_IP_HEADER, ip).strip()
+    if RATE_LIMIT_FORWARDED_HOPS:
+        forwarded = ",".join(request.headers.getlist("x-forwarded-for"))
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if len(hops) >= RATE_LIMIT_FORWARDED_HOPS:
+            return hops[-RATE_LIMIT_FORWARDED_HOPS]
+    return ip
+
+
+def client_keys(request: Request) -> list[str]:
+    """Identities a request is limited by: its client IP and its bearer token."""
+    keys = [f"ip:{client_ip(request)}"]
+    authorization = request.headers.get("authorization", "")
+    if authorization.startswith("Bearer "):
+        digest = hashlib.sha256(authorization[7:].strip().encode()).hexdigest()[:24]
+        keys.append(f"token:{digest}")
+    return keys
+
+
+def limit(budget_name: str) -> Callable[..., None]:
+    """FastAPI dependency enforcing the ``budget_name`` budget per client."""
+    budget = BUDGETS[budget_name]
+    if budget.rate <= 0:
+        return lambda: None
+
+    def dependency(request: Request) -> None:
+        for key in client_keys(request):
+            wait = buckets.take(f"{budget_name}:{key}", budget)
+            if wait:
+                raise _too_many(wait, "rate limit exceeded")
+
+    return dependency
+
+
+class AdmissionController:
+    """Caps concurrent work, tightening the cap while observed latency is high."""
+
+    def __init__(
+        self, limit: int, latency_target: float, smoothing: float = 0.2
+    ) -> None:
+        self.limit = limit
+        self.latency_target = latency_target
+        self.smoothing = smoothing
+        self.latency = 0.0
+        self.inflight = 0
+        self._lock = threading.Lock()
+
+    def effective_limit(self) -> int:
+        if self.latency <= self.latency_target:
+            return self.limit
+        return max(1, int(self.limit * self.latency_target / self.latency))
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.latency += self.smoothing * (seconds - self.latency)
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        with self._lock:
+            if self.inflight >= self.effective_limit():
+                raise _too_many(max(1.0, self.latency), "server busy, retry later")
+            self.inflight += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start)
+            with self._lock:
+                self.inflight -= 1
+
+
+provision_admission = AdmissionController(
+    PROVISION_CONCURRENCY, PROVISION_LATENCY_TARGET
+)
+
+
+def admit_provision() -> Iterator[None]:
+    """FastAPI dependency that sheds provisioning load when the API is saturated."""
+    with provision_admission.admit():
+        yield
@@ -0,0 +1,82 @@
+"""JSON encoding for hot API routes.
+
+Setting ``SSHCLAUDE_FAST_JSON=1`` makes orjson the default response class
+and lets routes such as ``/history`` encode query rows straight to bytes,
+skipping ``jsonable_encoder`` and response-model validation.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+FAST_JSON = os.getenv("SSHCLAUDE_FAST_JSON", "").lower() in ("1", "true", "yes")
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize ``obj`` (datetimes included) to compact JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(
+        obj, separators=(",", ":"), default=lambda o: o.isoformat()
+    ).encode()
+
+
+def json_bytes_response(obj: Any, headers: Optional[dict[str, str]] = None) -> Response:
+    return Response(content=dumps(obj), media_type="application/json", headers=headers)
+
+
+def default_response_class() -> type[Response]:
+    if FAST_JSON and orjson is not None:
+        from fastapi.responses import ORJSONResponse
+
+        return ORJSONResponse
+    return JSONResponse
+
+
+def validators(kind: str, version: int, updated_at: datetime) -> dict[str, str]:
+    """Cache validator headers for version ``version`` of a ``kind`` resource."""
+    return {
+        "ETag": f'W/"{kind}-{version}"',
+        "Last-Modified": format_datetime(
+            updated_at.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True
+        ),
+        "Cache-Control": "no-cache",
+    }
+
+
+def _opaque(tag: str) -> str:
+    return tag.strip().removeprefix("W/")
+
+
+def not_modified(
+    headers: dict[str, str],
+    if_none_match: Optional[str],
+    if_modified_since: Optional[str],
+) -> bool:
+    """Evaluate conditional request headers against ``validators()`` output."""
+    if not headers:
+        return False
+    if if_none_match is not None:
+        etag = _opaque(headers["ETag"])
+        return any(
+            tag.strip() == "*" or _opaque(tag) == etag
+            for tag in if_none_match.split(",")
+        )
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return parsedate_to_datetime(headers["Last-Modified"]) <= since
+    return False
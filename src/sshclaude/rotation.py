@@ -0,0 +1,254 @@
+"""Bulk host key rotation.
+
+A rotation job is a set of per-subdomain tasks stored in the database. Tasks
+are claimed with a conditional update, so several processes can work on the
+same job, and a task left ``running`` by a crashed process is picked up
+again once its lease expires. Tasks hit by an open Cloudflare circuit go
+back to ``pending``, and unfinished jobs are retried until they finish.
+Cloudflare calls fan out over a bounded thread pool and are paced by a
+shared token bucket.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Iterable, Optional
+
+import click
+from sqlalchemy import func, or_, update
+
+from . import cloudflare, ratelimit, server
+from .breaker import CircuitOpenError
+from .db import Provision, RotationJob, RotationTask, get_session
+
+ROTATION_CONCURRENCY = int(os.getenv("ROTATION_CONCURRENCY", "8"))
+ROTATION_LEASE = timedelta(seconds=int(os.getenv("ROTATION_LEASE", "600")))
+# Seconds between passes over a job that still has unfinished tasks.
+ROTATION_RETRY_INTERVAL = float(os.getenv("ROTATION_RETRY_INTERVAL", "30"))
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+def create_job(subdomains: Iterable[str]) -> str:
+    job_id = uuid.uuid4().hex
+    with get_session() as db:
+        db.add(RotationJob(id=job_id))
+        db.add_all(
+            RotationTask(job_id=job_id, subdomain=s) for s in dict.fromkeys(subdomains)
+        )
+        db.commit()
+    return job_id
+
+
+def subdomains_for(github_id: Optional[str] = None) -> list[str]:
+    """Subdomains owned by ``github_id``, or every provisioned subdomain."""
+    with get_session(read_only=True) as db:
+        query = db.query(Provision.subdomain)
+        if github_id is not None:
+            query = query.filter(Provision.github_id == github_id)
+        return [subdomain for (subdomain,) in query.order_by(Provision.subdomain)]
+
+
+def _claim(task_id: int) -> bool:
+    now = datetime.utcnow()
+    with get_session() as db:
+        result = db.execute(
+            update(RotationTask)
+            .where(
+                RotationTask.id == task_id,
+                or_(
+                    RotationTask.status == PENDING,
+                    (RotationTask.status == RUNNING)
+                    & (RotationTask.updated_at < now - ROTATION_LEASE),
+                ),
+            )
+            .values(status=RUNNING, updated_at=now)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+
+def _finish(task_id: int, status: str, error: Optional[str] = None) -> None:
+    with get_session() as db:
+        db.execute(
+            update(RotationTask)
+            .where(RotationTask.id == task_id)
+            .values(status=status, error=error, updated_at=datetime.utcnow())
+        )
+        db.commit()
+
+
+def _pace() -> None:
+    """Block until the shared Cloudflare rotation budget allows another call."""
+    while True:
+        wait = ratelimit.buckets.take(
+            "rotation:cloudflare", ratelimit.BUDGETS["rotation"]
+        )
+        if not wait:
+            return
+        time.sleep(wait)
+
+
+def _rotate(task_id: int, subdomain: str) -> None:
+    if not _claim(task_id):
+        return  # another process owns this task
+    with get_session(read_only=True, key=subdomain) as db:
+        tunnel_id = (
+            db.query(Provision.tunnel_id).filter_by(subdomain=subdomain).scalar()
+        )
+    if tunnel_id is None:
+        _finish(task_id, FAILED, "unknown subdomain")
+        return
+    _pace()
+    try:
+        with server.provisions_inflight:
+            cloudflare.rotate_host_key(tunnel_id)
+    except CircuitOpenError as e:
+        print(f"[WARN] Deferring key rotation for {subdomain}:", e)
+        _finish(task_id, PENDING)
+        return
+    except Exception as e:
+        print(f"[ERROR] Key rotation failed for {subdomain}:", e)
+        _finish(task_id, FAILED, str(e))
+        return
+    _finish(task_id, DONE)
+
+
+def run_job(job_id: str, concurrency: int = ROTATION_CONCURRENCY) -> bool:
+    """Make one pass over the unfinished tasks of ``job_id``.
+
+    Marks the job finished and returns True once no task is left pending or
+    running.
+    """
+    with get_session() as db:
+        tasks = (
+            db.query(RotationTask.id, RotationTask.subdomain)
+            .filter(
+                RotationTask.job_id == job_id,
+                RotationTask.status.in_([PENDING, RUNNING]),
+            )
+            .all()
+        )
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="rotate"
+    ) as pool:
+        for future in [
+            pool.submit(_rotate, task_id, subdomain) for task_id, subdomain in tasks
+        ]:
+            future.result()
+    with get_session() as db:
+        unfinished = (
+            db.query(func.count(RotationTask.id))
+            .filter(
+                RotationTask.job_id == job_id,
+                RotationTask.status.in_([PENDING, RUNNING]),
+            )
+            .scalar()
+        )
+        if not unfinished:
+            db.execute(
+                update(RotationJob)
+                .where(RotationJob.id == job_id)
+                .values(finished_at=datetime.utcnow())
+            )
+            db.commit()
+    return not unfinished
+
+
+def run_until_finished(job_id: str, concurrency: int = ROTATION_CONCURRENCY) -> None:
+    """Retry ``job_id`` until every task is done or failed.
+
+    Deferred tasks are retried after ``ROTATION_RETRY_INTERVAL``, and tasks
+    leased by a crashed process once their lease has expired.
+    """
+    while not run_job(job_id, concurrency):
+        time.sleep(ROTATION_RETRY_INTERVAL)
+
+
+def start_job(job_id: str) -> threading.Thread:
+    thread = threading.Thread(
+        target=run_until_finished,
+        args=(job_id,),
+        name=f"rotation-{job_id[:8]}",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def pending_jobs() -> list[str]:
+    with get_session() as db:
+        rows = (
+            db.query(RotationJob.id)
+            .filter(RotationJob.finished_at.is_(None))
+            .order_by(RotationJob.created_at)
+        )
+        return [job_id for (job_id,) in rows]
+
+
+def resume_pending(concurrency: int = ROTATION_CONCURRENCY) -> None:
+    """Finish jobs interrupted by a restart."""
+    for job_id in pending_jobs():
+        print("[INFO] Resuming key rotation job", job_id)
+        run_until_finished(job_id, concurrency)
+
+
+def job_status(job_id: str) -> Optional[dict[str, Any]]:
+    with get_session() as db:
+        job = db.get(RotationJob, job_id)
+        if job is None:
+            return None
+        finished = job.finished_at is not None
+        tasks = (
+            db.query(RotationTask.subdomain, RotationTask.status, RotationTask.error)
+            .filter(RotationTask.job_id == job_id)
+            .order_by(RotationTask.id)
+            .all()
+        )
+    counts = {status: 0 for status in (PENDING, RUNNING, DONE, FAILED)}
+    for task in tasks:
+        counts[task.status] += 1
+    return {
+        "job_id": job_id,
+        "finished": finished,
+        "total": len(tasks),
+        **counts,
+        "tasks": [
+            {"subdomain": t.subdomain, "status": t.status, "error": t.error}
+            for t in tasks
+        ],
+    }
+
+
+@click.command()
+@click.option(
+    "--every",
+    type=float,
+    help="Hours between fleet-wide rotations; omit to rotate once.",
+)
+@click.option("--github-id", help="Only rotate tunnels owned by this GitHub id.")
+@click.option("--concurrency", default=ROTATION_CONCURRENCY, show_default=True)
+def schedule(
+    every: Optional[float], github_id: Optional[str], concurrency: int
+) -> None:
+    """Rotate host keys across the fleet, resuming interrupted jobs first."""
+    from .db import init_db
+
+    init_db()
+    resume_pending(concurrency)
+    while True:
+        job_id = create_job(subdomains_for(github_id))
+        print("[INFO] Started key rotation job", job_id)
+        run_until_finished(job_id, concurrency)
+        status = job_status(job_id)
+        print(
+            f"[INFO] Job {job_id}: {status['done']} rotated, {status['failed']} failed"
+        )
+        if not every:
+            return
+        time.sleep(every * 3600)
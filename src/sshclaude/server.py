@@ -0,0 +1,217 @@
+"""Server entry point and process-level tuning for the provisioning API."""
+
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+import click
+
+# 0 keeps AnyIO's default threadpool size (40) for sync routes.
+THREADPOOL_SIZE = int(os.getenv("SSHCLAUDE_THREADPOOL", "0"))
+GRACEFUL_TIMEOUT = float(os.getenv("SSHCLAUDE_GRACEFUL_TIMEOUT", "30"))
+
+
+class InflightTracker:
+    """Counts in-flight operations so shutdown can wait for them to finish."""
+
+    def __init__(self) -> None:
+        self._count = 0
+        self._idle = threading.Condition()
+
+    def __enter__(self) -> "InflightTracker":
+        with self._idle:
+            self._count += 1
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        with self._idle:
+            self._count -= 1
+            if self._count == 0:
+                self._idle.notify_all()
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def wait_idle(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while self._count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+
+provisions_inflight = InflightTracker()
+
+
+def configure_threadpool() -> None:
+    """Apply SSHCLAUDE_THREADPOOL to the threadpool that runs sync routes."""
+    if THREADPOOL_SIZE > 0:
+        import anyio.to_thread
+
+        anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+
+async def drain() -> None:
+    """Wait for in-flight provisions so their Cloudflare resources get persisted."""
+    if provisions_inflight.count:
+        print(f"[INFO] Draining {provisions_inflight.count} in-flight provision(s)...")
+        # Not the AnyIO limiter: every token may be held by the work we wait on.
+        if not await asyncio.to_thread(provisions_inflight.wait_idle, GRACEFUL_TIMEOUT):
+            print("[WARN] Shutdown timeout reached with provisions still in flight")
+
+
+@asynccontextmanager
+async def lifespan(app: Any) -> AsyncIterator[None]:
+    configure_threadpool()
+    yield
+    await drain()
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def post_fork(server: Any, worker: Any) -> None:
+    """Drop database connections a preloading master passed to this worker.
+
+    ``dispose(close=False)`` leaves the sockets to the master and gives the
+    worker fresh pools instead of sharing connections across processes.
+    """
+    from . import db
+
+    for engine in (db.engine, *db.replica_engines):
+        engine.dispose(close=False)
+
+
+def _run_gunicorn(options: dict[str, Any]) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    class _Application(BaseApplication):
+        def load_config(self) -> None:
+            for key, value in options.items():
+                self.cfg.set(key, value)
+            self.cfg.set("post_fork", post_fork)
+
+        def load(self):
+            from .api import app
+
+            return app
+
+    _Application().run()
+
+
+@click.command()
+@click.option(
+    "--host", default=os.getenv("SSHCLAUDE_API_HOST", "0.0.0.0"), show_default=True
+)
+@click.option(
+    "--port", default=int(os.getenv("SSHCLAUDE_API_PORT", "8000")), show_default=True
+)
+@click.option(
+    "--production",
+    is_flag=True,
+    help="Multi-worker defaults: one worker per core, uvloop/httptools, preload.",
+)
+@click.option(
+    "--workers",
+    type=int,
+    help="Worker processes (default: 1, or CPU count with --production).",
+)
+@click.option(
+    "--threads",
+    type=int,
+    default=THREADPOOL_SIZE or None,
+    help="Threadpool size for sync routes per worker.",
+)
+@click.option(
+    "--backlog", default=2048, show_default=True, help="Listen socket backlog."
+)
+@click.option(
+    "--keep-alive",
+    default=5,
+    show_default=True,
+    help="Idle keep-alive timeout in seconds.",
+)
+@click.option(
+    "--graceful-timeout",
+    default=GRACEFUL_TIMEOUT,
+    show_default=True,
+    help="Seconds to drain in-flight requests on shutdown.",
+)
+@click.option(
+    "--preload/--no-preload",
+    default=None,
+    help="Import the app once in the master before forking (requires gunicorn).",
+)
+def serve(
+    host: str,
+    port: int,
+    production: bool,
+    workers: Optional[int],
+    threads: Optional[int],
+    backlog: int,
+    keep_alive: int,
+    graceful_timeout: float,
+    preload: Optional[bool],
+) -> None:
+    """Run the sshclaude provisioning API."""
+    global THREADPOOL_SIZE, GRACEFUL_TIMEOUT
+    workers = workers or ((os.cpu_count() or 1) if production else 1)
+    preload = production if preload is None else preload
+
+    # Worker processes read these when they import the app.
+    if threads:
+        THREADPOOL_SIZE = threads
+        os.environ["SSHCLAUDE_THREADPOOL"] = str(threads)
+    GRACEFUL_TIMEOUT = graceful_timeout
+    os.environ["SSHCLAUDE_GRACEFUL_TIMEOUT"] = str(graceful_timeout)
+
+    store_url = os.getenv("SESSION_STORE_URL", "memory://")
+    if workers > 1 and store_url.startswith("memory://"):
+        print(
+            "[WARN] SESSION_STORE_URL=memory:// is per-process;"
+            " use redis:// with several workers"
+        )
+
+    if preload and _available("gunicorn"):
+        _run_gunicorn(
+            {
+                "bind": f"{host}:{port}",
+                "workers": workers,
+                "worker_class": "uvicorn.workers.UvicornWorker",
+                "preload_app": True,
+                "backlog": backlog,
+                "keepalive": keep_alive,
+                "graceful_timeout": graceful_timeout,
+            }
+        )
+        return
+    if preload:
+        print(
+            "[WARN] --preload requires gunicorn;"
+            " starting uvicorn workers without preloading"
+        )
+
+    import uvicorn
+
+    uvicorn.run(
+        "sshclaude.api:app",
+        host=host,
+        port=port,
+        workers=workers,
+        loop="uvloop" if production and _available("uvloop") else "auto",
+        http="httptools" if production and _available("httptools") else "auto",
+        backlog=backlog,
+        timeout_keep_alive=keep_alive,
+        timeout_graceful_shutdown=int(graceful_timeout),
+    )
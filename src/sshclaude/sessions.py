@@ -0,0 +1,255 @@
+"""Short-lived storage for login sessions.
+
+Login sessions are created by ``POST /login`` and polled until the GitHub
+OAuth callback verifies them, so they live in a TTL key-value store instead
+of the SQL database. Only verified identities are persisted to SQL.
+"""
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+LOGIN_SESSION_TTL = int(os.getenv("LOGIN_SESSION_TTL", "600"))
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "memory://")
+
+
+class LoginNotifier:
+    """Wakes coroutines waiting for a login session to be verified."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._waiters: dict[str, set[asyncio.Future]] = {}
+
+    def register(self, uid: str) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        with self._lock:
+            self._waiters.setdefault(uid, set()).add(fut)
+        return fut
+
+    def discard(self, uid: str, fut: asyncio.Future) -> None:
+        with self._lock:
+            waiters = self._waiters.get(uid)
+            if waiters is not None:
+                waiters.discard(fut)
+                if not waiters:
+                    del self._waiters[uid]
+
+    def notify_all(self) -> None:
+        """Wake every local waiter so it re-reads its session."""
+        with self._lock:
+            uids = list(self._waiters)
+        for uid in uids:
+            self.notify(uid)
+
+    def notify(self, uid: str) -> None:
+        """Resolve every local waiter for ``uid``. Safe to call from any thread."""
+        with self._lock:
+            waiters = self._waiters.pop(uid, ())
+        for fut in waiters:
+            try:
+                fut.get_loop().call_soon_threadsafe(_resolve, fut)
+            except RuntimeError:
+                pass  # the waiting request's event loop has already closed
+
+
+def _resolve(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(True)
+
+
+notifier = LoginNotifier()
+
+
+class SessionStore(abc.ABC):
+    """Interface implemented by login session backends."""
+
+    notifier: LoginNotifier = notifier
+
+    @abc.abstractmethod
+    def get(self, uid: str) -> Optional[dict[str, Any]]: ...
+
+    @abc.abstractmethod
+    def put(
+        self, uid: str, record: dict[str, Any], ttl: Optional[int] = None
+    ) -> None: ...
+
+    @abc.abstractmethod
+    def update(self, uid: str, **fields: Any) -> Optional[dict[str, Any]]:
+        """Merge ``fields`` into an existing record, keeping its expiry."""
+
+    @abc.abstractmethod
+    def delete(self, uid: str) -> None: ...
+
+    def publish(self, uid: str) -> None:
+        """Announce that ``uid`` changed to waiters in every worker."""
+        self.notifier.notify(uid)
+
+    def listen(self) -> None:
+        """Receive announcements from other workers, if shared.
+
+        Call it before reading a session that will be waited on, so an
+        announcement made after the read is not missed.
+        """
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store. Use a shared backend when running several workers."""
+
+    _SWEEP_EVERY = 256
+
+    def __init__(
+        self,
+        ttl: int = LOGIN_SESSION_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl = ttl
+        self._clock = clock
+        self._data: dict[str, tuple[float, dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _live(self, uid: str) -> Optional[tuple[float, dict[str, Any]]]:
+        entry = self._data.get(uid)
+        if entry is None:
+            return None
+        if entry[0] <= self._clock():
+            del self._data[uid]
+            return None
+        return entry
+
+    def _sweep(self) -> None:
+        now = self._clock()
+        for uid in [k for k, (exp, _) in self._data.items() if exp <= now]:
+            del self._data[uid]
+
+    def get(self, uid: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            entry = self._live(uid)
+            return dict(entry[1]) if entry else None
+
+    def put(self, uid: str, record: dict[str, Any], ttl: Optional[int] = None) -> None:
+        with self._lock:
+            self._writes += 1
+            if self._writes % self._SWEEP_EVERY == 0:
+                self._sweep()
+            self._data[uid] = (self._clock() + (ttl or self.ttl), dict(record))
+
+    def update(self, uid: str, **fields: Any) -> Optional[dict[str, Any]]:
+        with self._lock:
+            entry = self._live(uid)
+            if entry is None:
+                return None
+            record = {**entry[1], **fields}
+            self._data[uid] = (entry[0], record)
+            return dict(record)
+
+    def delete(self, uid: str) -> None:
+        with self._lock:
+            self._data.pop(uid, None)
+
+
+class RedisSessionStore(SessionStore):
+    """Store backed by a Redis-compatible client (``get``/``set``/``delete``)."""
+
+    def __init__(
+        self,
+        client: Any,
+        ttl: int = LOGIN_SESSION_TTL,
+        prefix: str = "sshclaude:login:",
+    ) -> None:
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.channel = f"{prefix}events"
+        self._listener: Optional[threading.Thread] = None
+        self._listener_lock = threading.Lock()
+        self._subscribed = threading.Event()
+
+    def _key(self, uid: str) -> str:
+        return f"{self.prefix}{uid}"
+
+    def get(self, uid: str) -> Optional[dict[str, Any]]:
+        raw = self.client.get(self._key(uid))
+        return json.loads(raw) if raw else None
+
+    def put(self, uid: str, record: dict[str, Any], ttl: Optional[int] = None) -> None:
+        self.client.set(self._key(uid), json.dumps(record), ex=ttl or self.ttl)
+
+    def update(self, uid: str, **fields: Any) -> Optional[dict[str, Any]]:
+        record = self.get(uid)
+        if record is None:
+            return None
+        record.update(fields)
+        # xx: only overwrite a live key; keepttl: do not extend the session.
+        if not self.client.set(
+            self._key(uid), json.dumps(record), xx=True, keepttl=True
+        ):
+            return None
+        return record
+
+    def delete(self, uid: str) -> None:
+        self.client.delete(self._key(uid))
+
+    def publish(self, uid: str) -> None:
+        self.client.publish(self.channel, uid)
+
+    def listen(self, timeout: float = 5.0) -> None:
+        """Start the subscriber thread and wait until Redis confirms it."""
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._forward, name="sshclaude-login-events", daemon=True
+                )
+                self._listener.start()
+        if not self._subscribed.wait(timeout):
+            print("[WARN] Login event subscription is not ready")
+
+    def _forward(self) -> None:
+        resubscribe = False
+        while True:
+            try:
+                pubsub = self.client.pubsub()
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message.get("type") == "subscribe":
+                        self._subscribed.set()
+                        if resubscribe:
+                            # Announcements made while disconnected are lost.
+                            self.notifier.notify_all()
+                        continue
+                    if message.get("type") != "message":
+                        continue
+                    data = message.get("data")
+                    if isinstance(data, bytes):
+                        data = data.decode()
+                    if data:
+                        self.notifier.notify(data)
+            except Exception as e:
+                print("[ERROR] Login event subscription failed:", e)
+                time.sleep(1)
+            self._subscribed.clear()
+            resubscribe = True
+
+
+def create_store(
+    url: str = SESSION_STORE_URL, prefix: str = "sshclaude:login:"
+) -> SessionStore:
+    """Build a session store from a URL (``memory://`` or ``redis://...``)."""
+    if url.startswith("memory://"):
+        return MemorySessionStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("SESSION_STORE_URL requires the 'redis' extra") from e
+        return RedisSessionStore(redis.Redis.from_url(url), prefix=prefix)
+    raise ValueError(f"Unsupported SESSION_STORE_URL: {url}")
+
+
+store = create_store()
@@ -0,0 +1,249 @@
+"""Small process supervisor for the local ttyd and cloudflared daemons.
+
+``sshclaude supervise`` runs :class:`Supervisor` in the foreground, under
+launchd on macOS or a systemd user unit on Linux. It starts each child,
+restarts it with exponential backoff when it exits, and records its own pid
+in ``supervisor.pid``. The CLI talks to it over a unix socket with one-line
+commands (``status``, ``restart <name>``, ``stop``), each answered with one
+JSON line. This replaces scanning the process table.
+
+Only the standard library is used here so ``sshclaude status`` stays fast.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+STATE_DIR = Path.home() / ".sshclaude"
+PID_FILE = STATE_DIR / "supervisor.pid"
+SOCKET_FILE = STATE_DIR / "supervisor.sock"
+LOG_DIR = STATE_DIR / "logs"
+
+BACKOFF_BASE = float(os.getenv("SSHCLAUDE_RESTART_BACKOFF", "1"))
+BACKOFF_MAX = float(os.getenv("SSHCLAUDE_RESTART_BACKOFF_MAX", "60"))
+# A child that ran this long before exiting starts over at the base delay.
+STABLE_AFTER = 30.0
+STOP_TIMEOUT = 5.0
+
+
+@dataclass
+class Child:
+    name: str
+    argv: Callable[[], list[str]]
+    env: Callable[[], dict[str, str]] = dict
+    proc: Optional[subprocess.Popen] = field(default=None, repr=False)
+    started_at: float = 0.0
+    next_start: float = 0.0
+    failures: int = 0
+    restarts: int = 0
+    last_exit: Optional[int] = None
+
+
+class Supervisor:
+    """Keeps ``children`` running until told to stop."""
+
+    def __init__(
+        self,
+        children: list[Child],
+        socket_path: Path = SOCKET_FILE,
+        pid_file: Path = PID_FILE,
+        log_dir: Path = LOG_DIR,
+        backoff: float = BACKOFF_BASE,
+        max_backoff: float = BACKOFF_MAX,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.children = {child.name: child for child in children}
+        self.socket_path = socket_path
+        self.pid_file = pid_file
+        self.log_dir = log_dir
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def _spawn(self, child: Child) -> None:
+        now = self._clock()
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(self.log_dir / f"{child.name}.log", "ab") as log:
+                child.proc = subprocess.Popen(
+                    child.argv(),
+                    env={**os.environ, **child.env()},
+                    stdin=subprocess.DEVNULL,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    start_new_session=True,
+                )
+        except (OSError, KeyError, ValueError) as e:
+            print(f"[ERROR] Could not start {child.name}:", e)
+            self._schedule_restart(child, now)
+            return
+        child.started_at = now
+        print(f"[INFO] Started {child.name} (PID {child.proc.pid})")
+
+    def _schedule_restart(self, child: Child, now: float) -> None:
+        if child.started_at and now - child.started_at >= STABLE_AFTER:
+            child.failures = 0
+        delay = min(self.max_backoff, self.backoff * 2**child.failures)
+        child.failures += 1
+        child.next_start = now + delay
+        child.started_at = 0.0
+
+    def tick(self) -> None:
+        """Start children that are due and schedule restarts for exited ones."""
+        now = self._clock()
+        with self._lock:
+            for child in self.children.values():
+                if child.proc is None:
+                    if now >= child.next_start:
+                        self._spawn(child)
+                    continue
+                code = child.proc.poll()
+                if code is None:
+                    continue
+                child.proc, child.last_exit = None, code
+                child.restarts += 1
+                self._schedule_restart(child, now)
+                wait = child.next_start - now
+                print(
+                    f"[WARN] {child.name} exited with {code}; restarting in {wait:.0f}s"
+                )
+
+    def _terminate(self, child: Child) -> None:
+        if child.proc is None or child.proc.poll() is not None:
+            child.proc = None
+            return
+        child.proc.terminate()
+        try:
+            child.proc.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            child.proc.kill()
+            child.proc.wait()
+        child.proc = None
+
+    def restart(self, name: str) -> bool:
+        """Restart ``name`` now, without counting it as a failure."""
+        with self._lock:
+            child = self.children.get(name)
+            if child is None:
+                return False
+            self._terminate(child)
+            child.failures, child.next_start, child.started_at = 0, 0.0, 0.0
+        self.tick()
+        return True
+
+    def status(self) -> dict[str, Any]:
+        now = self._clock()
+        with self._lock:
+            children = {
+                name: {
+                    "running": child.proc is not None and child.proc.poll() is None,
+                    "pid": child.proc.pid if child.proc else None,
+                    "uptime": round(now - child.started_at, 1) if child.proc else 0,
+                    "restarts": child.restarts,
+                    "last_exit": child.last_exit,
+                    "next_start_in": (
+                        max(0.0, round(child.next_start - now, 1))
+                        if not child.proc
+                        else 0
+                    ),
+                }
+                for name, child in self.children.items()
+            }
+        return {"pid": os.getpid(), "children": children}
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _handle(self, line: str) -> dict[str, Any]:
+        command, _, arg = line.strip().partition(" ")
+        if command == "status":
+            return self.status()
+        if command == "restart":
+            return {"ok": self.restart(arg)}
+        if command == "stop":
+            self.stop()
+            return {"ok": True}
+        return {"error": f"unknown command {command!r}"}
+
+    def _serve_control(self) -> socketserver.BaseServer:
+        supervisor = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                line = self.rfile.readline().decode(errors="replace")
+                self.wfile.write(json.dumps(supervisor._handle(line)).encode() + b"\n")
+
+        self.socket_path.unlink(missing_ok=True)
+        server = socketserver.ThreadingUnixStreamServer(str(self.socket_path), Handler)
+        server.daemon_threads = True
+        os.chmod(self.socket_path, 0o600)
+        threading.Thread(
+            target=server.serve_forever, name="supervisor-control", daemon=True
+        ).start()
+        return server
+
+    def serve(self, interval: float = 0.2) -> None:
+        """Run until :meth:`stop`, SIGTERM or SIGINT, then stop the children."""
+        pid = running_pid(self.pid_file)
+        if pid is not None and pid != os.getpid():
+            raise RuntimeError(f"supervisor already running (PID {pid})")
+        self.pid_file.parent.mkdir(parents=True, exist_ok=True)
+        self.pid_file.write_text(str(os.getpid()))
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, lambda *_: self.stop())
+        server = self._serve_control()
+        try:
+            while not self._stopping.is_set():
+                self.tick()
+                self._stopping.wait(interval)
+        finally:
+            server.shutdown()
+            server.server_close()
+            with self._lock:
+                for child in self.children.values():
+                    self._terminate(child)
+            self.socket_path.unlink(missing_ok=True)
+            self.pid_file.unlink(missing_ok=True)
+
+
+def running_pid(pid_file: Path = PID_FILE) -> Optional[int]:
+    """Pid recorded in ``pid_file`` if that process is still alive."""
+    try:
+        pid = int(pid_file.read_text().strip())
+        os.kill(pid, 0)
+    except (OSError, ValueError):
+        return None
+    return pid
+
+
+def request(
+    command: str, socket_path: Path = SOCKET_FILE, timeout: float = 2.0
+) -> Optional[dict]:
+    """Send ``command`` to a running supervisor; None if none is listening."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(socket_path))
+            sock.sendall(command.encode() + b"\n")
+            reply = sock.makefile("rb").readline()
+    except OSError:
+        return None
+    return json.loads(reply) if reply else None
+
+
+def child_running(name: str, socket_path: Path = SOCKET_FILE) -> bool:
+    status = request("status", socket_path)
+    return bool(status and status["children"].get(name, {}).get("running"))
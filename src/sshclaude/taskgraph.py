@@ -0,0 +1,98 @@
+"""Run interdependent setup steps concurrently.
+
+Each :class:`Task` starts as soon as every task it depends on has finished,
+on a thread pool, and receives their results. When a task fails, the tasks
+depending on it are skipped while unrelated ones run to completion, then
+:class:`TaskGraphError` reports what went wrong.
+"""
+
+from __future__ import annotations
+
+from concurrent import futures
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+@dataclass
+class Task:
+    name: str
+    run: Callable[[dict[str, Any]], Any]
+    deps: tuple[str, ...] = ()
+    description: str = ""
+
+
+class TaskGraphError(Exception):
+    def __init__(self, errors: dict[str, BaseException], skipped: list[str]) -> None:
+        self.errors = errors
+        self.skipped = skipped
+        detail = "; ".join(f"{name}: {e}" for name, e in errors.items())
+        super().__init__(detail)
+
+
+def run_graph(
+    tasks: list[Task],
+    max_workers: int = 4,
+    on_change: Optional[Callable[[Task, str, Optional[BaseException]], None]] = None,
+) -> dict[str, Any]:
+    """Run ``tasks`` in dependency order; return their results by name.
+
+    ``on_change(task, state, error)`` is called from the calling thread
+    whenever a task starts, finishes, fails or is skipped.
+    """
+    by_name = {task.name: task for task in tasks}
+    for task in tasks:
+        missing = set(task.deps) - set(by_name)
+        if missing:
+            raise ValueError(f"{task.name} depends on unknown {sorted(missing)}")
+    state = {task.name: PENDING for task in tasks}
+    results: dict[str, Any] = {}
+    errors: dict[str, BaseException] = {}
+
+    def notify(task: Task, new: str, error: Optional[BaseException] = None) -> None:
+        state[task.name] = new
+        if on_change:
+            on_change(task, new, error)
+
+    running: dict[futures.Future, Task] = {}
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            changed = True
+            while changed:  # a skip can unblock tasks listed earlier
+                changed = False
+                for task in tasks:
+                    if state[task.name] != PENDING:
+                        continue
+                    deps = [state[dep] for dep in task.deps]
+                    if any(s in (FAILED, SKIPPED) for s in deps):
+                        notify(task, SKIPPED)
+                        changed = True
+                    elif all(s == DONE for s in deps):
+                        inputs = {dep: results[dep] for dep in task.deps}
+                        running[pool.submit(task.run, inputs)] = task
+                        notify(task, RUNNING)
+            if not running:
+                break
+            finished, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                try:
+                    results[task.name] = future.result()
+                except Exception as e:
+                    errors[task.name] = e
+                    notify(task, FAILED, e)
+                else:
+                    notify(task, DONE)
+
+    stuck = [name for name, s in state.items() if s == PENDING]
+    if stuck:
+        raise ValueError(f"dependency cycle between {stuck}")
+    if errors:
+        skipped = [name for name, s in state.items() if s == SKIPPED]
+        raise TaskGraphError(errors, skipped)
+    return results
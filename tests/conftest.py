@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# db reads DATABASE_URL at import time, so point it at a throwaway file
+# before any test module imports sshclaude.
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmpdir.name}/sshclaude.db"
@@ -1,10 +1,12 @@
 import os
+import threading
+import time
 
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 
 from sshclaude.api import app, init_db
-from sshclaude.db import Base
+from sshclaude.db import Base, Provision, get_session
 
 
 def setup_module(module):
@@ -24,12 +26,12 @@ def test_provision_cycle(monkeypatch):
             self.result = result
 
     def fake_create_tunnel(name):
-        return {"result": {"id": "tid"}}
+        return {"result": {"id": "tid"}, "tunnel_token": "tok"}
 
     def fake_create_dns_record(subdomain, tid):
         return {"result": {"id": "dns"}}
 
-    def fake_create_access_app(login, subdomain):
+    def fake_create_access_app(login, subdomain, team=None):
         return {"result": {"id": "app"}}
 
     monkeypatch.setattr("sshclaude.cloudflare.create_tunnel", fake_create_tunnel)
@@ -44,7 +46,10 @@ def test_provision_cycle(monkeypatch):
     monkeypatch.setattr("sshclaude.cloudflare.delete_dns_record", lambda rec_id: None)
     monkeypatch.setattr("sshclaude.cloudflare.delete_tunnel", lambda tid: None)
 
-    resp = client.post("/provision", json={"github_id": "user1", "subdomain": "test"})
+    resp = client.post(
+        "/provision",
+        json={"github_id": "user1", "email": "user1@example.com", "subdomain": "test"},
+    )
     assert resp.status_code == 200
     data = resp.json()
     assert data["tunnel_id"] == "tid"
@@ -62,7 +67,9 @@ def test_provision_cycle(monkeypatch):
     resp = client.post("/rotate-key/test")
     assert resp.status_code == 200
 
-    resp = client.delete("/provision/test", json={"tunnel_token": data["tunnel_token"]})
+    resp = client.request(
+        "DELETE", "/provision/test", json={"tunnel_token": data["tunnel_token"]}
+    )
     assert resp.status_code == 200
 
     resp = client.get("/provision/test")
@@ -91,3 +98,178 @@ def test_login_flow():
     resp = client.get(f"/login/{uid}/status")
     assert resp.status_code == 200
     assert resp.json() == {"verified": True}
+
+
+def test_login_status_long_poll_wakes_on_verify():
+    client = TestClient(app)
+
+    data = client.post("/login").json()
+    uid = data["url"].split("/")[-1]
+
+    def verify():
+        time.sleep(0.2)
+        TestClient(app).post(f"/login/{uid}", json={"token": data["token"]})
+
+    threading.Thread(target=verify).start()
+    start = time.monotonic()
+    resp = client.get(f"/login/{uid}/status", params={"wait": 10})
+    assert resp.json() == {"verified": True}
+    assert time.monotonic() - start < 5
+
+    resp = client.get(f"/login/{uid}/events")
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    assert 'data: {"verified": true}' in resp.text
+
+
+def test_history_fast_json_matches_default(monkeypatch):
+    client = TestClient(app)
+    client.post(
+        "/record-login/fast.example.com", json={"user": "a@b.c", "ip": "10.0.0.1"}
+    )
+
+    default = client.get("/history/fast.example.com").json()
+    monkeypatch.setattr("sshclaude.responses.FAST_JSON", True)
+    fast = client.get("/history/fast.example.com").json()
+
+    assert fast == default
+    assert default[0]["user"] == "a@b.c"
+
+
+def test_history_conditional_get():
+    client = TestClient(app)
+    client.post(
+        "/record-login/etag.example.com", json={"user": "a@b.c", "ip": "10.0.0.1"}
+    )
+
+    resp = client.get("/history/etag.example.com")
+    etag, seen = resp.headers["etag"], len(resp.json())
+    resp = client.get("/history/etag.example.com", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+    client.post(
+        "/record-login/etag.example.com", json={"user": "d@e.f", "ip": "10.0.0.2"}
+    )
+    resp = client.get("/history/etag.example.com", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert len(resp.json()) == seen + 1
+    assert resp.headers["etag"] != etag
+
+
+def test_rotate_key_batch(monkeypatch):
+    client = TestClient(app)
+    rotated = []
+    monkeypatch.setattr("sshclaude.cloudflare.rotate_host_key", rotated.append)
+
+    with get_session() as db:
+        for name in ("a.batch.example.com", "b.batch.example.com"):
+            db.add(
+                Provision(
+                    github_id="batcher",
+                    subdomain=name,
+                    tunnel_id=f"tid-{name}",
+                    tunnel_token="tok",
+                    dns_record_id="dns",
+                    access_app_id="app",
+                )
+            )
+        db.commit()
+
+    def wait_for(job_id):
+        for _ in range(50):
+            status = client.get(f"/rotate-key/batch/{job_id}").json()
+            if status["finished"]:
+                return status
+            time.sleep(0.05)
+        raise AssertionError("rotation job did not finish")
+
+    resp = client.post(
+        "/rotate-key/batch",
+        json={"subdomains": ["a.batch.example.com", "missing.example.com"]},
+    )
+    assert resp.status_code == 202
+    status = wait_for(resp.json()["job_id"])
+    assert status["done"] == 1 and status["failed"] == 1
+    assert rotated == ["tid-a.batch.example.com"]
+
+    resp = client.post("/rotate-key/batch", json={"github_id": "batcher"})
+    assert resp.json()["total"] == 2
+    assert wait_for(resp.json()["job_id"])["done"] == 2
+
+
+def test_rotate_key_batch_defers_when_circuit_open(monkeypatch):
+    from sshclaude import ratelimit, rotation
+    from sshclaude.breaker import CircuitOpenError
+
+    client = TestClient(app)
+    outcomes = [CircuitOpenError("cloudflare.tunnels", 1), None]
+
+    def flaky_rotate(tunnel_id):
+        outcome = outcomes.pop(0)
+        if outcome:
+            raise outcome
+
+    monkeypatch.setattr("sshclaude.cloudflare.rotate_host_key", flaky_rotate)
+    monkeypatch.setattr(rotation, "ROTATION_RETRY_INTERVAL", 0.01)
+    monkeypatch.setattr(ratelimit, "buckets", ratelimit.MemoryBuckets())
+    with get_session() as db:
+        db.add(
+            Provision(
+                github_id="deferred",
+                subdomain="c.batch.example.com",
+                tunnel_id="tid-c",
+                tunnel_token="tok",
+                dns_record_id="dns",
+                access_app_id="app",
+            )
+        )
+        db.commit()
+
+    job_id = client.post("/rotate-key/batch", json={"github_id": "deferred"}).json()[
+        "job_id"
+    ]
+    for _ in range(100):
+        status = client.get(f"/rotate-key/batch/{job_id}").json()
+        if status["finished"]:
+            break
+        time.sleep(0.05)
+    assert (status["finished"], status["done"], outcomes) == (True, 1, [])
+
+
+def test_login_creation_has_its_own_rate_limit(monkeypatch):
+    from sshclaude import ratelimit
+
+    client = TestClient(app)
+    monkeypatch.setattr(ratelimit, "buckets", ratelimit.MemoryBuckets())
+
+    for _ in range(ratelimit.BUDGETS["login"].burst):
+        assert client.post("/login").status_code == 200
+    resp = client.post("/login")
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+    # The callback shares the login budget; reads keep their own.
+    assert client.get("/oauth/callback?code=c&state=s").status_code == 429
+    assert client.get("/login/unknown/status").status_code == 404
+
+
+def test_rotate_key_response_feeds_cli_refresh(monkeypatch):
+    from sshclaude import cli, ratelimit
+
+    client = TestClient(app)
+    monkeypatch.setattr("sshclaude.cloudflare.rotate_host_key", lambda tid: None)
+    monkeypatch.setattr(ratelimit, "buckets", ratelimit.MemoryBuckets())
+    with get_session() as db:
+        db.add(
+            Provision(
+                github_id="rotator",
+                subdomain="rot.example.com",
+                tunnel_id="tid-rot",
+                tunnel_token="tok-rot",
+                dns_record_id="dns",
+                access_app_id="app",
+            )
+        )
+        db.commit()
+
+    # The CLI (and `fleet refresh-token`) reads the token from this response.
+    config = {"domain": "rot.example.com"}
+    assert cli._rotate_token(client, config) == "tok-rot"
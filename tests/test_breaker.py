@@ -0,0 +1,74 @@
+import pytest
+import requests
+
+from sshclaude import cloudflare
+from sshclaude.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from sshclaude.breaker import CircuitOpenError as OpenError
+
+
+def test_breaker_opens_and_probes_half_open():
+    now = [0.0]
+    breaker = CircuitBreaker(
+        "test", failure_threshold=2, reset_timeout=10, clock=lambda: now[0]
+    )
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(OpenError):
+        breaker.before_call()
+
+    now[0] = 10
+    breaker.before_call()  # the single half-open probe
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(OpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_tunnel_listing_falls_back_to_last_known_good(monkeypatch):
+    class Resp:
+        status_code = 200
+        ok = True
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"result": [{"id": "tid", "name": "host"}]}
+
+    monkeypatch.setenv("CLOUDFLARE_TOKEN", "t")
+    monkeypatch.setattr(
+        cloudflare, "breakers", {"tunnels": CircuitBreaker("t", failure_threshold=1)}
+    )
+    monkeypatch.setattr(cloudflare, "_last_known_good", {})
+    monkeypatch.setattr(cloudflare.requests, "request", lambda *a, **kw: Resp())
+    assert cloudflare.create_tunnel("host") == {"result": {"id": "tid", "name": "host"}}
+
+    def down(*args, **kwargs):
+        raise requests.ConnectionError("down")
+
+    monkeypatch.setattr(cloudflare.requests, "request", down)
+    assert cloudflare.create_tunnel("host")["result"]["id"] == "tid"
+    # The breaker is now open, so the next lookup never reaches the network.
+    assert cloudflare.breakers["tunnels"].state == OPEN
+    assert cloudflare.create_tunnel("host")["result"]["id"] == "tid"
+
+
+def test_unexpected_probe_error_reopens_breaker(monkeypatch):
+    breaker = CircuitBreaker("t", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    monkeypatch.setenv("CLOUDFLARE_TOKEN", "t")
+    monkeypatch.setattr(cloudflare, "breakers", {"tunnels": breaker})
+
+    def broken(*args, **kwargs):
+        raise ValueError("boom")
+
+    monkeypatch.setattr(cloudflare.requests, "request", broken)
+    with pytest.raises(ValueError):
+        cloudflare._request("tunnels", "GET", "https://example.invalid")
+    # The failed probe settled the breaker, so the next call may probe again.
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
@@ -0,0 +1,155 @@
+import subprocess
+import sys
+import threading
+import webbrowser
+
+import requests
+from click.testing import CliRunner
+
+from sshclaude import cli, launcher, supervisor
+
+
+class Resp:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body or {}
+
+    def json(self):
+        return self._body
+
+
+def test_wait_for_verification_stops_on_404_and_backs_off_on_429(monkeypatch):
+    replies = [Resp(429, headers={"Retry-After": "3"}), Resp(404)]
+    calls, sleeps = [], []
+
+    def fake_get(url, **kwargs):
+        if url.endswith("/events"):
+            raise requests.ConnectionError("no stream")
+        calls.append(url)
+        return replies.pop(0)
+
+    monkeypatch.setattr(requests, "get", fake_get)
+    monkeypatch.setattr(cli.time, "sleep", sleeps.append)
+    assert cli.wait_for_verification("uid", timeout=60) is False
+    assert (len(calls), sleeps) == (2, [3.0])
+
+
+def test_quick_commands_do_not_import_http_or_rendering_stacks():
+    code = (
+        "import sys; from sshclaude import cli; "
+        "print(sorted({'requests', 'rich', 'yaml'} & set(sys.modules)))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert out.stdout.strip() == "[]", out.stderr
+
+
+def test_pooled_guard_checks_token_then_falls_back_when_pool_is_down(
+    monkeypatch, tmp_path
+):
+    monkeypatch.setattr(cli, "CONFIG_FILE", tmp_path / ".sshclaude" / "config.yaml")
+    monkeypatch.setattr(cli, "LAUNCHER_FILE", tmp_path / "launch_claude.sh")
+    monkeypatch.setattr(
+        launcher, "resolve", lambda: {"node": "", "claude": "", "path": ""}
+    )
+    cli.write_launcher("secret", pool_size=2)
+    guard = tmp_path / ".sshclaude" / "token_guard.sh"
+    env = {
+        "HOME": str(tmp_path),
+        "PATH": "/usr/bin:/bin",
+        "PYTHONPATH": ":".join(sys.path),
+    }
+
+    def run(token):
+        return subprocess.run(
+            ["bash", str(guard)], input=token, env=env, capture_output=True, text=True
+        )
+
+    denied = run("wrong\n")
+    assert (denied.returncode, denied.stdout.strip()) == (1, "Unauthorized")
+    # No pool socket: attach exits 75 and the guard goes on to start claude
+    # itself, which is not installed here.
+    fallback = run("secret\n")
+    assert fallback.returncode == 127, fallback.stderr
+    assert "claude" in fallback.stderr
+
+
+def test_flat_config_becomes_default_profile(monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, "CONFIG_FILE", tmp_path / "config.yaml")
+    cli.CONFIG_FILE.write_text("domain: a.example.com\ntunnel_token: t1\n")
+    assert cli.read_config()["domain"] == "a.example.com"
+
+    monkeypatch.setattr(cli, "_profile", "build-01")
+    cli.write_config({"domain": "b.example.com", "tunnel_token": "t2"})
+    assert cli.local_profile() == "default"
+    assert cli.read_config("default")["tunnel_token"] == "t1"
+    assert sorted(cli.read_profiles()) == ["build-01", "default"]
+
+
+def test_fleet_refresh_token_runs_profiles_concurrently(monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, "CONFIG_FILE", tmp_path / "config.yaml")
+    for name in ("a", "b", "c"):
+        cli.write_config({"domain": f"{name}.example.com", "tunnel_token": "old"}, name)
+    cli.set_local_profile("a")
+    restarted = []
+    monkeypatch.setattr(cli, "write_tunnel_files", lambda *args: restarted.append(args))
+    monkeypatch.setattr(supervisor, "request", lambda command: {"ok": True})
+    # Every profile has to be in flight at once for the barrier to open.
+    barrier = threading.Barrier(3, timeout=5)
+
+    class Session:
+        def post(self, url, timeout):
+            barrier.wait()
+            host = url.rsplit("/", 1)[-1]
+            if host.startswith("c."):
+                return Resp(500)
+            return Resp(200, {"tunnel_token": f"new-{host[0]}"})
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}")
+
+    monkeypatch.setattr(Resp, "raise_for_status", raise_for_status, raising=False)
+    monkeypatch.setattr(requests, "Session", Session)
+    result = CliRunner().invoke(cli.cli, ["fleet", "refresh-token", "--jobs", "3"])
+
+    assert result.exit_code == 1, result.output
+    assert "2 succeeded, 1 failed" in result.output
+    tokens = {name: p["tunnel_token"] for name, p in cli.read_profiles().items()}
+    assert tokens == {"a": "new-a", "b": "new-b", "c": "old"}
+    assert restarted == [("a.example.com", "new-a")]
+
+
+def test_init_overlaps_installs_launcher_and_login(monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, "CONFIG_FILE", tmp_path / "config.yaml")
+    # Installs, launcher generation and the OAuth wait only meet here if they
+    # run at the same time.
+    barrier = threading.Barrier(3, timeout=5)
+    started = []
+    monkeypatch.setattr(cli, "install_tools", barrier.wait)
+    monkeypatch.setattr(cli, "write_launcher", lambda *args: barrier.wait())
+    monkeypatch.setattr(cli, "wait_for_verification", lambda uid: barrier.wait() >= 0)
+    monkeypatch.setattr(cli, "write_tunnel_files", lambda *args: None)
+    monkeypatch.setattr(cli, "install_service", lambda: started.append(True))
+    monkeypatch.setattr(webbrowser, "open", lambda url: None)
+
+    def fake_post(url, **kwargs):
+        if url.endswith("/login"):
+            return Resp(200, {"url": "/login/u1", "token": "t", "client_id": "c"})
+        assert kwargs["json"]["email"] == "me@example.com"
+        return Resp(200, {"tunnel_id": "tid", "tunnel_token": "tok"})
+
+    monkeypatch.setattr(Resp, "raise_for_status", lambda self: None, raising=False)
+    monkeypatch.setattr(requests, "post", fake_post)
+    monkeypatch.setattr(
+        requests, "get", lambda url, **kw: Resp(200, {"email": "me@example.com"})
+    )
+    result = CliRunner().invoke(
+        cli.cli, ["--profile", "box", "init", "--github", "me", "--domain", "d.dev"]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Initialization complete" in result.output
+    assert started == [True]
+    assert cli.local_profile() == "box"
+    assert cli.read_config("box")["tunnel_token"] == "tok"
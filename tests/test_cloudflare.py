@@ -0,0 +1,120 @@
+from sshclaude import cloudflare
+
+
+class Resp:
+    def __init__(self, result, status_code=200):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = ""
+        self._result = result
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"result": self._result}
+
+
+def test_access_apps_share_one_policy_per_email(monkeypatch):
+    calls = []
+
+    def fake_request(family, method, url, **kwargs):
+        calls.append((method, url.rsplit("/", 2)[-2:], kwargs.get("json")))
+        if method == "GET":
+            return Resp([])
+        if url.endswith("/access/policies"):
+            return Resp({"id": "pol-1"})
+        return Resp({"id": f"app-{kwargs['json']['domain']}"})
+
+    monkeypatch.setattr(cloudflare, "_request", fake_request)
+    monkeypatch.setattr(cloudflare, "_policy_ids", {})
+    monkeypatch.setattr(cloudflare, "_policies_listed", False)
+    monkeypatch.setattr(cloudflare, "REUSABLE_POLICIES", True)
+
+    cloudflare.create_access_app("Dev@Example.com", "one.example.com")
+    cloudflare.create_access_app("dev@example.com", "two.example.com")
+
+    posts = [c for c in calls if c[0] == "POST"]
+    assert [p[1] for p in posts] == [
+        ["access", "policies"],
+        ["access", "apps"],
+        ["access", "apps"],
+    ]
+    assert all(
+        p[2]["policies"] == [{"id": "pol-1", "precedence": 1}] for p in posts[1:]
+    )
+
+
+def test_policy_lookup_pages_through_listing(monkeypatch):
+    pages = {
+        1: [{"id": "p1", "name": "other"}],
+        2: [{"id": "p2", "name": "sshclaude-team-org/ops"}],
+    }
+    calls = []
+
+    class PagedResp(Resp):
+        def __init__(self, page):
+            super().__init__(pages[page])
+            self.page = page
+
+        def json(self):
+            return {
+                "result": self._result,
+                "result_info": {"page": self.page, "total_pages": 2},
+            }
+
+    def fake_request(family, method, url, **kwargs):
+        calls.append((method, kwargs.get("params", {}).get("page")))
+        if url.endswith("/access/policies"):
+            return PagedResp(kwargs["params"]["page"])
+        if method == "GET":
+            return Resp([])
+        return Resp({"id": "app-1"})
+
+    monkeypatch.setattr(cloudflare, "_request", fake_request)
+    monkeypatch.setattr(cloudflare, "_policy_ids", {})
+    monkeypatch.setattr(cloudflare, "_policies_listed", False)
+    monkeypatch.setattr(cloudflare, "GITHUB_IDP_ID", "idp")
+
+    app = cloudflare.create_access_app(
+        "dev@example.com", "ops.example.com", team="Org/Ops"
+    )
+    assert app["result"]["id"] == "app-1"
+    # The team policy was found on page 2, so none was created.
+    assert ("GET", 2) in calls and calls.count(("POST", None)) == 1
+
+
+def test_policy_misses_after_warm_up_post_directly(monkeypatch):
+    existing = []
+    calls = []
+
+    class ConflictResp(Resp):
+        def json(self):
+            return {"errors": [{"message": "policy already exists"}]}
+
+    def fake_request(family, method, url, **kwargs):
+        calls.append((method, url.rsplit("/", 1)[-1]))
+        if method == "GET":
+            return Resp(list(existing))
+        name = kwargs["json"]["name"]
+        if name == "sshclaude-email-raced@example.com":
+            # Another API process created it after the warm-up listing.
+            existing.append({"id": "pol-raced", "name": name})
+            return ConflictResp(None, status_code=400)
+        return Resp({"id": f"pol-{len(calls)}"})
+
+    monkeypatch.setattr(cloudflare, "_request", fake_request)
+    monkeypatch.setattr(cloudflare, "_policy_ids", {})
+    monkeypatch.setattr(cloudflare, "_policies_listed", False)
+
+    def policy(email):
+        name = cloudflare.email_policy_name(email)
+        return cloudflare.get_or_create_policy(name, [])
+
+    policy("a@example.com")
+    policy("b@example.com")
+    assert calls == [("GET", "policies"), ("POST", "policies"), ("POST", "policies")]
+
+    calls.clear()
+    assert policy("raced@example.com") == "pol-raced"
+    assert calls == [("POST", "policies"), ("GET", "policies")]
@@ -0,0 +1,88 @@
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from sshclaude import db, server
+from sshclaude.sessions import MemorySessionStore
+
+
+def test_read_only_sessions_route_to_replica(monkeypatch):
+    replica = create_engine("sqlite:///:memory:")
+    monkeypatch.setattr(db, "replica_engines", [replica])
+    monkeypatch.setattr(db, "_write_markers", MemorySessionStore())
+    monkeypatch.setattr(db, "_replica_lags", {})
+
+    with db.get_session(read_only=True, key="fresh.example.com") as session:
+        assert session.get_bind() is replica
+
+    with db.get_session(key="written.example.com") as session:
+        assert session.get_bind() is db.engine
+
+    # Read-your-writes: a recently written key is read from the primary.
+    with db.get_session(read_only=True, key="written.example.com") as session:
+        assert session.get_bind() is db.engine
+
+
+def test_replica_use_follows_measured_lag(monkeypatch):
+    replica = create_engine("sqlite:///:memory:")
+    lag = [1.0]
+    # The write markers are shared, e.g. written by another worker.
+    markers = MemorySessionStore()
+    markers.put("k.example.com", {"at": time.time() - 2})
+    monkeypatch.setattr(db, "replica_engines", [replica])
+    monkeypatch.setattr(db, "_write_markers", markers)
+    monkeypatch.setattr(
+        db, "replica_lag", lambda engine: lag[0] and (time.time(), lag[0])
+    )
+
+    def bind(key):
+        with db.get_session(read_only=True, key=key) as session:
+            return session.get_bind()
+
+    # 1s behind: it has replayed the write made 2s ago.
+    assert bind("k.example.com") is replica
+    lag[0] = 3.0
+    assert bind("k.example.com") is db.engine
+    assert bind("other.example.com") is replica
+    # Beyond DATABASE_REPLICA_MAX_LAG, or unreachable: not used at all.
+    for lag[0] in (db.DATABASE_REPLICA_MAX_LAG + 1, None):
+        assert bind("other.example.com") is db.engine
+
+
+def test_upsert_provision_updates_in_place():
+    engine = create_engine("sqlite:///:memory:")
+    db.Base.metadata.create_all(bind=engine)
+    row = dict(
+        subdomain="up.example.com",
+        tunnel_id="t1",
+        tunnel_token="tok1",
+        dns_record_id="d1",
+        access_app_id="a1",
+    )
+
+    with Session(bind=engine) as session:
+        db.upsert_provision(session, github_id="owner", **row)
+        db.bump_version(session, "up.example.com")
+        db.upsert_provision(
+            session, github_id="other", **{**row, "tunnel_token": "tok2"}
+        )
+        db.bump_version(session, "up.example.com")
+        session.commit()
+
+        provision = session.query(db.Provision).one()
+        assert (provision.github_id, provision.tunnel_token) == ("owner", "tok2")
+        assert db.get_version(session, "up.example.com").version == 2
+
+
+def test_post_fork_discards_inherited_connections(monkeypatch):
+    disposed = []
+
+    class Engine:
+        def dispose(self, close=True):
+            disposed.append(close)
+
+    monkeypatch.setattr(db, "engine", Engine())
+    monkeypatch.setattr(db, "replica_engines", [Engine()])
+    server.post_fork(None, None)
+    assert disposed == [False, False]
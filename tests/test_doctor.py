@@ -0,0 +1,173 @@
+import base64
+import hashlib
+import json
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from sshclaude import doctor
+
+METRICS = """\
+# HELP cloudflared_tunnel_ha_connections Number of active ha connections
+# TYPE cloudflared_tunnel_ha_connections gauge
+cloudflared_tunnel_ha_connections 4
+cloudflared_tunnel_total_requests 120
+cloudflared_tunnel_request_errors 3
+cloudflared_tunnel_timer_retries{conn_index="0"} 1
+cloudflared_tunnel_timer_retries{conn_index="1"} 0
+cloudflared_proxy_connect_latency_bucket{le="1"} 10
+cloudflared_proxy_connect_latency_bucket{le="10"} 90
+cloudflared_proxy_connect_latency_bucket{le="100"} 100
+cloudflared_proxy_connect_latency_bucket{le="+Inf"} 100
+cloudflared_proxy_connect_latency_sum 450
+cloudflared_proxy_connect_latency_count 100
+"""
+
+
+class FakeTtyd(socketserver.StreamRequestHandler):
+    """Speaks ttyd's WebSocket protocol with a terminal that echoes input."""
+
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        headers = {}
+        self.rfile.readline()
+        for line in iter(self.rfile.readline, b"\r\n"):
+            name, _, value = line.decode().partition(":")
+            headers[name.lower()] = value.strip()
+        accept = base64.b64encode(
+            hashlib.sha1(
+                headers["sec-websocket-key"].encode() + doctor._WS_GUID
+            ).digest()
+        )
+        self.wfile.write(
+            b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+            b"Connection: Upgrade\r\nSec-WebSocket-Protocol: tty\r\n"
+            b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n"
+        )
+        _, _, init = doctor.read_frame(self.rfile)
+        assert json.loads(init)["columns"] == 80
+        self.send(b"0Token: ")
+        while True:
+            opcode, _, payload = doctor.read_frame(self.rfile)
+            if opcode == doctor.OP_CLOSE:
+                return
+            if payload == b"0\x15":
+                self.send(b"0" + b"\b \b" * 3)
+            else:
+                self.send(payload)
+
+    def send(self, payload):
+        self.wfile.write(doctor.encode_frame(doctor.OP_BINARY, payload, masked=False))
+
+
+class FakeApi(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body, content_type="application/json", status=200):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self.reply(METRICS, "text/plain")
+        elif self.path == "/health":
+            self.reply('{"status": "ok"}')
+        elif self.path == f"/login/{doctor.PROBE_UID}/status?wait=0":
+            self.reply('{"detail": "Not found"}', status=404)
+        else:
+            assert self.path == "/login/abc/status?wait=0"
+            self.reply('{"verified": false}')
+
+    def do_POST(self):
+        self.server.logins += 1
+        self.reply('{"url": "/login/abc", "token": "t", "client_id": "c"}')
+
+
+class BrokenProxy(socketserver.StreamRequestHandler):
+    """Answers every request with a status line http.client cannot parse."""
+
+    def handle(self):
+        self.rfile.readline()
+        self.wfile.write(b"garbage\r\n\r\n")
+
+
+@pytest.fixture
+def servers():
+    ttyd = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeTtyd)
+    api = ThreadingHTTPServer(("127.0.0.1", 0), FakeApi)
+    ttyd.daemon_threads = api.daemon_threads = True
+    api.logins = 0
+    for server in (ttyd, api):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield ttyd.server_address[1], api.server_address[1], api
+    for server in (ttyd, api):
+        server.shutdown()
+        server.server_close()
+
+
+def test_metrics_summary_and_histogram_quantiles():
+    summary = doctor.summarize_metrics(doctor.parse_prometheus(METRICS))
+    assert summary["ha_connections"] == 4
+    assert (summary["request_errors"], summary["heartbeat_retries"]) == (3, 1)
+    assert summary["connect_latency_ms"] == {"mean": 4.5, "p50": 5.5, "p95": 55.0}
+
+
+def test_bench_reports_every_hop(servers):
+    ttyd_port, api_port, api = servers
+    report = doctor.run(
+        f"http://127.0.0.1:{api_port}",
+        bench=True,
+        samples=8,
+        ttyd_port=ttyd_port,
+        metrics_addresses=["127.0.0.1:1", f"127.0.0.1:{api_port}"],
+    )
+    assert report["ok"], report
+    assert report["ttyd"]["rtt_ms"]["p50"] > 0
+    assert report["ttyd"]["echo_kib_s"] > 0
+    assert report["cloudflared"]["address"] == f"127.0.0.1:{api_port}"
+    # No login session is created unless asked for.
+    assert set(report["api"]) == {"health", "login_status", "ok"}
+    assert report["api"]["login_status"]["status"] == 404
+    assert api.logins == 0
+    hops = [hop for hop, _, ok in doctor.format_report(report) if ok]
+    assert hops[-2:] == [f"ttyd :{ttyd_port}", "ttyd websocket"]
+    json.dumps(report)
+
+
+def test_bench_login_probe_is_opt_in(servers):
+    _, api_port, api = servers
+    result = doctor.probe_api(f"http://127.0.0.1:{api_port}", samples=2, login=True)
+    assert result["ok"], result
+    assert result["login_status"]["status"] == 200
+    assert api.logins == 1
+
+
+def test_malformed_http_response_is_reported_as_failed_hop():
+    proxy = socketserver.TCPServer(("127.0.0.1", 0), BrokenProxy)
+    threading.Thread(target=proxy.serve_forever, daemon=True).start()
+    try:
+        address = f"127.0.0.1:{proxy.server_address[1]}"
+        report = doctor.run(
+            f"http://{address}", bench=True, ttyd_port=1, metrics_addresses=[address]
+        )
+    finally:
+        proxy.shutdown()
+        proxy.server_close()
+    assert not report["api"]["ok"] and report["api"]["error"]
+    assert not report["cloudflared"]["ok"]
+
+
+def test_unreachable_stack_is_reported_not_raised():
+    report = doctor.run(
+        "http://127.0.0.1:1", bench=True, ttyd_port=1, metrics_addresses=[]
+    )
+    assert not report["ok"]
+    assert not any(ok for _, _, ok in doctor.format_report(report))
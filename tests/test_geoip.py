@@ -0,0 +1,37 @@
+from fastapi.testclient import TestClient
+
+from sshclaude import geoip
+
+
+def test_compiled_index_looks_up_ranges(tmp_path):
+    rows = [
+        ("10.0.0.0", "10.0.0.255", "US", "AS64500"),
+        ("1.1.1.0", "1.1.1.255", "AU", "AS13335"),
+        ("2001:db8::", "2001:db8::ffff", "DE", "AS64501"),
+    ]
+    path = tmp_path / "ipdb.bin"
+    assert geoip.compile_ranges(rows, path) == 3
+
+    db = geoip.IPDatabase(str(path))
+    assert db.lookup("1.1.1.1") == ("AU", "AS13335")
+    assert db.lookup("10.0.0.255") == ("US", "AS64500")
+    assert db.lookup("2001:db8::42") == ("DE", "AS64501")
+    assert db.lookup("10.0.1.0") is None
+    assert db.lookup("0.0.0.1") is None
+    assert db.lookup("not-an-ip") is None
+
+
+def test_history_includes_enrichment(tmp_path, monkeypatch):
+    from sshclaude.api import app
+
+    path = tmp_path / "ipdb.bin"
+    geoip.compile_ranges([("192.0.2.0", "192.0.2.255", "NL", "AS64502")], path)
+    monkeypatch.setattr(geoip, "_db", geoip.IPDatabase(str(path)))
+    monkeypatch.setattr(geoip, "_db_loaded", True)
+
+    client = TestClient(app)
+    client.post(
+        "/record-login/geo.example.com", json={"user": "a@b.c", "ip": "192.0.2.7"}
+    )
+    row = client.get("/history/geo.example.com").json()[0]
+    assert (row["country"], row["asn"]) == ("NL", "AS64502")
@@ -0,0 +1,57 @@
+from sshclaude import github
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, etag=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self._body = body
+        self.headers = {"ETag": etag} if etag else {}
+
+    def json(self):
+        return self._body
+
+
+def _fake_github(monkeypatch, calls):
+    bodies = {
+        "/user": {"id": 42, "login": "octocat"},
+        "/user/emails": [{"email": "o@example.com", "primary": True, "verified": True}],
+    }
+
+    def fake_get(path, access_token, etag):
+        calls.append((path, access_token, etag))
+        if etag == f"etag{path}":
+            return FakeResponse(304)
+        return FakeResponse(200, bodies[path], etag=f"etag{path}")
+
+    monkeypatch.setattr(github, "_get", fake_get)
+    monkeypatch.setattr(github, "_emails", {})
+
+
+def test_fetch_identity_revalidates_emails_across_logins(monkeypatch):
+    calls = []
+    _fake_github(monkeypatch, calls)
+    monkeypatch.setattr(github, "PROFILE_CACHE_TTL", 0)
+
+    # Each OAuth login brings a new access token for the same user.
+    first = github.fetch_identity("token-1")
+    second = github.fetch_identity("token-2")
+
+    assert first == second == github.GitHubIdentity("42", "octocat", "o@example.com")
+    assert calls == [
+        ("/user", "token-1", None),
+        ("/user/emails", "token-1", None),
+        ("/user", "token-2", None),
+        ("/user/emails", "token-2", "etag/user/emails"),
+    ]
+
+
+def test_fetch_identity_serves_fresh_emails_from_cache(monkeypatch):
+    calls = []
+    _fake_github(monkeypatch, calls)
+
+    github.fetch_identity("token-1")
+    identity = github.fetch_identity("token-2")
+
+    assert identity.email == "o@example.com"
+    assert [path for path, _, _ in calls] == ["/user", "/user/emails", "/user"]
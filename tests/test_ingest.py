@@ -0,0 +1,64 @@
+import json
+import os
+import uuid
+
+from sshclaude import db, ingest
+
+
+def test_parse_access_and_cloudflared_lines():
+    access = json.dumps(
+        {
+            "AppDomain": "Box.example.com/ssh",
+            "Email": "a@b.c",
+            "IPAddress": "1.2.3.4",
+            "Action": "login",
+            "Allowed": True,
+            "CreatedAt": "2024-05-01T12:00:00Z",
+        }
+    )
+    event = ingest.parse_line(access.encode())
+    assert event["subdomain"] == "box.example.com"
+    assert event["timestamp"].isoformat() == "2024-05-01T12:00:00"
+
+    logfmt = (
+        b'2024-05-01T12:00:00Z INF request email="a@b.c" ip=5.6.7.8 time=1714564800'
+    )
+    event = ingest.parse_line(logfmt, default_subdomain="box.example.com")
+    assert (event["ip"], event["timestamp"].hour) == ("5.6.7.8", 12)
+    assert ingest.parse_line(access.replace('"login"', '"logout"').encode()) is None
+    assert ingest.parse_line(b"not a login") is None
+
+
+def test_tail_follows_rotation(tmp_path):
+    log = tmp_path / "access.log"
+    log.write_bytes(b"one\ntwo\n")
+    lines = ingest.tail(str(log), follow=True, poll=0)
+    assert [next(lines)[0], next(lines)[0]] == [b"one\n", b"two\n"]
+    assert next(lines) is None
+
+    log.rename(tmp_path / "access.log.1")
+    log.write_bytes(b"three\n")
+    assert next(lines)[0] == b"three\n"
+
+
+def test_ingest_checkpoints_offsets(tmp_path):
+    db.init_db()
+    subdomain = f"{uuid.uuid4().hex[:8]}.ingest.example.com"
+    log = tmp_path / "access.log"
+    checkpoint = tmp_path / "checkpoint.json"
+    line = json.dumps(
+        {"AppDomain": subdomain, "Email": "a@b.c", "IPAddress": "1.2.3.4"}
+    )
+    log.write_text(f"{line}\n{line}\n{line}\n{line[:10]}")
+
+    assert ingest.run([str(log)], checkpoint=checkpoint, batch_size=2) == 3
+    assert ingest.run([str(log)], checkpoint=checkpoint) == 0  # nothing replayed
+    with log.open("a") as f:
+        f.write(line[10:] + "\n")  # the partial line is completed
+    assert ingest.run([str(log)], checkpoint=checkpoint) == 1
+
+    saved = json.loads(checkpoint.read_text())[str(log)]
+    assert saved == {"inode": os.stat(log).st_ino, "offset": log.stat().st_size}
+    with db.get_session() as session:
+        assert session.query(db.LoginEvent).filter_by(subdomain=subdomain).count() == 4
+        assert db.get_version(session, subdomain).version == 2
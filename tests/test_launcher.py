@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+import sys
+
+from sshclaude import launcher
+
+
+def _setup(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name, body in (("node", "echo node"), ("claude", 'echo "claude-ran $PATH"')):
+        (bin_dir / name).write_text(f"#!/bin/sh\n{body}\n")
+        (bin_dir / name).chmod(0o755)
+    nvm_dir = tmp_path / "nvm"
+    (nvm_dir / "alias").mkdir(parents=True)
+    # A stand-in for nvm: ``nvm use`` puts the node/claude directory on PATH.
+    (nvm_dir / "nvm.sh").write_text(
+        f'echo NVM-LOADED\nnvm() {{ PATH="{bin_dir}:$PATH"; }}\n'
+    )
+    monkeypatch.setenv("PATH", "/usr/bin:/bin")
+    monkeypatch.setenv("NVM_DIR", str(nvm_dir))
+    token_file = tmp_path / "session_token"
+    token_file.write_text("secret")
+    paths = {
+        "guard": tmp_path / "token_guard.sh",
+        "runtime_file": tmp_path / "runtime.json",
+    }
+    return bin_dir, nvm_dir, token_file, paths
+
+
+def _run(guard, tmp_path):
+    env = {
+        "HOME": str(tmp_path),
+        "PATH": "/usr/bin:/bin",
+        "NVM_DIR": os.environ["NVM_DIR"],
+        "PYTHONPATH": ":".join(sys.path),
+    }
+    return subprocess.run(
+        ["bash", str(guard)], input="secret\n", env=env, capture_output=True, text=True
+    )
+
+
+def test_guard_execs_resolved_claude_without_loading_nvm(tmp_path, monkeypatch):
+    bin_dir, _, token_file, paths = _setup(tmp_path, monkeypatch)
+    runtime = launcher.write_guard(token_file, **paths)
+    assert runtime["claude"] == str(bin_dir / "claude")
+    assert "nvm.sh" not in paths["guard"].read_text()
+
+    out = _run(paths["guard"], tmp_path)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout == f"claude-ran {bin_dir}:/usr/bin:/bin\n"
+    assert "NVM-LOADED" not in out.stdout
+
+
+def test_guard_re_resolves_after_nvm_default_changes(tmp_path, monkeypatch):
+    _, nvm_dir, token_file, paths = _setup(tmp_path, monkeypatch)
+    launcher.write_guard(token_file, **paths)
+    runtime = json.loads(paths["runtime_file"].read_text())
+    (nvm_dir / "alias" / "default").write_text("20")
+    os.utime(paths["runtime_file"], (1, 1))
+
+    out = _run(paths["guard"], tmp_path)
+    assert out.returncode == 0, out.stderr
+    assert "claude-ran" in out.stdout
+    refreshed = json.loads(paths["runtime_file"].read_text())
+    assert refreshed["claude"] == runtime["claude"]
+    assert paths["runtime_file"].stat().st_mtime > 1
+
+
+def test_guard_falls_back_to_nvm_when_claude_is_missing(tmp_path, monkeypatch):
+    _, _, token_file, paths = _setup(tmp_path, monkeypatch)
+    monkeypatch.setattr(
+        launcher, "resolve", lambda: {"node": "", "claude": "", "path": ""}
+    )
+    launcher.write_guard(token_file, **paths)
+    assert 'nvm use node > /dev/null\nexec claude "$@"' in paths["guard"].read_text()
@@ -0,0 +1,68 @@
+import os
+import select
+import sys
+import threading
+import time
+
+from sshclaude import pool
+
+ECHO = [
+    sys.executable,
+    "-c",
+    "print('ready', flush=True); print(input().upper()); input()",
+]
+
+
+def _wait(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+def _read_until(fd, text, timeout=10.0):
+    data = b""
+    deadline = time.monotonic() + timeout
+    while text not in data:
+        assert time.monotonic() < deadline, data
+        if select.select([fd], [], [], 0.1)[0]:
+            data += os.read(fd, 4096)
+    return data
+
+
+def test_attach_hands_out_warm_session_and_refills(tmp_path):
+    sock = tmp_path / "pool.sock"
+    warm = pool.Pool(ECHO, size=1, socket_path=sock, max_sessions=2)
+    thread = threading.Thread(target=warm.serve, kwargs={"interval": 0.02})
+    thread.start()
+    try:
+        _wait(lambda: warm.warm and b"ready" in warm.warm[0].output)
+        pid, fd, output = pool.checkout(sock)
+        assert b"ready" in output
+        os.write(fd, b"hello\n")
+        assert b"HELLO" in _read_until(fd, b"HELLO")
+
+        _wait(lambda: warm.warm and warm.warm[0].pid != pid)
+        # The replacement fills the second slot; the pool is then full.
+        _, second, _ = pool.checkout(sock)
+        try:
+            pool.checkout(sock)
+        except ConnectionRefusedError as e:
+            assert "busy" in str(e)
+        else:
+            raise AssertionError("expected the pool to be full")
+        os.close(fd)
+        os.close(second)
+    finally:
+        warm.stop()
+        thread.join(10)
+    assert not sock.exists()
+
+
+def test_attach_without_pool_exits_tempfail(tmp_path):
+    try:
+        pool.main(["attach", "--socket", str(tmp_path / "missing.sock")])
+    except SystemExit as e:
+        assert e.code == pool.EX_TEMPFAIL
+    else:
+        raise AssertionError("expected SystemExit")
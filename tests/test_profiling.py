@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from typing import Optional
+
+from click.testing import CliRunner
+from fastapi import FastAPI, Header
+from fastapi.testclient import TestClient
+
+from sshclaude import profiling
+
+
+def test_flagged_requests_are_profiled(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    app = FastAPI()
+    profiling.install(app)
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int, x_extra: Optional[str] = Header(None)) -> dict[str, int]:
+        return {"item_id": item_id}
+
+    client = TestClient(app)
+    assert client.get("/items/1").json() == {"item_id": 1}
+    assert not list(tmp_path.glob("*.prof"))
+
+    resp = client.get(
+        "/items/2", headers={"X-Sshclaude-Profile": "secret", "X-Request-ID": "abc-123"}
+    )
+    assert resp.json() == {"item_id": 2}
+    assert resp.headers["X-Profile-Id"] == "abc123"
+    [stored] = tmp_path.glob("*.prof")
+    assert stored.name.endswith("-items_item_id-abc123.prof")
+
+    result = CliRunner().invoke(profiling.main, [str(tmp_path), "--limit", "5"])
+    assert result.exit_code == 0
+    assert "items_item_id" in result.output
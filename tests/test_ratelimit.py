@@ -0,0 +1,46 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from sshclaude import ratelimit
+from sshclaude.ratelimit import AdmissionController, Budget, MemoryBuckets
+
+
+def test_token_bucket_refills_over_time():
+    now = [0.0]
+    buckets = MemoryBuckets(clock=lambda: now[0])
+    budget = Budget(rate=1, burst=2)
+
+    assert buckets.take("ip:1", budget) == 0
+    assert buckets.take("ip:1", budget) == 0
+    assert buckets.take("ip:1", budget) == pytest.approx(1.0)
+    assert buckets.take("ip:2", budget) == 0
+
+    now[0] = 1.0
+    assert buckets.take("ip:1", budget) == 0
+
+
+def test_admission_sheds_load_when_latency_is_high():
+    controller = AdmissionController(limit=4, latency_target=1.0)
+    controller.latency = 4.0
+    assert controller.effective_limit() == 1
+
+    with controller.admit():
+        with pytest.raises(HTTPException) as exc:
+            with controller.admit():
+                pass
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "4"
+
+
+def test_client_ip_ignores_spoofed_forwarded_entries(monkeypatch):
+    request = Request(
+        {
+            "type": "http",
+            "client": ("10.0.0.1", 1234),
+            "headers": [(b"x-forwarded-for", b"6.6.6.6, 203.0.113.7")],
+        }
+    )
+    assert ratelimit.client_ip(request) == "10.0.0.1"
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_FORWARDED_HOPS", 1)
+    assert ratelimit.client_ip(request) == "203.0.113.7"
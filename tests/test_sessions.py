@@ -0,0 +1,101 @@
+import asyncio
+import queue
+import time
+
+import pytest
+
+from sshclaude.sessions import MemorySessionStore, RedisSessionStore, SessionStore
+
+
+class FakeRedis:
+    """Minimal stand-in for the redis client used by RedisSessionStore."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, xx=False, keepttl=False):
+        if xx and key not in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+def test_memory_store_expires_records():
+    now = [0.0]
+    store = MemorySessionStore(ttl=10, clock=lambda: now[0])
+    store.put("uid", {"token": "t", "verified": False})
+
+    assert store.update("uid", verified=True) == {"token": "t", "verified": True}
+    now[0] = 11
+    assert store.get("uid") is None
+    assert store.update("uid", verified=True) is None
+
+
+def test_redis_store_round_trip():
+    store = RedisSessionStore(FakeRedis())
+    store.put("uid", {"token": "t", "verified": False})
+
+    assert store.update("uid", verified=True, email="a@b.c")["email"] == "a@b.c"
+    assert store.get("uid") == {"token": "t", "verified": True, "email": "a@b.c"}
+    store.delete("uid")
+    assert store.update("uid", verified=True) is None
+
+
+class FakePubSub:
+    def __init__(self, client):
+        self.client = client
+        self.queue = queue.Queue()
+
+    def subscribe(self, channel):
+        self.channel = channel
+
+    def listen(self):
+        time.sleep(0.05)  # Redis handles SUBSCRIBE a little later
+        self.client.subscribers.append(self.queue)
+        yield {"type": "subscribe", "channel": self.channel, "data": 1}
+        while True:
+            yield self.queue.get()
+
+
+class FakePubSubRedis(FakeRedis):
+    def __init__(self):
+        super().__init__()
+        self.subscribers = []
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    def publish(self, channel, data):
+        for subscriber in self.subscribers:
+            subscriber.put({"type": "message", "data": data.encode()})
+
+
+def test_session_store_backends_must_implement_interface():
+    class Incomplete(SessionStore):
+        def get(self, uid):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_redis_listen_waits_for_subscription():
+    store = RedisSessionStore(FakePubSubRedis())
+
+    async def wait_for_publish():
+        waiter = store.notifier.register("uid")
+        try:
+            await asyncio.to_thread(store.listen)
+            # Published right after the waiter's read: must not be lost.
+            store.publish("uid")
+            await asyncio.wait_for(waiter, 1)
+        finally:
+            store.notifier.discard("uid", waiter)
+
+    asyncio.run(wait_for_publish())
@@ -0,0 +1,54 @@
+import sys
+import threading
+import time
+
+from sshclaude import supervisor
+from sshclaude.supervisor import Child, Supervisor
+
+
+def test_crashing_child_restarts_with_backoff():
+    now = [0.0]
+    sup = Supervisor(
+        [Child("crash", lambda: [sys.executable, "-c", "raise SystemExit(3)"])],
+        backoff=1,
+        max_backoff=4,
+        clock=lambda: now[0],
+    )
+    delays = []
+    for _ in range(4):
+        sup.tick()  # start
+        sup.children["crash"].proc.wait()
+        sup.tick()  # notice the exit
+        delays.append(sup.children["crash"].next_start - now[0])
+        now[0] = sup.children["crash"].next_start
+    assert delays == [1, 2, 4, 4]
+    assert sup.status()["children"]["crash"]["last_exit"] == 3
+
+
+def test_control_socket_reports_status_and_stops(tmp_path):
+    sleeper = Child(
+        "sleeper", lambda: [sys.executable, "-c", "import time; time.sleep(60)"]
+    )
+    sock = tmp_path / "s.sock"
+    sup = Supervisor(
+        [sleeper], socket_path=sock, pid_file=tmp_path / "s.pid", log_dir=tmp_path
+    )
+    thread = threading.Thread(target=sup.serve, kwargs={"interval": 0.01})
+    thread.start()
+    try:
+        for _ in range(200):
+            if supervisor.child_running("sleeper", sock):
+                break
+            time.sleep(0.01)
+        status = supervisor.request("status", sock)
+        assert status["children"]["sleeper"]["running"]
+        pid = status["children"]["sleeper"]["pid"]
+        assert supervisor.request("restart sleeper", sock) == {"ok": True}
+        assert supervisor.request("status", sock)["children"]["sleeper"]["pid"] != pid
+        assert supervisor.running_pid(tmp_path / "s.pid") is not None
+    finally:
+        supervisor.request("stop", sock)
+        thread.join(10)
+    assert not thread.is_alive()
+    assert supervisor.request("status", sock) is None
+    assert not (tmp_path / "s.pid").exists()
@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from sshclaude.taskgraph import Task, TaskGraphError, run_graph
+
+
+def test_independent_tasks_overlap_and_dependents_get_results():
+    # Both roots must run at the same time for the barrier to open.
+    barrier = threading.Barrier(2, timeout=5)
+
+    def root(value):
+        def run(_):
+            barrier.wait()
+            return value
+
+        return run
+
+    events = []
+    results = run_graph(
+        [
+            Task("sum", lambda r: r["a"] + r["b"], deps=("a", "b")),
+            Task("a", root(1)),
+            Task("b", root(2)),
+        ],
+        on_change=lambda task, state, error: events.append((task.name, state)),
+    )
+    assert results == {"a": 1, "b": 2, "sum": 3}
+    assert events.index(("sum", "running")) > events.index(("a", "done"))
+
+
+def test_failure_skips_dependents_but_finishes_other_branches():
+    def fail(_):
+        raise RuntimeError("boom")
+
+    ran = []
+    with pytest.raises(TaskGraphError) as info:
+        run_graph(
+            [
+                Task("last", lambda r: ran.append("last"), deps=("middle",)),
+                Task("middle", lambda r: ran.append("middle"), deps=("broken",)),
+                Task("broken", fail),
+                Task("other", lambda r: ran.append("other")),
+            ]
+        )
+    assert list(info.value.errors) == ["broken"]
+    assert sorted(info.value.skipped) == ["last", "middle"]
+    assert ran == ["other"]
+
+
+def test_unknown_dependency_is_rejected():
+    with pytest.raises(ValueError):
+        run_graph([Task("a", lambda r: None, deps=("nope",))])
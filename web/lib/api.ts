@@ -1,14 +1,40 @@
+interface CachedResponse {
+  etag: string | null;
+  lastModified: string | null;
+  body: unknown;
+}
+
+// Last successful GET body per path, replayed when the API answers 304.
+const cache = new Map<string, CachedResponse>();
+
 export async function apiFetch(path: string, options: RequestInit = {}) {
   const base = process.env.NEXT_PUBLIC_API_BASE ?? "";
   const token = process.env.NEXT_PUBLIC_API_TOKEN;
+  const method = (options.method ?? 'GET').toUpperCase();
+  const cached = method === 'GET' ? cache.get(path) : undefined;
   const headers = {
     ...(options.headers || {}),
     ...(token ? { Authorization: `Bearer ${token}` } : {}),
+    ...(cached?.etag ? { 'If-None-Match': cached.etag } : {}),
+    ...(cached?.lastModified ? { 'If-Modified-Since': cached.lastModified } : {}),
     'Content-Type': 'application/json'
   };
   const res = await fetch(`${base}${path}`, { ...options, headers });
+  if (res.status === 304 && cached) {
+    return cached.body;
+  }
   if (!res.ok) {
     throw new Error(`Request failed: ${res.status}`);
   }
-  return res.json();
+  const body = await res.json();
+  if (method === 'GET') {
+    const etag = res.headers.get('ETag');
+    const lastModified = res.headers.get('Last-Modified');
+    if (etag || lastModified) {
+      cache.set(path, { etag, lastModified, body });
+    }
+  } else {
+    cache.delete(path);
+  }
+  return body;
 }
@@ -5,6 +5,8 @@ interface Login {
   user: string;
   ip: string;
   timestamp: string;
+  country?: string | null;
+  asn?: string | null;
 }
 
 export default function LoginHistory() {
@@ -24,7 +26,8 @@ export default function LoginHistory() {
       <ul>
         {history.map((item, i) => (
           <li key={i}>
-            {item.user} from {item.ip} at {item.timestamp}
+            {item.user} from {item.ip}
+            {item.country && ` (${item.country}${item.asn ? `, ${item.asn}` : ''})`} at {item.timestamp}
           </li>
         ))}
       </ul>